@@ -221,7 +221,7 @@ def test_009_filesystem_setperm_nonrecursive(request):
     assert data['acl'] is False
     assert f'{mode:03o}' == '777'
 
-    payload = {'path': CLUSTER_PATH}
+    payload = {'path': CLUSTER_PATH, 'query-options': {'extra': {'acl': True}}}
     url = f'http://{CLUSTER_IPS[1]}/api/v2.0/filesystem/listdir/'
     res = make_request('post', url, data=payload)
     assert res.status_code == 200, res.text
@@ -250,7 +250,7 @@ def test_010_filesystem_setperm_recursive(request):
     else:
         assert status['state'] == 'SUCCESS', status
 
-    payload = {'path': CLUSTER_PATH}
+    payload = {'path': CLUSTER_PATH, 'query-options': {'extra': {'acl': True}}}
     url = f'http://{CLUSTER_IPS[1]}/api/v2.0/filesystem/listdir/'
     res = make_request('post', url, data=payload)
     assert res.status_code == 200, res.text
@@ -315,7 +315,7 @@ def test_012_filesystem_setacl_nonrecursive(request):
     data = res.json()
     assert data['acl'] is True
 
-    payload = {'path': CLUSTER_PATH}
+    payload = {'path': CLUSTER_PATH, 'query-options': {'extra': {'acl': True}}}
     url = f'http://{CLUSTER_IPS[1]}/api/v2.0/filesystem/listdir/'
     res = make_request('post', url, data=payload)
     assert res.status_code == 200, res.text
@@ -372,7 +372,7 @@ def test_013_filesystem_setacl_recursive(request):
     data = res.json()
     assert data['acl'] is True
 
-    payload = {'path': CLUSTER_PATH}
+    payload = {'path': CLUSTER_PATH, 'query-options': {'extra': {'acl': True}}}
     url = f'http://{CLUSTER_IPS[0]}/api/v2.0/filesystem/listdir/'
     res = make_request('post', url, data=payload)
     assert res.status_code == 200, res.text
@@ -0,0 +1,66 @@
+import traceback
+
+import collectd
+
+from middlewared.client import Client
+
+# Only export latencies of this many most called methods to keep the number of RRD files low
+TOP_METHODS = 20
+
+collectd.info('Loading "middlewared_metrics" python plugin')
+
+
+class MiddlewaredMetrics(object):
+    def config(self, config):
+        pass
+
+    def init(self):
+        pass
+
+    def read(self):
+        try:
+            with Client() as c:
+                metrics = c.call('core.metrics')
+
+            methods = sorted(metrics['methods'].items(), key=lambda item: item[1]['count'], reverse=True)
+            for method, data in methods[:TOP_METHODS]:
+                self.dispatch_histogram(f'method-{method}', data)
+                self.dispatch('derive', f'method-{method}', 'errors', data['errors'])
+
+            for executor, data in metrics['executors'].items():
+                self.dispatch_histogram(f'executor-{executor}', data)
+
+            self.dispatch_histogram('loop_lag', metrics['loop_lag'])
+
+            for key in ('workers', 'idle', 'queued'):
+                self.dispatch('gauge', 'process_pool', key, metrics['process_pool'][key])
+
+            for key in ('workers', 'idle', 'queued', 'priority_queued'):
+                self.dispatch('gauge', 'io_thread_pool', key, metrics['io_thread_pool'][key])
+            for key in ('spawned', 'reaped', 'saturated', 'overflow', 'temporary'):
+                self.dispatch('derive', 'io_thread_pool', key, metrics['io_thread_pool'][key])
+        except Exception:
+            collectd.error(traceback.format_exc())
+
+    def dispatch_histogram(self, plugin_instance, data):
+        self.dispatch('derive', plugin_instance, 'count', data['count'])
+        for key in ('p50', 'p99', 'max'):
+            if data[key] is not None:
+                self.dispatch('gauge', plugin_instance, key, data[key])
+
+    def dispatch(self, type, plugin_instance, type_instance, value):
+        val = collectd.Values()
+        val.plugin = 'middlewared'
+        val.plugin_instance = plugin_instance
+        val.type = type
+        val.type_instance = type_instance
+        val.values = [value]
+        val.meta = {'0': True}
+        val.dispatch()
+
+
+middlewared_metrics = MiddlewaredMetrics()
+
+collectd.register_config(middlewared_metrics.config)
+collectd.register_init(middlewared_metrics.init)
+collectd.register_read(middlewared_metrics.read)
@@ -303,6 +303,8 @@ class Client(object):
         self._pings = {}
         self._py_exceptions = py_exceptions
         self._event_callbacks = {}
+        # ws4py does not serialize concurrent writes to the same socket
+        self._send_lock = Lock()
         if uri is None:
             uri = 'ws+unix:///var/run/middlewared.sock'
         self._closed = Event()
@@ -328,7 +330,9 @@ class Client(object):
             raise
 
     def _send(self, data):
-        self._ws.send(json.dumps(data))
+        data = json.dumps(data)
+        with self._send_lock:
+            self._ws.send(data)
 
     def _recv(self, message):
         _id = message.get('id')
@@ -180,6 +180,7 @@ LoadPlugin zfs_arc_v2
 	Import "cputemp"
 	Import "disktemp"
 	Import "nfsstat"
+	Import "middlewared_metrics"
 
 	<Module "cputemp">
 	</Module>
@@ -187,6 +188,8 @@ LoadPlugin zfs_arc_v2
 	</Module>
 	<Module "nfsstat">
 	</Module>
+	<Module "middlewared_metrics">
+	</Module>
 </Plugin>
 
 <Plugin "write_graphite">
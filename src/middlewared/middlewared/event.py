@@ -1,4 +1,5 @@
 import asyncio
+from collections import defaultdict
 import contextlib
 import json
 import threading
@@ -39,6 +40,59 @@ class Events(object):
             }
 
 
+def event_message(name, event_type, **kwargs):
+    """
+    Builds a websocket message for event `name`.
+    """
+    event = {
+        'msg': event_type.lower(),
+        'collection': name,
+    }
+    if 'id' in kwargs:
+        event['id'] = kwargs.pop('id')
+    if event_type in ('ADDED', 'CHANGED'):
+        if 'fields' in kwargs:
+            event['fields'] = kwargs.pop('fields')
+    if event_type == 'CHANGED':
+        if 'cleared' in kwargs:
+            event['cleared'] = kwargs.pop('cleared')
+    if kwargs:
+        event['extra'] = kwargs
+    return event
+
+
+class EventSubscriptions(object):
+    """
+    Index of websocket clients subscribed to each event name (or to `*`).
+    """
+
+    def __init__(self):
+        self.__subscriptions = defaultdict(dict)
+
+    def add(self, name, app):
+        self.__subscriptions[name][app.session_id] = app
+
+    def remove(self, name, app):
+        apps = self.__subscriptions.get(name)
+        if apps is not None:
+            apps.pop(app.session_id, None)
+            if not apps:
+                self.__subscriptions.pop(name, None)
+
+    def remove_app(self, app):
+        for name in list(self.__subscriptions.keys()):
+            self.remove(name, app)
+
+    def has_subscribers(self, name):
+        return name in self.__subscriptions or '*' in self.__subscriptions
+
+    def subscribers(self, name):
+        # Events can be sent from other threads so we work on copies
+        apps = dict(self.__subscriptions.get(name, {}))
+        apps.update(self.__subscriptions.get('*', {}))
+        return list(apps.values())
+
+
 class EventSourceMetabase(type):
 
     def __new__(cls, name, bases, attrs):
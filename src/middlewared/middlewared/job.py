@@ -1,8 +1,8 @@
 import asyncio
 import contextlib
-from collections import OrderedDict
+from collections import deque, OrderedDict
 import copy
-from datetime import datetime
+from datetime import datetime, timedelta
 import enum
 import logging
 import os
@@ -12,12 +12,19 @@ import time
 import traceback
 import threading
 
+from middlewared.client import ejson as json
 from middlewared.service_exception import CallError, ValidationError, ValidationErrors, adapt_exception
 from middlewared.pipe import Pipes
+from middlewared.utils import filter_list
 
 logger = logging.getLogger(__name__)
 
 LOGS_DIR = '/var/log/jobs'
+RESULTS_DIR = os.path.join(LOGS_DIR, 'results')
+# In-process callers that wait for a job read its result right away so a stored result is kept in memory for a while
+RESULT_RELEASE_DELAY = 60
+# `set_progress` sends at most this many `core.get_jobs` events per second for each job
+PROGRESS_EVENTS_PER_SECOND = 4
 
 
 class State(enum.Enum):
@@ -39,26 +46,19 @@ class JobSharedLock(object):
     def __init__(self, queue, name):
         self.queue = queue
         self.name = name
-        self.jobs = []
-        self.semaphore = asyncio.Semaphore()
+        # Jobs that were not started yet (in FIFO order) with the time they were queued at
+        self.jobs = deque()
+        # Job that holds the lock
+        self.job = None
 
     def add_job(self, job):
-        self.jobs.append(job)
+        self.jobs.append((job, time.monotonic()))
 
     def get_jobs(self):
-        return self.jobs
-
-    def remove_job(self, job):
-        self.jobs.remove(job)
+        return [job for job, queued_at in self.jobs]
 
     def locked(self):
-        return self.semaphore.locked()
-
-    async def acquire(self):
-        return await self.semaphore.acquire()
-
-    def release(self):
-        return self.semaphore.release()
+        return self.job is not None
 
 
 class JobsQueue(object):
@@ -66,7 +66,8 @@ class JobsQueue(object):
     def __init__(self, middleware):
         self.middleware = middleware
         self.deque = JobsDeque()
-        self.queue = []
+        # Jobs that are ready to run (they either have no lock or hold their lock)
+        self.ready = deque()
 
         # Event responsible for the job queue schedule loop.
         # This event is set and a new job is potentially ready to run
@@ -74,6 +75,8 @@ class JobsQueue(object):
 
         # Shared lock (JobSharedLock) dict
         self.job_locks = {}
+        # Shared lock statistics by lock name
+        self.job_locks_stats = OrderedDict()
 
         self.middleware.event_register('core.get_jobs', 'Updates on job changes.')
 
@@ -87,31 +90,50 @@ class JobsQueue(object):
         return self.deque.all()
 
     def add(self, job):
-        if job.options["lock_queue_size"] is not None:
-            lock = self.get_lock(job)
-            queued_jobs = [another_job for another_job in self.queue if self.get_lock(another_job) is lock]
-            if len(queued_jobs) >= job.options["lock_queue_size"]:
-                return queued_jobs[-1]
+        lock = self.get_lock(job)
+        if lock is not None and job.options["lock_queue_size"] is not None:
+            if len(lock.jobs) >= job.options["lock_queue_size"]:
+                return lock.jobs[-1][0]
 
         self.deque.add(job)
-        self.queue.append(job)
+        if lock is None:
+            self._ready(job)
+        else:
+            lock.add_job(job)
+            self._schedule(lock)
 
         if not job.options["transient"]:
             self.middleware.send_event('core.get_jobs', 'ADDED', id=job.id, fields=job.__encode__())
 
-        # A job has been added to the queue, let the queue scheduler run
-        self.queue_event.set()
-
         return job
 
     def remove(self, job_id):
         self.deque.remove(job_id)
 
+    def query(self, filters, options):
+        return self.deque.query(filters, options)
+
+    async def compact(self, job):
+        try:
+            await self.middleware.run_in_thread(job.compact, self.deque.spill_size)
+        except Exception:
+            logger.warning('Failed to compact job %r', job.id, exc_info=True)
+            return
+
+        self.deque.compacted(job)
+        if job.result_path is not None:
+            self.middleware.loop.call_later(RESULT_RELEASE_DELAY, job.release_result)
+
     def get_lock(self, job):
         """
         Get a shared lock for a job
         """
-        name = job.get_lock_name()
+        try:
+            name = job.get_lock_name()
+        except Exception:
+            logger.error('Failed to get lock for %r', job, exc_info=True)
+            return None
+
         if name is None:
             return None
 
@@ -119,54 +141,77 @@ class JobsQueue(object):
         if lock is None:
             lock = JobSharedLock(self, name)
             self.job_locks[lock.name] = lock
-        lock.add_job(job)
         return lock
 
     def release_lock(self, job):
         lock = job.get_lock()
         if not lock:
             return
-        # Remove job from lock list and release it so another job can use it
-        lock.remove_job(job)
-        lock.release()
-
-        if len(lock.get_jobs()) == 0:
-            self.job_locks.pop(lock.name)
 
+        lock.job = None
         # Once a lock is released there could be another job in the queue
         # waiting for the same lock
+        self._schedule(lock)
+
+        if lock.job is None:
+            self.job_locks.pop(lock.name)
+
+    def lock_stats(self):
+        """
+        Returns queue depth and wait time statistics for each shared lock name. Must be called from the event loop
+        thread because the statistics are updated there.
+        """
+        result = []
+        for name, stats in self.job_locks_stats.items():
+            lock = self.job_locks.get(name)
+            result.append({
+                'name': name,
+                'running': lock is not None and lock.locked(),
+                'queued': len(lock.jobs) if lock is not None else 0,
+                'started': stats['started'],
+                'wait_time_avg': stats['wait_time'] / stats['started'] if stats['started'] else 0,
+                'wait_time_max': stats['wait_time_max'],
+            })
+        return result
+
+    def _schedule(self, lock):
+        """
+        Makes the first job waiting for a free `lock` hold it and run.
+        """
+        if lock.job is None and lock.jobs:
+            job, queued_at = lock.jobs.popleft()
+            lock.job = job
+            job.set_lock(lock)
+            self._lock_started(lock.name, time.monotonic() - queued_at)
+            self._ready(job)
+
+    def _lock_started(self, name, wait_time):
+        stats = self.job_locks_stats.pop(name, None)
+        if stats is None:
+            stats = {'started': 0, 'wait_time': 0.0, 'wait_time_max': 0.0}
+            while len(self.job_locks_stats) >= self.deque.maxlen:
+                self.job_locks_stats.popitem(last=False)
+
+        stats['started'] += 1
+        stats['wait_time'] += wait_time
+        stats['wait_time_max'] = max(stats['wait_time_max'], wait_time)
+        self.job_locks_stats[name] = stats
+
+    def _ready(self, job):
+        self.ready.append(job)
+        # A job is ready, let the queue scheduler run
         self.queue_event.set()
 
     async def next(self):
         """
         Returns when there is a new job ready to run.
         """
-        while True:
+        while not self.ready:
+            self.queue_event.clear()
             # Awaits a new event to look for a job
             await self.queue_event.wait()
-            found = None
-            for job in self.queue:
-                try:
-                    lock = self.get_lock(job)
-                except Exception:
-                    logger.error('Failed to get lock for %r', job, exc_info=True)
-                    lock = None
-                # Get job in the queue if it has no lock or its not locked
-                if lock is None or not lock.locked():
-                    found = job
-                    if lock:
-                        await job.set_lock(lock)
-                    break
-            if found:
-                # Unlocked job found to run
-                self.queue.remove(found)
-                # If there are no more jobs in the queue, clear the event
-                if len(self.queue) == 0:
-                    self.queue_event.clear()
-                return found
-            else:
-                # No jobs available to run, clear the event
-                self.queue_event.clear()
+
+        return self.ready.popleft()
 
     async def run(self):
         while True:
@@ -178,11 +223,20 @@ class JobsDeque(object):
     """
     A jobs deque to do not keep more than `maxlen` in memory
     with a `id` assigner.
+
+    Finished jobs are compacted and their results that are larger than `spill_size` bytes are stored in `RESULTS_DIR`.
+    Finished jobs are removed when there are more than `maxlen` jobs, when they finished more than `max_age` seconds
+    ago or when their stored results take more than `max_spilled_size` bytes.
     """
 
-    def __init__(self, maxlen=1000):
+    def __init__(self, maxlen=1000, max_age=86400, spill_size=65536, max_spilled_size=256 * 1024 * 1024):
         self.maxlen = maxlen
+        self.max_age = max_age
+        self.spill_size = spill_size
+        self.max_spilled_size = max_spilled_size
         self.count = 0
+        self.spilled_size = 0
+        self.age_checked_at = 0
         self.__dict = OrderedDict()
         with contextlib.suppress(FileNotFoundError):
             shutil.rmtree(LOGS_DIR)
@@ -207,11 +261,100 @@ class JobsDeque(object):
             else:
                 logger.warning("There are %d jobs waiting or running", len(self.__dict))
         self.__dict[job.id] = job
+        self.evict()
 
     def remove(self, job_id):
         if job_id in self.__dict:
-            self.__dict[job_id].cleanup()
-            del self.__dict[job_id]
+            job = self.__dict.pop(job_id)
+            self.spilled_size -= job.result_spilled_size
+            job.cleanup()
+
+    def compacted(self, job):
+        """
+        Must be called after `job.compact` to account for its stored result.
+        """
+        if job.id not in self.__dict:
+            # Job was removed while it was being compacted
+            job.cleanup()
+            return
+
+        self.spilled_size += job.result_spilled_size
+        self.evict()
+
+    def evict(self):
+        """
+        Removes finished jobs that exceed the retention limits (oldest first).
+        """
+        check_age = time.monotonic() - self.age_checked_at > 60
+        if not check_age and len(self.__dict) <= self.maxlen and self.spilled_size <= self.max_spilled_size:
+            return
+
+        if check_age:
+            self.age_checked_at = time.monotonic()
+        finished_before = datetime.utcnow() - timedelta(seconds=self.max_age)
+        for job_id, job in list(self.__dict.items()):
+            if job.state not in (State.SUCCESS, State.FAILED, State.ABORTED):
+                continue
+
+            if (
+                len(self.__dict) > self.maxlen or
+                (self.spilled_size > self.max_spilled_size and job.result_spilled_size) or
+                (check_age and job.time_finished < finished_before)
+            ):
+                self.remove(job_id)
+            elif not check_age and len(self.__dict) <= self.maxlen and self.spilled_size <= self.max_spilled_size:
+                break
+
+    def query(self, filters, options):
+        """
+        `core.get_jobs` implementation. Jobs are narrowed down by `id` and `state` filters before being encoded and
+        stored results are only loaded for returned jobs.
+        """
+        jobs = list(self.__dict.values())
+        for f in filters:
+            if len(f) != 3:
+                continue
+
+            name, op, value = f
+            if name == 'id' and op == '=':
+                jobs = [job for job in [self.__dict.get(value)] if job is not None]
+            elif name == 'id' and op == 'in':
+                jobs = sorted(
+                    [job for job in map(self.__dict.get, set(value)) if job is not None], key=lambda job: job.id,
+                )
+            elif name == 'state' and op == '=':
+                jobs = [job for job in jobs if job.state.name == value]
+
+        load_results = 'result' in filters_fields(filters, options) or 'result' in (options.get('select') or [])
+        result = filter_list((job.__encode__(load_results) for job in jobs), filters, options)
+        if isinstance(result, int):
+            return result
+
+        single = isinstance(result, dict)
+        result = [result] if single else list(result)
+        if not load_results and not options.get('select'):
+            for encoded in result:
+                job = self.__dict.get(encoded['id'])
+                encoded['result'] = job.load_result() if job is not None else None
+
+        return result[0] if single else result
+
+
+def filters_fields(filters, options):
+    """
+    Returns the set of fields that `filters` and `options` reference.
+    """
+    fields = set()
+    for f in filters:
+        if len(f) == 2:
+            fields |= filters_fields(f[1], {})
+        else:
+            fields.add(f[0].split('.')[0])
+
+    for o in options.get('order_by') or []:
+        fields.add(o.split(':')[-1].lstrip('-').split('.')[0])
+
+    return fields
 
 
 class Job:
@@ -239,7 +382,11 @@ class Job:
 
         self.id = None
         self.lock = None
-        self.result = None
+        self._result = None
+        self.result_path = None
+        self.result_spilled_size = 0
+        # Slim encoded representation of a finished job (without result)
+        self.record = None
         self.error = None
         self.exception = None
         self.exc_info = None
@@ -257,6 +404,11 @@ class Job:
         self.loop = self.middleware.loop
         self.future = None
 
+        self.progress_event_lock = threading.Lock()
+        self.progress_event_sent_at = 0
+        self.progress_event_pending = False
+        self.progress_event_handle = None
+
         self.logs_path = None
         self.logs_fd = None
         self.logs_excerpt = None
@@ -292,12 +444,32 @@ class Job:
     def get_lock(self):
         return self.lock
 
-    async def set_lock(self, lock):
+    def set_lock(self, lock):
         self.lock = lock
-        await self.lock.acquire()
+
+    @property
+    def result(self):
+        """
+        Result of the job. If it was stored in `RESULTS_DIR` and released from memory, it is read back on every access
+        (it is not kept in memory again).
+        """
+        return self.load_result()
+
+    def load_result(self):
+        # `result_path` is set before `release_result` clears `_result` so it is safe to call from another thread
+        result = self._result
+        if result is None and self.result_path is not None:
+            try:
+                with open(self.result_path, 'r') as f:
+                    result = json.loads(f.read())
+            except FileNotFoundError:
+                logger.warning('Stored result of job %r was removed', self.id)
+                return None
+
+        return result
 
     def set_result(self, result):
-        self.result = result
+        self._result = result
 
     def set_exception(self, exc_info):
         self.error = str(exc_info[1])
@@ -330,9 +502,8 @@ class Job:
         Sets job completion progress. All arguments are optional and only passed arguments will be changed in the
         whole job progress state.
 
-        Don't change this too often as every time an event is sent. Use :class:`middlewared.job.JobProgressBuffer` to
-        throttle progress reporting if you are receiving it from an external source (e.g. network response reading
-        progress).
+        Progress changes are sent as `core.get_jobs` events that only contain job state and progress. At most
+        `PROGRESS_EVENTS_PER_SECOND` events are sent for each job, intermediate changes are coalesced.
 
         :param percent: Job progress [0-100]
         :param description: Human-readable description of what the job is currently doing.
@@ -353,15 +524,63 @@ class Job:
                 self.progress['extra'] = extra
                 changed = True
 
-        encoded = self.__encode__()
         if self.on_progress_cb:
             try:
-                self.on_progress_cb(encoded)
+                self.on_progress_cb(self.__encode__())
             except Exception:
                 logger.warning('Failed to run on progress callback', exc_info=True)
 
         if changed:
-            self.middleware.send_event('core.get_jobs', 'CHANGED', id=self.id, fields=encoded)
+            self.__progress_changed()
+
+    def __progress_changed(self):
+        with self.progress_event_lock:
+            if self.progress_event_pending:
+                return
+
+            delay = self.progress_event_sent_at + 1 / PROGRESS_EVENTS_PER_SECOND - time.monotonic()
+            if delay > 0:
+                self.progress_event_pending = True
+                # This can be called from a thread
+                self.loop.call_soon_threadsafe(self.__schedule_progress_event, delay)
+                return
+
+            self.progress_event_sent_at = time.monotonic()
+
+        self.__send_progress_event()
+
+    def __schedule_progress_event(self, delay):
+        with self.progress_event_lock:
+            if self.progress_event_pending:
+                self.progress_event_handle = self.loop.call_later(delay, self.__send_pending_progress_event)
+
+    def __send_pending_progress_event(self):
+        with self.progress_event_lock:
+            self.progress_event_pending = False
+            self.progress_event_handle = None
+            self.progress_event_sent_at = time.monotonic()
+
+        self.__send_progress_event()
+
+    def __cancel_progress_event(self):
+        """
+        Cancels a pending progress event. Returns `True` if there was one.
+        """
+        with self.progress_event_lock:
+            pending = self.progress_event_pending
+            self.progress_event_pending = False
+            if self.progress_event_handle is not None:
+                self.progress_event_handle.cancel()
+                self.progress_event_handle = None
+
+        return pending
+
+    def __send_progress_event(self):
+        self.middleware.send_event('core.get_jobs', 'CHANGED', id=self.id, fields={
+            'id': self.id,
+            'state': self.state.name,
+            'progress': dict(self.progress),
+        })
 
     async def wait(self, timeout=None, raise_error=False):
         if timeout is None:
@@ -439,10 +658,15 @@ class Job:
 
             queue.release_lock(self)
             self._finished.set()
+            # Final state event includes the latest progress
+            progress_event_pending = self.__cancel_progress_event()
             if self.options['transient']:
+                if progress_event_pending:
+                    self.__send_progress_event()
                 queue.remove(self.id)
             else:
                 self.middleware.send_event('core.get_jobs', 'CHANGED', id=self.id, fields=self.__encode__())
+                await queue.compact(self)
 
     async def __run_body(self):
         """
@@ -500,7 +724,13 @@ class Job:
 
         await self.middleware.run_in_thread(close_pipes)
 
-    def __encode__(self):
+    def __encode__(self, result=True):
+        if self.record is not None:
+            encoded = dict(self.record)
+            if result:
+                encoded['result'] = self.load_result()
+            return encoded
+
         exc_info = None
         if self.exc_info:
             etype = self.exc_info[0]
@@ -531,7 +761,7 @@ class Job:
             'logs_path': self.logs_path,
             'logs_excerpt': self.logs_excerpt,
             'progress': self.progress,
-            'result': self.result,
+            **({'result': self.load_result()} if result else {}),
             'error': self.error,
             'exception': self.exception,
             'exc_info': exc_info,
@@ -557,12 +787,61 @@ class Job:
             raise CallError(subjob.exception)
         return subjob.result
 
+    def compact(self, spill_size):
+        """
+        Releases memory held by a finished job: its encoded representation is built once, exception traceback frames
+        are dropped and a result that is larger than `spill_size` bytes is stored in `RESULTS_DIR` (it is only
+        released from memory by `release_result`).
+        """
+        record = self.__encode__(False)
+        record['progress'] = dict(record['progress'])
+        self.record = record
+
+        if self.exc_info:
+            exc, seen = self.exc_info[1], set()
+            while exc is not None and id(exc) not in seen:
+                seen.add(id(exc))
+                exc.__traceback__ = None
+                exc = exc.__cause__ or exc.__context__
+            self.exc_info = (self.exc_info[0], self.exc_info[1], None)
+
+        if self._result is None or isinstance(self._result, (bool, int, float)):
+            return
+
+        try:
+            serialized = json.dumps(self._result)
+        except Exception:
+            return
+
+        if len(serialized) <= spill_size:
+            return
+
+        # A result read back must be equal to the original one (i.e. it has no tuples or non-string dictionary keys)
+        if json.loads(serialized) != self._result:
+            return
+
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f'{self.id}.json')
+        with open(path, 'w') as f:
+            f.write(serialized)
+
+        self.result_path = path
+        self.result_spilled_size = len(serialized)
+
+    def release_result(self):
+        """
+        Drops the in-memory result if it was stored in `RESULTS_DIR`.
+        """
+        if self.result_path is not None:
+            self._result = None
+
     def cleanup(self):
-        if self.logs_path:
-            try:
-                os.unlink(self.logs_path)
-            except Exception:
-                pass
+        for path in (self.logs_path, self.result_path):
+            if path:
+                try:
+                    os.unlink(path)
+                except Exception:
+                    pass
 
     def stop_logging(self):
         fd = self.logs_fd
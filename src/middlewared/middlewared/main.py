@@ -1,30 +1,34 @@
 from .apidocs import app as apidocs_app
 from .client import ejson as json
 from .common.event_source.manager import EventSourceManager
-from .event import Events
+from .event import event_message, Events, EventSubscriptions
 from .job import Job, JobsQueue
 from .pipe import Pipes, Pipe
 from .restful import RESTfulAPI
 from .settings import conf
-from .schema import clean_and_validate_arg, Error as SchemaError
+from .schema import clean_and_validate_arg, Error as SchemaError, trusted_internal_method
 import middlewared.service
 from .service_exception import adapt_exception, CallError, CallException, ValidationError, ValidationErrors
-from .utils import osc, sw_version
+from .utils import osc, start_daemon_thread, sw_version
 from .utils.debug import get_frame_details, get_threads_stacks
-from .utils.lock import SoftHardSemaphore, SoftHardSemaphoreLimit
+from .utils.call_scheduler import CallScheduler, LoopLag, method_priority
+from .utils.lock import SoftHardSemaphoreLimit
+from .utils.metrics import Metrics
 from .utils.io_thread_pool_executor import IoThreadPoolExecutor
 from .utils.plugins import LoadPluginsMixin
-from .utils.profile import profile_wrap
+from .utils.process_pool import ProcessPool
+from .utils.profile import profile_wrap, SamplingProfiler, worker_profiled_call
 from .utils.run_in_thread import RunInThreadMixin
 from .utils.service.call import ServiceCallMixin
+from .utils.websocket_messages import WebsocketMessagesRing
 from .webui_auth import WebUIAuth
-from .worker import main_worker, worker_init
+from .worker import main_worker, worker_init, worker_preload
 from .webhooks.cluster_events import ClusterEventsApplication
 from aiohttp import web
 from aiohttp.web_exceptions import HTTPPermanentRedirect
 from aiohttp.web_middlewares import normalize_path_middleware
 from aiohttp_wsgi import WSGIHandler
-from collections import defaultdict, deque
+from collections import defaultdict
 
 import argparse
 import asyncio
@@ -34,7 +38,6 @@ import concurrent.futures
 import concurrent.futures.process
 import concurrent.futures.thread
 import contextlib
-import copy
 from dataclasses import dataclass
 import errno
 import fcntl
@@ -72,6 +75,9 @@ class LoopMonitorIgnoreFrame:
     cut_below: bool = False
 
 
+BATCH_MAX_CALLS = 100
+
+
 class Application(object):
 
     def __init__(self, middleware, loop, request, response):
@@ -87,8 +93,8 @@ class Application(object):
         self.rest = False
         self.websocket = True
 
-        # Allow at most 10 concurrent calls and only queue up until 20
-        self._softhardsemaphore = SoftHardSemaphore(10, 20)
+        # Allow at most 10 concurrent calls (less if the event loop lags) and only queue up until 20
+        self.call_scheduler = CallScheduler(10, 20, middleware.loop_lag)
         self._py_exceptions = False
 
         """
@@ -106,12 +112,15 @@ class Application(object):
         self.__callbacks[name].append(method)
 
     def _send(self, data):
-        self.middleware.socket_messages_queue.append({
-            'type': 'outgoing',
-            'session_id': self.session_id,
-            'message': data,
-        })
-        asyncio.run_coroutine_threadsafe(self.response.send_str(json.dumps(data)), loop=self.loop)
+        self._send_serialized(data, json.dumps(data))
+
+    def _send_serialized(self, data, serialized):
+        """
+        Send `data` that was already serialized (i.e. the same event sent to many clients is only serialized once).
+        """
+        if self.middleware.websocket_messages.enabled:
+            self.middleware.websocket_messages.append('outgoing', self.session_id, serialized)
+        asyncio.run_coroutine_threadsafe(self.response.send_str(serialized), loop=self.loop)
 
     def _tb_error(self, exc_info):
         klass, exc, trace = exc_info
@@ -145,59 +154,155 @@ class Application(object):
             'extra': extra,
         }, **error_extra)
 
-    def send_error(self, message, errno, reason=None, exc_info=None, etype=None, extra=None):
-        self._send({
+    def get_error_message(self, message, errno, reason=None, exc_info=None, etype=None, extra=None):
+        return {
             'msg': 'result',
             'id': message['id'],
             'error': self.get_error_dict(errno, reason, exc_info, etype, extra),
-        })
+        }
+
+    def send_error(self, message, errno, reason=None, exc_info=None, etype=None, extra=None):
+        self._send(self.get_error_message(message, errno, reason, exc_info, etype, extra))
+
+    def lookup_method(self, message):
+        """
+        Finds the method `message` calls and checks that the client is allowed to call it.
+
+        Returns `(serviceobj, methodobj, None)` or `(None, None, error_message)`.
+        """
+        if 'method' not in message:
+            return None, None, self.get_error_message(message, errno.EINVAL,
+                                                      "Message is malformed: 'method' is absent.")
+
+        try:
+            serviceobj, methodobj = self.middleware._method_lookup(message['method'])
+        except CallError as e:
+            return None, None, self.get_error_message(message, e.errno, str(e), sys.exc_info(), extra=e.extra)
+
+        if not hasattr(methodobj, '_no_auth_required'):
+            if not self.authenticated:
+                return None, None, self.get_error_message(message, errno.EACCES, 'Not authenticated')
+
+            if not self.authenticated_credentials.authorize('CALL', message['method']):
+                return None, None, self.get_error_message(message, errno.EACCES, 'Not authorized')
+
+        return serviceobj, methodobj, None
 
     async def call_method(self, message, serviceobj, methodobj):
+        try:
+            async with self.call_scheduler.slot(method_priority(methodobj), message['method']):
+                response = await self._call_method(message, serviceobj, methodobj)
+        except SoftHardSemaphoreLimit as e:
+            response = self.get_error_message(
+                message,
+                errno.ETOOMANYREFS,
+                f'Maximum number of concurrent calls ({e.args[0]}) has exceeded.',
+            )
+
+        self._send(response)
+
+    async def call_batch(self, message):
+        """
+        Runs the calls of a `batch` message concurrently while holding a single concurrent calls slot. The batch is
+        scheduled with the lowest priority of its calls.
+
+        Every call is looked up and authorized before anything is run. Results are either sent back in one
+        `batch_result` message (in the order of `calls`) or, if `stream` is set, as separate `result` messages as soon
+        as each call finishes, followed by a `batch_result` message without results.
+        """
+        calls = message.get('calls')
+        if not isinstance(calls, list) or not all(isinstance(call, dict) and 'id' in call for call in calls):
+            self.send_error(message, errno.EINVAL, "Message is malformed: 'calls' must be a list of method calls.")
+            return
+
+        if len(calls) > BATCH_MAX_CALLS:
+            self.send_error(message, errno.E2BIG, f'Maximum number of calls in a batch ({BATCH_MAX_CALLS}) exceeded.')
+            return
+
+        stream = message.get('stream', False)
+        responses = [None] * len(calls)
+        pending = []
+        for i, call in enumerate(calls):
+            serviceobj, methodobj, error = self.lookup_method(call)
+            if error is None:
+                pending.append((i, call, serviceobj, methodobj))
+            else:
+                responses[i] = error
+
+        async def run(i, call, serviceobj, methodobj):
+            responses[i] = await self._call_method(call, serviceobj, methodobj)
+            if stream:
+                self._send(responses[i])
+
+        if stream:
+            for response in responses:
+                if response is not None:
+                    self._send(response)
+
+        if pending:
+            priority = max(method_priority(args[3]) for args in pending)
+            try:
+                async with self.call_scheduler.slot(priority, 'batch'):
+                    await asyncio.gather(*[run(*args) for args in pending])
+            except SoftHardSemaphoreLimit as e:
+                self.send_error(
+                    message,
+                    errno.ETOOMANYREFS,
+                    f'Maximum number of concurrent calls ({e.args[0]}) has exceeded.',
+                )
+                return
+
+        self._send({
+            'id': message['id'],
+            'msg': 'batch_result',
+            'results': None if stream else responses,
+        })
+
+    async def _call_method(self, message, serviceobj, methodobj):
+        """
+        Calls the method and returns the `result` message that should be sent to the client.
+        """
         params = message.get('params') or []
 
         try:
-            async with self._softhardsemaphore:
-                result = await self.middleware._call(message['method'], serviceobj, methodobj, params, app=self,
-                                                     io_thread=False)
+            result = await self.middleware._call(message['method'], serviceobj, methodobj, params, app=self,
+                                                 io_thread=False)
             if isinstance(result, Job):
                 result = result.id
             elif isinstance(result, types.GeneratorType):
                 result = list(result)
             elif isinstance(result, types.AsyncGeneratorType):
                 result = [i async for i in result]
-            self._send({
+            return {
                 'id': message['id'],
                 'msg': 'result',
                 'result': result,
-            })
-        except SoftHardSemaphoreLimit as e:
-            self.send_error(
-                message,
-                errno.ETOOMANYREFS,
-                f'Maximum number of concurrent calls ({e.args[0]}) has exceeded.',
-            )
+            }
         except ValidationError as e:
-            self.send_error(message, e.errno, str(e), sys.exc_info(), etype='VALIDATION', extra=[
+            return self.get_error_message(message, e.errno, str(e), sys.exc_info(), etype='VALIDATION', extra=[
                 (e.attribute, e.errmsg, e.errno),
             ])
         except ValidationErrors as e:
-            self.send_error(message, errno.EAGAIN, str(e), sys.exc_info(), etype='VALIDATION', extra=list(e))
+            return self.get_error_message(message, errno.EAGAIN, str(e), sys.exc_info(), etype='VALIDATION',
+                                          extra=list(e))
         except (CallException, SchemaError) as e:
             # CallException and subclasses are the way to gracefully
             # send errors to the client
-            self.send_error(message, e.errno, str(e), sys.exc_info(), extra=e.extra)
+            return self.get_error_message(message, e.errno, str(e), sys.exc_info(), extra=e.extra)
         except Exception as e:
             adapted = adapt_exception(e)
             if adapted:
-                self.send_error(message, adapted.errno, str(adapted), sys.exc_info(), extra=adapted.extra)
+                return self.get_error_message(message, adapted.errno, str(adapted), sys.exc_info(),
+                                              extra=adapted.extra)
             else:
-                self.send_error(message, errno.EINVAL, str(e), sys.exc_info())
+                error = self.get_error_message(message, errno.EINVAL, str(e), sys.exc_info())
                 if not self._py_exceptions:
                     self.logger.warn('Exception while calling {}(*{})'.format(
                         message['method'],
                         self.middleware.dump_args(message.get('params', []), method_name=message['method'])
                     ), exc_info=True)
                     asyncio.ensure_future(self.__crash_reporting(sys.exc_info()))
+                return error
 
     async def __crash_reporting(self, exc_info):
         if self.middleware.crash_reporting.is_disabled():
@@ -219,6 +324,7 @@ class Application(object):
             await self.middleware.event_source_manager.subscribe(self, self.__esm_ident(ident), shortname, arg)
         else:
             self.__subscribed[ident] = name
+            self.middleware.event_subscriptions.add(name, self)
 
         self._send({
             'msg': 'ready',
@@ -227,37 +333,27 @@ class Application(object):
 
     async def unsubscribe(self, ident):
         if ident in self.__subscribed:
-            self.__subscribed.pop(ident)
+            name = self.__subscribed.pop(ident)
+            if name not in self.__subscribed.values():
+                self.middleware.event_subscriptions.remove(name, self)
         elif self.__esm_ident(ident) in self.middleware.event_source_manager.idents:
             await self.middleware.event_source_manager.unsubscribe(self.__esm_ident(ident))
 
     def __esm_ident(self, ident):
         return self.session_id + ident
 
+    def is_subscribed(self, name):
+        return any(i == name or i == '*' for i in self.__subscribed.values())
+
     def send_event(self, name, event_type, **kwargs):
         if (
-            not any(i == name or i == '*' for i in self.__subscribed.values()) and
+            not self.is_subscribed(name) and
             self.middleware.event_source_manager.short_name_arg(
                 name
             )[0] not in self.middleware.event_source_manager.event_sources
         ):
             return
-        event = {
-            'msg': event_type.lower(),
-            'collection': name,
-        }
-        kwargs = kwargs.copy()
-        if 'id' in kwargs:
-            event['id'] = kwargs.pop('id')
-        if event_type in ('ADDED', 'CHANGED'):
-            if 'fields' in kwargs:
-                event['fields'] = kwargs.pop('fields')
-        if event_type == 'CHANGED':
-            if 'cleared' in kwargs:
-                event['cleared'] = kwargs.pop('cleared')
-        if kwargs:
-            event['extra'] = kwargs
-        self._send(event)
+        self._send(event_message(name, event_type, **kwargs))
 
     def on_open(self):
         self.middleware.register_wsclient(self)
@@ -271,23 +367,16 @@ class Application(object):
                 self.logger.error('Failed to run on_close callback.', exc_info=True)
 
         await self.middleware.event_source_manager.unsubscribe_app(self)
+        self.middleware.event_subscriptions.remove_app(self)
 
         self.middleware.unregister_wsclient(self)
 
-    async def on_message(self, message):
-        if message.get('msg') == 'method' and message.get('method') and isinstance(message.get('params'), list):
-            log_message = copy.deepcopy(message)
-            log_message['params'] = self.middleware.dump_args(
-                log_message.get('params', []), method_name=log_message['method']
+    async def on_message(self, message, serialized=None):
+        if self.middleware.websocket_messages.enabled:
+            self.middleware.websocket_messages.append(
+                'incoming', self.session_id, serialized if serialized is not None else json.dumps(message),
             )
-        else:
-            log_message = message
 
-        self.middleware.socket_messages_queue.append({
-            'type': 'incoming',
-            'session_id': self.session_id,
-            'message': log_message,
-        })
         # Run callbacks registered in plugins for on_message
         for method in self.__callbacks['on_message']:
             try:
@@ -324,28 +413,16 @@ class Application(object):
             return
 
         if message['msg'] == 'method':
-            if 'method' not in message:
-                self.send_error(message, errno.EINVAL,
-                                "Message is malformed: 'method' is absent.")
+            serviceobj, methodobj, error = self.lookup_method(message)
+            if error is not None:
+                self._send(error)
                 return
 
-            try:
-                serviceobj, methodobj = self.middleware._method_lookup(message['method'])
-            except CallError as e:
-                self.send_error(message, e.errno, str(e), sys.exc_info(), extra=e.extra)
-                return
-
-            if not hasattr(methodobj, '_no_auth_required'):
-                if not self.authenticated:
-                    self.send_error(message, errno.EACCES, 'Not authenticated')
-                    return
-
-                if not self.authenticated_credentials.authorize('CALL', message['method']):
-                    self.send_error(message, errno.EACCES, 'Not authorized')
-                    return
-
             asyncio.ensure_future(self.call_method(message, serviceobj, methodobj))
             return
+        elif message['msg'] == 'batch':
+            asyncio.ensure_future(self.call_batch(message))
+            return
         elif message['msg'] == 'ping':
             pong = {'msg': 'pong'}
             if 'id' in message:
@@ -868,6 +945,7 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         self.log_format = log_format
         self.startup_seq = 0
         self.startup_seq_path = startup_seq_path
+        self.startup_timings = {'load': {}, 'setup': {}, 'setup_total': None}
         self.app = None
         self.loop = None
         self.run_in_thread_executor = IoThreadPoolExecutor()
@@ -882,6 +960,7 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         self.__wsclients = {}
         self.__events = Events()
         self.event_source_manager = EventSourceManager(self)
+        self.event_subscriptions = EventSubscriptions()
         self.__event_subs = defaultdict(list)
         self.__hooks = defaultdict(list)
         self.__server_threads = []
@@ -890,30 +969,46 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         self.__terminate_task = None
         self.jobs = JobsQueue(self)
         self.mocks = {}
-        self.socket_messages_queue = deque(maxlen=1000)
+        self.websocket_messages = WebsocketMessagesRing(self.dump_args)
+        self.metrics = Metrics()
+        self.loop_lag = LoopLag(on_sample=self.metrics.loop_lag.observe)
+        self.__executors_names = {
+            self.run_in_thread_executor: 'io_thread',
+            self.__ws_threadpool: 'ws_thread',
+        }
+        self.__sampling_profiler = None
+        self.__sampling_profiler_workers = False
 
     def __init_services(self):
-        from middlewared.service import CoreService
+        from middlewared.service import CoreService, MetricsEventSource
         self.add_service(CoreService(self))
+        self.register_event_source('core.metrics', MetricsEventSource)
         self.event_register('core.environ', 'Send on middleware process environment changes.', private=True)
         self.event_register('core.reconfigure_logging', 'Send when /var/log is remounted.', private=True)
 
     async def __plugins_load(self):
 
         setup_funcs = []
+        last = time.monotonic()
 
         def on_module_begin(mod):
+            self.startup_timings['load'][mod.__name__] = time.monotonic() - last
             self._console_write(f'loaded plugin {mod.__name__}')
             self.__notify_startup_progress()
 
         def on_module_end(mod):
+            nonlocal last
+            last = time.monotonic()
+
             if not hasattr(mod, 'setup'):
                 return
 
             mod_name = mod.__name__.split('.')
             setup_plugin = '.'.join(mod_name[mod_name.index('plugins') + 1:])
 
-            setup_funcs.append((setup_plugin, mod.setup))
+            setup_funcs.append((
+                setup_plugin, mod.setup, getattr(mod, 'SETUP_DEPENDS', []), getattr(mod, 'SETUP_CONCURRENT', False),
+            ))
 
         def on_modules_loaded():
             self._console_write('resolving plugins schemas')
@@ -926,58 +1021,129 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
 
         return setup_funcs
 
-    async def __plugins_setup(self, setup_funcs):
+    # These plugins are set up one after another (in this order) before all the other plugins
+    EARLY_SETUP_PLUGINS = [
+        'datastore',
+        # Allow internal UNIX socket authentication for plugins that run in separate pools
+        'auth',
+        # We need to register all services because pseudo-services can still be used by plugins setup functions
+        'service',
+        # We need to run pwenc first to ensure we have secret setup to work for encrypted fields which
+        # might be used in the setup functions.
+        'pwenc',
+        # We run boot plugin first to ensure we are able to retrieve
+        # BOOT POOL during system plugin initialization
+        'boot',
+        # We need to run system plugin setup's function first because when system boots, the right
+        # timezone is not configured. See #72131
+        'system',
+        # Initialize mail before other plugins try to send e-mail messages
+        'mail',
+        # We also need to load alerts first because other plugins can issue one-shot alerts during their
+        # initialization
+        'alert',
+        # Migrate users and groups ASAP
+        'account',
+        # Replication plugin needs to be initialized before zettarepl in order to register network activity
+        'replication',
+        # Migrate network interfaces ASAP
+        'network',
+    ]
+
+    @classmethod
+    def _plugins_setup_graph(cls, setup_funcs):
+        """
+        Returns setup dependencies of every plugin. Early setup plugins depend on the previous ones, all the others
+        depend on the early setup plugins and on the plugins they list in their module-level `SETUP_DEPENDS`.
 
-        # TODO: Rework it when we have order defined for setup functions
-        def sort_key(plugin__function):
-            plugin, function = plugin__function
-
-            beginning = [
-                'datastore',
-                # Allow internal UNIX socket authentication for plugins that run in separate pools
-                'auth',
-                # We need to register all services because pseudo-services can still be used by plugins setup functions
-                'service',
-                # We need to run pwenc first to ensure we have secret setup to work for encrypted fields which
-                # might be used in the setup functions.
-                'pwenc',
-                # We run boot plugin first to ensure we are able to retrieve
-                # BOOT POOL during system plugin initialization
-                'boot',
-                # We need to run system plugin setup's function first because when system boots, the right
-                # timezone is not configured. See #72131
-                'system',
-                # Initialize mail before other plugins try to send e-mail messages
-                'mail',
-                # We also need to load alerts first because other plugins can issue one-shot alerts during their
-                # initialization
-                'alert',
-                # Migrate users and groups ASAP
-                'account',
-                # Replication plugin needs to be initialized before zettarepl in order to register network activity
-                'replication',
-                # Migrate network interfaces ASAP
-                'network',
-            ]
-            try:
-                return beginning.index(plugin)
-            except ValueError:
-                return len(beginning)
-        setup_funcs = sorted(setup_funcs, key=sort_key)
+        Plugins are set up one after another in the order they were loaded unless their module sets
+        `SETUP_CONCURRENT = True`. Such a plugin is set up concurrently with the others so its setup must not use
+        the state of any plugins other than early setup plugins and its `SETUP_DEPENDS` and other plugins must not
+        use its state unless they list it in their `SETUP_DEPENDS`.
+        """
+        names = {name for name, f, depends, setup_concurrent in setup_funcs}
+        early = [name for name in cls.EARLY_SETUP_PLUGINS if name in names]
+        graph = {}
+        previous = None
+        for name, f, depends, setup_concurrent in setup_funcs:
+            if name in early:
+                deps = set(early[:early.index(name)])
+            else:
+                deps = set(early)
+                if not setup_concurrent:
+                    if previous is not None:
+                        deps.add(previous)
+                    previous = name
+            graph[name] = (deps | set(depends)) & names
+
+        visited = {}
+
+        def visit(name, path):
+            if visited.get(name) == 'done':
+                return
+            if visited.get(name) == 'visiting':
+                raise RuntimeError(f'Plugins setup dependency cycle: {" -> ".join(path + [name])}')
+            visited[name] = 'visiting'
+            for dep in graph[name]:
+                visit(dep, path + [name])
+            visited[name] = 'done'
+
+        for name in graph:
+            visit(name, [])
+
+        return graph
+
+    async def __plugins_setup(self, setup_funcs):
+        graph = self._plugins_setup_graph(setup_funcs)
 
         # Only call setup after all schemas have been resolved because
         # they can call methods with schemas defined.
         setup_total = len(setup_funcs)
-        for i, setup_func in enumerate(setup_funcs):
-            name, f = setup_func
-            self._console_write(f'setting up plugins ({name}) [{i + 1}/{setup_total}]')
+        setup_started = 0
+        setup_begin = time.monotonic()
+        tasks = {}
+
+        async def setup(name, f):
+            nonlocal setup_started
+
+            await asyncio.gather(*[tasks[dep] for dep in graph[name]])
+
+            setup_started += 1
+            self._console_write(f'setting up plugins ({name}) [{setup_started}/{setup_total}]')
             self.__notify_startup_progress()
+            started = time.monotonic()
             call = f(self)
             # Allow setup to be a coroutine
             if asyncio.iscoroutinefunction(f):
                 await call
 
-        self.logger.debug('All plugins loaded')
+            self.startup_timings['setup'][name] = {
+                'started': started - setup_begin,
+                'duration': time.monotonic() - started,
+            }
+
+        for name, f, depends, setup_concurrent in setup_funcs:
+            tasks[name] = asyncio.ensure_future(setup(name, f))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            self.startup_timings['setup_total'] = time.monotonic() - setup_begin
+            self.__write_startup_timings()
+
+        self.logger.debug('All plugins loaded in %.2f seconds', self.startup_timings['setup_total'])
+
+    def __write_startup_timings(self):
+        if self.startup_seq_path is None:
+            return
+
+        try:
+            with open(self.startup_seq_path + ".timings.tmp", "w") as f:
+                json.dump(self.startup_timings, f, indent=2)
+
+            os.rename(self.startup_seq_path + ".timings.tmp", self.startup_seq_path + ".timings")
+        except Exception:
+            self.logger.warning('Failed to write plugins startup timings', exc_info=True)
 
     def _setup_periodic_tasks(self):
         for service_name, service_obj in self.get_services().items():
@@ -1181,15 +1347,19 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         Also used to run non thread safe libraries (using a ProcessPool)
         """
         loop = asyncio.get_event_loop()
-        if isinstance(pool, IoThreadPoolExecutor) and self.run_in_thread_executor.no_idle_threads:
-            # this means the IoThreadPool has no idle threads so instead of blocking the
-            # main event loop, we'll spin up single-use threads until the threadpool gets
-            # some more idle thread(s)
-            self.logger.trace('Calling %r in single-use thread', method)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as exc:
-                return await loop.run_in_executor(exc, functools.partial(method, *args, **kwargs))
+        submitted_at = time.monotonic()
+        wait_time = None
+
+        def run():
+            nonlocal wait_time
+            wait_time = time.monotonic() - submitted_at
+            return method(*args, **kwargs)
 
-        return await loop.run_in_executor(pool, functools.partial(method, *args, **kwargs))
+        try:
+            return await loop.run_in_executor(pool, run)
+        finally:
+            if wait_time is not None:
+                self.metrics.observe_executor_wait(self.__executors_names.get(pool, 'thread'), wait_time)
 
     async def _run_in_conn_threadpool(self, method, *args, **kwargs):
         """
@@ -1204,22 +1374,63 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         return await self.run_in_executor(self.__ws_threadpool, method, *args, **kwargs)
 
     def __init_procpool(self):
-        self.__procpool = concurrent.futures.ProcessPoolExecutor(
-            max_workers=5,
-            initializer=functools.partial(
-                worker_init, self.overlay_dirs, self.debug_level, self.log_handler
-            ),
+        self.__procpool = ProcessPool(
+            min_workers=2,
+            max_workers=max(5, os.cpu_count() or 1),
+            initializer=functools.partial(worker_preload, self.overlay_dirs),
+            worker_initializer=functools.partial(worker_init, self.debug_level, self.log_handler),
         )
 
     async def run_in_proc(self, method, *args, **kwargs):
+        profiler = self.__sampling_profiler if self.__sampling_profiler_workers else None
+        if profiler is not None:
+            method, args, kwargs = worker_profiled_call, (profiler.interval, method, args, kwargs), {}
+
         retries = 2
         for i in range(retries):
+            future = self.__procpool.submit(method, *args, **kwargs)
             try:
-                return await self.run_in_executor(self.__procpool, method, *args, **kwargs)
+                result = await asyncio.wrap_future(future)
+                if profiler is not None:
+                    result, samples = result
+                    profiler.samples.update(samples)
+                return result
             except concurrent.futures.process.BrokenProcessPool:
+                # The worker that crashed was already replaced
                 if i == retries - 1:
                     raise
-                self.__init_procpool()
+            finally:
+                if future.wait_time is not None:
+                    self.metrics.observe_executor_wait('process_pool', future.wait_time)
+
+    def process_pool_stats(self):
+        return self.__procpool.stats()
+
+    def io_thread_pool_stats(self):
+        return self.run_in_thread_executor.stats()
+
+    @contextlib.asynccontextmanager
+    async def sampling_profiler(self, interval=0.01, workers=True):
+        """
+        Samples stacks of all the middlewared threads (event loop, IoThreads, etc.) while the context is active. If
+        `workers` is true, process pool calls made meanwhile are sampled too (calls that finish after the context
+        exits are not accounted).
+        """
+        if self.__sampling_profiler is not None:
+            raise CallError('Sampling profiler is already running', errno.EBUSY)
+
+        profiler = SamplingProfiler(interval)
+        stop = threading.Event()
+        thread = start_daemon_thread(target=profiler.run, kwargs={'stop': stop}, name='profiler')
+        self.__sampling_profiler = profiler
+        self.__sampling_profiler_workers = workers
+        try:
+            yield profiler
+        finally:
+            self.__sampling_profiler = None
+            self.__sampling_profiler_workers = False
+            stop.set()
+            await self.run_in_thread(thread.join)
 
     def pipe(self, buffered=False):
         """
@@ -1269,13 +1480,26 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         return PreparedCall(args=args, executor=executor)
 
     async def _call(
-        self, name, serviceobj, methodobj, params, **kwargs,
+        self, name, serviceobj, methodobj, params, trusted=False, **kwargs,
     ):
         prepared_call = self._call_prepare(name, serviceobj, methodobj, params, **kwargs)
 
         if prepared_call.job:
             return prepared_call.job
 
+        if trusted:
+            methodobj = trusted_internal_method(methodobj)
+
+        started_at = time.monotonic()
+        error = True
+        try:
+            result = await self._call_prepared(name, serviceobj, methodobj, prepared_call)
+            error = False
+            return result
+        finally:
+            self.metrics.observe_call(name, time.monotonic() - started_at, error)
+
+    async def _call_prepared(self, name, serviceobj, methodobj, prepared_call):
         if asyncio.iscoroutinefunction(methodobj):
             self.logger.trace('Calling %r in current IO loop', name)
             return await methodobj(*prepared_call.args)
@@ -1326,6 +1550,15 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
             app=app, io_thread=True, job_on_progress_cb=job_on_progress_cb, pipes=pipes,
         )
 
+    async def call_internal(self, name, *params):
+        """
+        Call `name` with `params` that were built by middleware itself (or were already validated by the caller), never
+        with arguments that come from a client. `@accepts(..., trusted_internal=True)` methods skip validating them.
+        """
+        serviceobj, methodobj = self._method_lookup(name)
+
+        return await self._call(name, serviceobj, methodobj, params, io_thread=True, trusted=True)
+
     def call_sync(self, name, *params, job_on_progress_cb=None):
         serviceobj, methodobj = self._method_lookup(name)
 
@@ -1402,6 +1635,16 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         """
         self.__event_subs[name].append(handler)
 
+    def has_event_subscribers(self, name):
+        """
+        Whether sending event `name` would have any effect. Can be used to skip building expensive event payloads.
+        """
+        return (
+            bool(self.__event_subs.get(name)) or
+            self.event_source_manager.short_name_arg(name)[0] in self.event_source_manager.event_sources or
+            self.event_subscriptions.has_subscribers(name)
+        )
+
     def event_register(self, name, description, private=False, returns=None):
         """
         All events middleware can send should be registered so they are properly documented
@@ -1428,11 +1671,20 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
 
         self.logger.trace(f'Sending event {name!r}:{event_type!r}:{kwargs!r}')
 
-        for session_id, wsclient in list(self.__wsclients.items()):
-            try:
-                wsclient.send_event(name, event_type, **kwargs)
-            except Exception:
-                self.logger.warn('Failed to send event {} to {}'.format(name, session_id), exc_info=True)
+        if self.event_source_manager.short_name_arg(name)[0] in self.event_source_manager.event_sources:
+            wsclients = list(self.__wsclients.values())
+        else:
+            wsclients = self.event_subscriptions.subscribers(name)
+
+        if wsclients:
+            # Serialize once for all the subscribers
+            event = event_message(name, event_type, **kwargs)
+            serialized = json.dumps(event)
+            for wsclient in wsclients:
+                try:
+                    wsclient._send_serialized(event, serialized)
+                except Exception:
+                    self.logger.warn('Failed to send event {} to {}'.format(name, wsclient.session_id), exc_info=True)
 
         async def wrap(handler):
             try:
@@ -1561,7 +1813,7 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
 
                 x = json.loads(msg.data)
                 try:
-                    await connection.on_message(x)
+                    await connection.on_message(x, msg.data)
                 except Exception as e:
                     self.logger.error('Connection closed unexpectedly', exc_info=True)
                     await ws.close(message=str(e).encode('utf-8'))
@@ -1667,6 +1919,8 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
             t.setDaemon(True)
             t.start()
 
+        self.loop_lag.start(self.loop)
+
         self.loop.add_signal_handler(signal.SIGINT, self.terminate)
         self.loop.add_signal_handler(signal.SIGTERM, self.terminate)
         self.loop.add_signal_handler(signal.SIGUSR1, self.pdb)
@@ -1692,7 +1946,7 @@ class Middleware(LoadPluginsMixin, RunInThreadMixin, ServiceCallMixin):
         asyncio.ensure_future(self.jobs.run())
 
         # Start up middleware worker process pool
-        self.__procpool._start_executor_manager_thread()
+        self.__procpool.start()
 
         runner = web.AppRunner(app, handle_signals=False, access_log=None)
         await runner.setup()
@@ -8,6 +8,7 @@ from middlewared.utils.osc import IS_FREEBSD
 from middlewared.validators import Email
 from middlewared.plugins.smb import SMBBuiltin
 
+from collections import defaultdict
 import binascii
 import crypt
 import errno
@@ -128,7 +129,11 @@ class UserService(CRUDService):
 
     class Config:
         datastore = 'account.bsdusers'
-        datastore_extend = 'user.user_extend'
+        datastore_extend_batch = 'user.user_extend_batch'
+        datastore_raw_fields = (
+            'id', 'uid', 'username', 'home', 'shell', 'full_name', 'builtin', 'smb', 'password_disabled', 'locked',
+            'sudo', 'sudo_nopasswd', 'microsoft_account',
+        )
         datastore_prefix = 'bsdusr_'
         cli_namespace = 'account.user'
 
@@ -151,28 +156,36 @@ class UserService(CRUDService):
     )
 
     @private
-    async def user_extend(self, user):
-
-        # Normalize email, empty is really null
-        if user['email'] == '':
-            user['email'] = None
+    async def user_extend_batch(self, users):
+        if not users:
+            return users
 
-        # Get group membership
-        user['groups'] = [gm['group']['id'] for gm in await self.middleware.call(
+        # Get group membership of all users with a single query
+        groups = defaultdict(list)
+        for gm in await self.middleware.call(
             'datastore.query', 'account.bsdgroupmembership',
-            [('user', '=', user['id'])], {'prefix': 'bsdgrpmember_'}
-        )]
+            [('user', 'in', [user['id'] for user in users])], {'prefix': 'bsdgrpmember_', 'relationships': False}
+        ):
+            groups[gm['user_id']].append(gm['group_id'])
 
-        # Get authorized keys
-        keysfile = f'{user["home"]}/.ssh/authorized_keys'
-        user['sshpubkey'] = None
-        if os.path.exists(keysfile):
-            try:
-                with open(keysfile, 'r') as f:
-                    user['sshpubkey'] = f.read()
-            except Exception:
-                pass
-        return user
+        for user in users:
+            # Normalize email, empty is really null
+            if user['email'] == '':
+                user['email'] = None
+
+            user['groups'] = groups[user['id']]
+
+            # Get authorized keys
+            keysfile = f'{user["home"]}/.ssh/authorized_keys'
+            user['sshpubkey'] = None
+            if os.path.exists(keysfile):
+                try:
+                    with open(keysfile, 'r') as f:
+                        user['sshpubkey'] = f.read()
+                except Exception:
+                    pass
+
+        return users
 
     @private
     async def user_compress(self, user):
@@ -210,6 +223,7 @@ class UserService(CRUDService):
         options = options or {}
         options['extend'] = self._config.datastore_extend
         options['extend_context'] = self._config.datastore_extend_context
+        options['extend_batch'] = self._config.datastore_extend_batch
         options['prefix'] = self._config.datastore_prefix
 
         datastore_options = options.copy()
@@ -236,8 +250,10 @@ class UserService(CRUDService):
         if dssearch:
             return await self.middleware.call('dscache.query', 'USERS', filters, options)
 
+        sql_filters, filters = self._split_datastore_filters(filters)
+
         result = await self.middleware.call(
-            'datastore.query', self._config.datastore, [], datastore_options
+            'datastore.query', self._config.datastore, sql_filters, datastore_options
         )
 
         for entry in result:
@@ -1152,7 +1168,8 @@ class GroupService(CRUDService):
     class Config:
         datastore = 'account.bsdgroups'
         datastore_prefix = 'bsdgrp_'
-        datastore_extend = 'group.group_extend'
+        datastore_extend_batch = 'group.group_extend_batch'
+        datastore_raw_fields = ('id', 'gid', 'group', 'builtin', 'sudo', 'sudo_nopasswd', 'smb')
         cli_namespace = 'account.group'
 
     ENTRY = Patch(
@@ -1168,28 +1185,35 @@ class GroupService(CRUDService):
     )
 
     @private
-    async def group_extend(self, group):
-        group['name'] = group['group']
-        # Get group membership
-        group['users'] = [
-            gm['user']['id']
-            for gm in await self.middleware.call(
-                'datastore.query',
-                'account.bsdgroupmembership',
-                [('group', '=', group['id'])],
-                {'prefix': 'bsdgrpmember_'}
-            )
-        ]
-        group['users'] += [
-            gmu['id']
-            for gmu in await self.middleware.call(
-                'datastore.query',
-                'account.bsdusers',
-                [('bsdusr_group_id', '=', group['id'])]
-            )
-            if gmu['id'] not in group['users']
-        ]
-        return group
+    async def group_extend_batch(self, groups):
+        if not groups:
+            return groups
+
+        group_ids = [group['id'] for group in groups]
+
+        # Get group membership of all groups with two queries
+        users = defaultdict(list)
+        for gm in await self.middleware.call(
+            'datastore.query',
+            'account.bsdgroupmembership',
+            [('group', 'in', group_ids)],
+            {'prefix': 'bsdgrpmember_', 'relationships': False}
+        ):
+            users[gm['group_id']].append(gm['user_id'])
+        for gmu in await self.middleware.call(
+            'datastore.query',
+            'account.bsdusers',
+            [('bsdusr_group_id', 'in', group_ids)],
+            {'relationships': False}
+        ):
+            if gmu['id'] not in users[gmu['bsdusr_group_id']]:
+                users[gmu['bsdusr_group_id']].append(gmu['id'])
+
+        for group in groups:
+            group['name'] = group['group']
+            group['users'] = users[group['id']]
+
+        return groups
 
     @private
     async def group_compress(self, group):
@@ -1227,6 +1251,7 @@ class GroupService(CRUDService):
         options = options or {}
         options['extend'] = self._config.datastore_extend
         options['extend_context'] = self._config.datastore_extend_context
+        options['extend_batch'] = self._config.datastore_extend_batch
         options['prefix'] = self._config.datastore_prefix
 
         datastore_options = options.copy()
@@ -1245,11 +1270,13 @@ class GroupService(CRUDService):
         if dssearch:
             return await self.middleware.call('dscache.query', 'GROUPS', filters, options)
 
+        sql_filters, filters = self._split_datastore_filters(filters)
+
         if 'SMB' in additional_information:
             smb_groupmap = await self.middleware.call("smb.groupmap_list")
 
         result = await self.middleware.call(
-            'datastore.query', self._config.datastore, [], datastore_options
+            'datastore.query', self._config.datastore, sql_filters, datastore_options
         )
 
         for entry in result:
@@ -1,4 +1,3 @@
-import josepy as jose
 import json
 import requests
 
@@ -6,11 +5,15 @@ from middlewared.plugins.acme_protocol_.authenticators.factory import auth_facto
 from middlewared.schema import Bool, Dict, Int, Patch, Str, ValidationErrors
 from middlewared.service import accepts, CallError, CRUDService, private
 import middlewared.sqlalchemy as sa
+from middlewared.utils.lazy_import import lazy_import
 
-from acme import client, messages
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric import rsa
 
+client = lazy_import('acme.client')
+jose = lazy_import('josepy')
+messages = lazy_import('acme.messages')
+
 
 # TODO: See what can be done to respect rate limits
 
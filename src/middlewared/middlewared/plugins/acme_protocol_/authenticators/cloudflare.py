@@ -1,12 +1,11 @@
 import logging
 
-from certbot_dns_cloudflare._internal.dns_cloudflare import _CloudflareClient
-
 from middlewared.schema import accepts, Dict, Str, ValidationErrors
+from middlewared.utils.lazy_import import lazy_import
 
 from .base import Authenticator
 
-
+dns_cloudflare = lazy_import('certbot_dns_cloudflare._internal.dns_cloudflare')
 logger = logging.getLogger(__name__)
 
 
@@ -57,7 +56,7 @@ class CloudFlareAuthenticator(Authenticator):
             params = (None, self.api_token)
         else:
             params = (self.cloudflare_email, self.api_key)
-        return _CloudflareClient(*params)
+        return dns_cloudflare._CloudflareClient(*params)
 
     def _cleanup(self, domain, validation_name, validation_content):
         self.get_cloudflare_object().del_txt_record(domain, validation_name, validation_content)
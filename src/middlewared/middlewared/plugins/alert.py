@@ -807,13 +807,14 @@ class AlertService(Service):
             if await self.middleware.call('failover.status') == 'BACKUP':
                 return
 
-        await self.middleware.call("datastore.delete", "system.alert", [])
-
+        operations = [{"type": "DELETE", "name": "system.alert", "id": []}]
         for alert in self.alerts:
             d = alert.__dict__.copy()
             d["klass"] = d["klass"].name
             del d["mail"]
-            await self.middleware.call("datastore.insert", "system.alert", d)
+            operations.append({"type": "INSERT", "name": "system.alert", "data": d})
+
+        await self.middleware.call("datastore.bulk_write", operations)
 
     @private
     @accepts(Str("klass"), Any("args", null=True))
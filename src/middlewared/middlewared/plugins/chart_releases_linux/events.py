@@ -8,6 +8,8 @@ from middlewared.utils.itertools import infinite_multiplier_generator
 from .utils import get_chart_release_from_namespace, get_namespace, is_ix_namespace
 
 
+# Subscribes to `kubernetes.events`
+SETUP_DEPENDS = ['kubernetes_linux.events']
 EVENT_LOCKS = collections.defaultdict(asyncio.Lock)
 LOCKS = collections.defaultdict(asyncio.Lock)
 
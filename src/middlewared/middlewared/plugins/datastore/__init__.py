@@ -1,2 +1,20 @@
+from middlewared.service import ConfigService, SystemServiceService
+
+from .cache import hook_datastore_execute_write, hook_datastore_execute_write_batch
+
+
 async def setup(middleware):
     await middleware.call("datastore.setup")
+
+    middleware.register_hook("datastore.post_execute_write", hook_datastore_execute_write, inline=True)
+    middleware.register_hook("datastore.post_execute_write_batch", hook_datastore_execute_write_batch, inline=True)
+
+    # Configuration tables are small, read often and written rarely
+    await middleware.call("datastore.enable_cache", "services.services")
+    for service in middleware.get_services().values():
+        if isinstance(service, SystemServiceService):
+            await middleware.call(
+                "datastore.enable_cache", f"services.{service._config.service_model or service._config.service}",
+            )
+        elif isinstance(service, ConfigService) and service._config.datastore:
+            await middleware.call("datastore.enable_cache", service._config.datastore)
@@ -0,0 +1,190 @@
+from collections import defaultdict, OrderedDict
+import re
+import threading
+
+from middlewared.service import private, Service
+from middlewared.utils.filters import freeze
+
+# `query` options that change the resulting SQL query
+CACHE_KEY_OPTIONS = ('relationships', 'prefix', 'order_by', 'offset', 'limit', 'count')
+WRITE_RE = re.compile(r'^\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+["`]?(\w+)', re.I)
+
+
+class TableCache:
+    """
+    Caches raw `datastore.query` results of (small and rarely changing) tables that were explicitly enabled.
+    Entries are dropped when any of the tables they were loaded from is written to.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.tables = set()
+        self.entries = defaultdict(OrderedDict)
+        self.dependencies = defaultdict(set)
+        self.generations = defaultdict(int)
+        self.stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'invalidations': 0})
+
+    def enable(self, table):
+        with self.lock:
+            self.tables.add(table)
+
+    def key(self, table, filters, options):
+        """
+        Returns a key for the `get`/`put` methods or `None` if this query should not be cached.
+        """
+        if table not in self.tables:
+            return None
+
+        try:
+            return freeze((filters, [options.get(k) for k in CACHE_KEY_OPTIONS]))
+        except TypeError:
+            return None
+
+    def get(self, table, key, dependencies):
+        """
+        Returns `(True, value)` on a cache hit or `(False, generation)` on a cache miss. `generation` must be passed to
+        the `put` method so that a result that was fetched before a concurrent write is not stored.
+
+        `dependencies` are all the tables the result is loaded from. They are registered before the result is fetched
+        so that a write to any of them that happens before `put` prevents storing a stale result.
+        """
+        with self.lock:
+            entries = self.entries[table]
+            if key in entries:
+                entries.move_to_end(key)
+                self.stats[table]['hits'] += 1
+                return True, entries[key]
+
+            for dependency in dependencies:
+                self.dependencies[dependency].add(table)
+
+            self.stats[table]['misses'] += 1
+            return False, self.generations[table]
+
+    def put(self, table, key, value, generation):
+        with self.lock:
+            if self.generations[table] != generation:
+                return
+
+            entries = self.entries[table]
+            entries[key] = value
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, table=None):
+        """
+        Drops all entries that depend on `table` (or all entries if `table` is `None`).
+        """
+        with self.lock:
+            if table is None:
+                tables = self.tables
+            else:
+                tables = self.dependencies.get(table, set()) | ({table} & self.tables)
+
+            for table in tables:
+                self.generations[table] += 1
+                if self.entries[table]:
+                    self.entries[table].clear()
+                    self.stats[table]['invalidations'] += 1
+
+    def invalidate_sql(self, sql):
+        m = WRITE_RE.match(sql)
+        self.invalidate(m.group(1) if m else None)
+
+
+table_cache = TableCache()
+
+
+class QueryCache:
+    """
+    Caches compiled `datastore.query` SQL statements by the shape of the query (table, options and filters without
+    their values). On a hit the compiled statement is executed again with new bind parameter values.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.dialect = None
+        self.entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def setup(self, dialect):
+        with self.lock:
+            self.dialect = dialect
+            self.entries.clear()
+
+    def get(self, key):
+        """
+        Returns a compiled statement or `None`.
+        """
+        with self.lock:
+            try:
+                entry = self.entries[key]
+            except KeyError:
+                self.stats['misses'] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+
+    def compile(self, key, stmt, params):
+        """
+        Compiles `stmt` and stores it if `params` provide values for all of its bind parameters.
+        Returns the compiled statement and whether it was stored.
+        """
+        compiled = stmt.compile(dialect=self.dialect)
+
+        # Otherwise the statement has anonymous bind parameters which values are compiled into it
+        if set(compiled.positiontup) != set(params) or not self.max_entries:
+            return compiled, False
+
+        with self.lock:
+            self.entries[key] = compiled
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return compiled, True
+
+
+query_cache = QueryCache()
+
+
+class DatastoreService(Service):
+
+    class Config:
+        private = True
+
+    @private
+    def enable_cache(self, name):
+        """
+        Enable caching of `datastore.query` results for table `name`. Should only be used for small tables that are
+        rarely written to.
+        """
+        table_cache.enable(name.replace('.', '_').lower())
+
+    @private
+    def cache_stats(self):
+        """
+        Returns `datastore.query` cache hits, misses and invalidations for each cached table.
+        """
+        with table_cache.lock:
+            return {k: dict(v) for k, v in table_cache.stats.items()}
+
+    @private
+    def query_cache_stats(self):
+        """
+        Returns compiled `datastore.query` statements cache hits, misses and size.
+        """
+        with query_cache.lock:
+            return dict(query_cache.stats, entries=len(query_cache.entries))
+
+
+def hook_datastore_execute_write(middleware, sql, params, options):
+    table_cache.invalidate_sql(sql)
+
+
+def hook_datastore_execute_write_batch(middleware, queries, options):
+    for sql, params in queries:
+        table_cache.invalidate_sql(sql)
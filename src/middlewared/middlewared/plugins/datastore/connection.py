@@ -1,5 +1,8 @@
 from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import os
 import re
+import threading
 
 from sqlalchemy import create_engine
 
@@ -7,6 +10,10 @@ from middlewared.service import private, Service
 
 from middlewared.plugins.config import FREENAS_DATABASE
 
+from .cache import query_cache, table_cache
+
+READ_THREADS = 4
+
 
 def regexp(expr, item):
     if item is None:
@@ -21,10 +28,16 @@ class DatastoreService(Service):
     class Config:
         private = True
 
+    # Writes (and reads when WAL is not available) are serialized on the single writer connection
     thread_pool = ThreadPoolExecutor(1)
+    # In WAL mode reads are served concurrently, each read thread has its own read-only connection
+    read_thread_pool = ThreadPoolExecutor(READ_THREADS, thread_name_prefix='datastore_read')
 
     engine = None
     connection = None
+    wal = False
+    generation = 0
+    read_connections = threading.local()
 
     @private
     async def setup(self):
@@ -42,11 +55,94 @@ class DatastoreService(Service):
         self.connection = self.engine.connect()
         self.connection.connection.create_function("REGEXP", 2, regexp)
         self.connection.connection.execute("PRAGMA foreign_keys=ON")
+        # In-memory databases do not support WAL
+        self.wal = self.connection.connection.execute("PRAGMA journal_mode=WAL").fetchone()[0] == "wal"
         self.connection.connection.execute("VACUUM")
 
+        # Read connections opened for the previous engine will be reopened
+        self.generation += 1
+
+        query_cache.setup(self.engine.dialect)
+
+        table_cache.invalidate()
+
+    @private
+    async def checkpoint(self, func=None, *args):
+        """
+        Checkpoint WAL into the main database file so it can be copied directly (config backup, HA database sync).
+
+        If `func` is given, it is called with `args` in the writer thread right after the checkpoint so no one can
+        write to the database until it returns. Its result is returned.
+        """
+        return await self.middleware.run_in_executor(self.thread_pool, self._checkpoint_and_call, func, *args)
+
+    def _checkpoint_and_call(self, func, *args):
+        self._checkpoint("TRUNCATE")
+
+        if func is not None:
+            return func(*args)
+
+    @private
+    async def replace_database(self, path):
+        """
+        Replace the database file with `path` (it is moved) and reopen all the connections.
+
+        Database file must never be replaced with open connections: the old WAL would be applied to the new file.
+        """
+        await self.middleware.run_in_executor(self.thread_pool, self._replace_database, path)
+
+    def _replace_database(self, path):
+        # Park every read thread (with its connection closed) so no one can read the database while it is replaced
+        parked = threading.Barrier(READ_THREADS + 1)
+        release = threading.Event()
+
+        def park():
+            self._close_read_connection()
+            parked.wait()
+            release.wait()
+
+        for i in range(READ_THREADS):
+            self.read_thread_pool.submit(park)
+
+        try:
+            parked.wait()
+
+            # Only needed when reads are not served by the read threads
+            self._close_read_connection()
+            self._checkpoint("TRUNCATE")
+            self.connection.close()
+            self.connection = None
+            self.engine.dispose()
+            self.engine = None
+
+            for suffix in ("-wal", "-shm"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(FREENAS_DATABASE + suffix)
+
+            try:
+                os.rename(path, FREENAS_DATABASE)
+            finally:
+                self._setup()
+        finally:
+            release.set()
+
+    def _checkpoint(self, mode="PASSIVE"):
+        # Writes only do a `PASSIVE` checkpoint as it does not wait for the readers that still use older WAL frames
+        # (these frames stay in the WAL until the next checkpoint). `TRUNCATE` is only done by `checkpoint`.
+        if self.wal:
+            self.connection.connection.execute(f"PRAGMA wal_checkpoint({mode})")
+
     @private
     async def execute(self, *args):
-        return await self.middleware.run_in_executor(self.thread_pool, self.connection.execute, *args)
+        return await self.middleware.run_in_executor(self.thread_pool, self._execute, *args)
+
+    def _execute(self, *args):
+        try:
+            return self.connection.execute(*args)
+        finally:
+            self._checkpoint()
+            # We don't know what tables were changed by arbitrary SQL
+            table_cache.invalidate()
 
     @private
     async def execute_write(self, stmt, options=None):
@@ -54,6 +150,11 @@ class DatastoreService(Service):
         options.setdefault('ha_sync', True)
         options.setdefault('return_last_insert_rowid', False)
 
+        sql, binds = self._compile(stmt)
+
+        return await self.middleware.run_in_executor(self.thread_pool, self._execute_write, sql, binds, options)
+
+    def _compile(self, stmt):
         compiled = stmt.compile(self.engine)
 
         sql = compiled.string
@@ -67,10 +168,11 @@ class DatastoreService(Service):
             else:
                 binds.append(value)
 
-        return await self.middleware.run_in_executor(self.thread_pool, self._execute_write, sql, binds, options)
+        return sql, binds
 
     def _execute_write(self, sql, binds, options):
         result = self.connection.execute(sql, binds)
+        self._checkpoint()
 
         self.middleware.call_hook_inline("datastore.post_execute_write", sql, binds, options)
 
@@ -79,13 +181,95 @@ class DatastoreService(Service):
 
         return result
 
+    @private
+    async def execute_write_batch(self, stmts, options=None):
+        """
+        Execute `stmts` in a single transaction. If any of them fails, none of them are applied.
+
+        An item of `stmts` can also be a callable that receives the list of results of the preceding items and
+        returns a list of statements to execute in its place (e.g. to write relationships of a row that was
+        inserted by the same batch, or to check a result and abort the transaction by raising an exception).
+
+        `datastore.post_execute_write_batch` hook is called with all the executed queries once the transaction is
+        committed so they can be replicated as a single batch.
+
+        Returns a list of results (`None` for callable items).
+        """
+        options = options or {}
+        options.setdefault('ha_sync', True)
+
+        return await self.middleware.run_in_executor(self.thread_pool, self._execute_write_batch, stmts, options)
+
+    def _execute_write_batch(self, stmts, options):
+        queries = []
+        results = []
+        try:
+            with self.connection.begin():
+                for stmt in stmts:
+                    if callable(stmt):
+                        for generated in stmt(results):
+                            queries.append(self._compile(generated))
+                            self.connection.execute(*queries[-1])
+
+                        results.append(None)
+                    else:
+                        queries.append(self._compile(stmt))
+                        results.append(self.connection.execute(*queries[-1]))
+        finally:
+            self._checkpoint()
+
+        self.middleware.call_hook_inline("datastore.post_execute_write_batch", queries, options)
+
+        return results
+
+    @private
+    async def execute_batch(self, queries):
+        """
+        Execute raw `queries` (a list of `[sql, params]`) in a single transaction.
+        """
+        return await self.middleware.run_in_executor(self.thread_pool, self._execute_batch, queries)
+
+    def _execute_batch(self, queries):
+        try:
+            with self.connection.begin():
+                for sql, params in queries:
+                    self.connection.execute(sql, params)
+        finally:
+            self._checkpoint()
+            table_cache.invalidate()
+
     @private
     async def fetchall(self, *args):
+        if self.wal:
+            return await self.middleware.run_in_executor(self.read_thread_pool, self._fetchall_read, *args)
+
         return await self.middleware.run_in_executor(self.thread_pool, self._fetchall, *args)
 
-    def _fetchall(self, query, params=None):
-        cursor = self.connection.execute(query, params or [])
+    def _fetchall(self, query, params=None, connection=None):
+        cursor = (connection or self.connection).execute(query, params or [])
         try:
             return cursor.fetchall()
         finally:
             cursor.close()
+
+    def _fetchall_read(self, query, params=None):
+        return self._fetchall(query, params, self._read_connection())
+
+    def _read_connection(self):
+        local = self.read_connections
+        if getattr(local, 'generation', None) != self.generation:
+            self._close_read_connection()
+
+            local.connection = self.engine.connect()
+            local.connection.connection.create_function("REGEXP", 2, regexp)
+            local.connection.connection.execute("PRAGMA query_only=ON")
+            local.generation = self.generation
+
+        return local.connection
+
+    def _close_read_connection(self):
+        local = self.read_connections
+        if getattr(local, 'connection', None) is not None:
+            local.connection.close()
+            local.connection = None
+            local.generation = None
@@ -1,8 +1,12 @@
+import asyncio
 from collections import defaultdict
 
 from middlewared.schema import accepts, Dict, Str
 from middlewared.service import Service
 
+# Updates of the same row that happen within this interval (in seconds) only produce one `CHANGED` event
+UPDATE_EVENTS_INTERVAL = 0.1
+
 
 class DatastoreService(Service):
 
@@ -10,6 +14,9 @@ class DatastoreService(Service):
         private = True
 
     events = defaultdict(list)
+    pending_update_events = {}
+    # Last sent `fields` for events in `DIFF` mode
+    last_fields = defaultdict(dict)
 
     @accepts(Dict(
         "options",
@@ -20,39 +27,84 @@ class DatastoreService(Service):
         Dict("extra", additional_attrs=True),
         Str("id", default="id"),
         Str("process_event", null=True, default=None),
+        Str("mode", enum=["FULL", "DIFF"], default="FULL"),
         strict=True,
     ))
     async def register_event(self, options):
+        """
+        Send `{plugin}.query` events when `datastore` rows are inserted, updated or deleted.
+
+        In `DIFF` mode `CHANGED` events only include the fields that have changed since the previous event for the
+        same row.
+        """
         self.events[options["datastore"]].append(options)
 
         self.middleware.event_register(f"{options['plugin']}.query", options["description"])
 
     async def send_insert_events(self, datastore, row):
         for options in self.events[datastore]:
+            if not self._has_listeners(options):
+                continue
+
+            fields = await self._fields(options, row)
+            self._diff(options, row[options["prefix"] + options["id"]], fields)
             await self._send_event(
                 options,
                 "ADDED",
                 id=row[options["prefix"] + options["id"]],
-                fields=await self._fields(options, row),
+                fields=fields,
             )
 
     async def send_update_events(self, datastore, id):
+        if not self.events[datastore]:
+            return
+
+        key = datastore, id
+        if key not in self.pending_update_events:
+            self.pending_update_events[key] = asyncio.get_event_loop().call_later(
+                UPDATE_EVENTS_INTERVAL, lambda: asyncio.ensure_future(self._send_pending_update_events(datastore, id)),
+            )
+
+    async def _send_pending_update_events(self, datastore, id):
+        self.pending_update_events.pop((datastore, id), None)
+
+        try:
+            await self._send_update_events(datastore, id)
+        except Exception:
+            self.logger.error("Unhandled exception sending %r update events for %r", datastore, id, exc_info=True)
+
+    async def _send_update_events(self, datastore, id):
         for options in self.events[datastore]:
+            if not self._has_listeners(options):
+                # Previous fields will be outdated when someone subscribes
+                self._last_fields(options).pop(id, None)
+                continue
+
             fields = await self._fields(options, {options["prefix"] + options["id"]: id}, False)
             if not fields:
                 # It is possible the row in question got deleted with the update
                 # event still pending, in this case we skip sending update event
                 continue
 
+            fields = self._diff(options, id, fields[0])
+            if not fields:
+                continue
+
             await self._send_event(
                 options,
                 "CHANGED",
                 id=id,
-                fields=fields[0],
+                fields=fields,
             )
 
     async def send_delete_events(self, datastore, id):
+        pending_update_event = self.pending_update_events.pop((datastore, id), None)
+        if pending_update_event is not None:
+            pending_update_event.cancel()
+
         for options in self.events[datastore]:
+            self._last_fields(options).pop(id, None)
+
             await self._send_event(
                 options,
                 "CHANGED",
@@ -61,6 +113,24 @@ class DatastoreService(Service):
             )
             await self._send_event(options, "REMOVED", id=id)
 
+    def _has_listeners(self, options):
+        return bool(options["process_event"]) or self.middleware.has_event_subscribers(f"{options['plugin']}.query")
+
+    def _last_fields(self, options):
+        return self.last_fields[(options["datastore"], options["plugin"])]
+
+    def _diff(self, options, id, fields):
+        if options["mode"] != "DIFF":
+            return fields
+
+        last_fields = self._last_fields(options)
+        previous = last_fields.get(id)
+        last_fields[id] = fields
+        if previous is None:
+            return fields
+
+        return {k: v for k, v in fields.items() if k not in previous or previous[k] != v}
+
     async def _fields(self, options, row, get=True):
         query_options = {"get": get}
         if options.get("extra"):
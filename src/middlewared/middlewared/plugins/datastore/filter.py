@@ -1,28 +1,77 @@
+import functools
 import operator
 
+from sqlalchemy import bindparam
+
 from .schema import SchemaMixin
 
+IN_OPERATORS = ('in', 'nin')
+
+
+def split_nulls(value):
+    return None in value, [v for v in value if v is not None]
+
+
+def bind_param(col, params, value, expanding=False):
+    if value is None or isinstance(value, bool):
+        # These are rendered as SQL constants
+        return value
+
+    params.append(value)
+    return bindparam(f'filter_{len(params)}', value, type_=col.type, expanding=expanding)
 
-def in_(col, value):
-    has_nulls = None in value
-    value = [v for v in value if v is not None]
-    expr = col.in_(value)
+
+def in_(col, value, bind=None):
+    has_nulls, value = split_nulls(value)
+    expr = col.in_(bind(value) if bind and value else value)
     if has_nulls:
         expr = expr | (col == None)  # noqa
     return expr
 
 
-def nin(col, value):
-    has_nulls = None in value
-    value = [v for v in value if v is not None]
-    expr = ~col.in_(value)
+def nin(col, value, bind=None):
+    has_nulls, value = split_nulls(value)
+    expr = ~col.in_(bind(value) if bind and value else value)
     if has_nulls:
         expr = expr & (col != None)  # noqa
     return expr
 
 
+def filters_shape(filters, params):
+    """
+    Returns a hashable representation of `filters` with all the values that `FilterMixin._filters_to_queryset` turns
+    into bind parameters replaced with their types. These values are appended to `params` in the same order.
+    Raises `TypeError` or `ValueError` for filters that can't be represented.
+    """
+    shape = []
+    for f in filters:
+        if len(f) == 2:
+            op, value = f
+            shape.append((op, filters_shape(value, params)))
+        elif len(f) == 3:
+            name, op, value = f
+            if op in IN_OPERATORS:
+                has_nulls, value = split_nulls(value)
+                if value:
+                    params.append(value)
+                shape.append((name, op, has_nulls, bool(value)))
+            elif value is None or isinstance(value, bool):
+                shape.append((name, op, value))
+            else:
+                params.append(value)
+                shape.append((name, op, type(value)))
+        else:
+            raise ValueError(f'Invalid filter {f}')
+
+    return tuple(shape)
+
+
 class FilterMixin(SchemaMixin):
-    def _filters_to_queryset(self, filters, table, prefix, aliases):
+    def _filters_to_queryset(self, filters, table, prefix, aliases, params=None):
+        """
+        When `params` list is given, filter values are replaced with named bind parameters (and appended to that list)
+        so that the compiled query can be reused with different values (see `filters_shape`).
+        """
         opmap = {
             '=': operator.eq,
             '!=': operator.ne,
@@ -53,13 +102,18 @@ class FilterMixin(SchemaMixin):
                 if op not in opmap:
                     raise ValueError('Invalid operation: {0}'.format(op))
 
-                q = opmap[op](col, value)
+                if params is None:
+                    q = opmap[op](col, value)
+                elif op in IN_OPERATORS:
+                    q = opmap[op](col, value, functools.partial(bind_param, col, params, expanding=True))
+                else:
+                    q = opmap[op](col, bind_param(col, params, value))
                 rv.append(q)
             elif len(f) == 2:
                 op, value = f
                 if op == 'OR':
                     or_value = None
-                    for value in self._filters_to_queryset(value, table, prefix, aliases):
+                    for value in self._filters_to_queryset(value, table, prefix, aliases, params):
                         if or_value is None:
                             or_value = value
                         else:
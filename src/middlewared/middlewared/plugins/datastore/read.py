@@ -1,7 +1,8 @@
 from collections import defaultdict
 import re
+import time
 
-from sqlalchemy import and_, func, select
+from sqlalchemy import and_, bindparam, func, select
 from sqlalchemy.sql import Alias
 from sqlalchemy.sql.elements import UnaryExpression
 from sqlalchemy.sql.expression import nullsfirst, nullslast
@@ -11,7 +12,8 @@ from middlewared.schema import accepts, Bool, Dict, Int, List, Ref, Str
 from middlewared.service import Service
 from middlewared.service_exception import MatchNotFound
 
-from .filter import FilterMixin
+from .cache import query_cache, table_cache
+from .filter import FilterMixin, filters_shape
 from .schema import SchemaMixin
 
 
@@ -25,6 +27,11 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
     class Config:
         private = True
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.extend_timings = defaultdict(lambda: {'queries': 0, 'rows': 0, 'time': 0.0})
+        self.joins = {}
+
     @accepts(
         Str('name'),
         List('query-filters', register=True),
@@ -33,6 +40,7 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
             Bool('relationships', default=True),
             Str('extend', default=None, null=True),
             Str('extend_context', default=None, null=True),
+            Str('extend_batch', default=None, null=True),
             Str('prefix', default=None, null=True),
             Dict('extra', additional_attrs=True),
             List('order_by'),
@@ -44,11 +52,17 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
             Bool('force_sql_filters', default=False),
             register=True,
         ),
+        trusted_internal=True,
     )
     async def query(self, name, filters, options):
         """
         Query for items in a given collection `name`.
 
+        `extend` is a method that will be called for each returned row (with the value returned by `extend_context`
+        method as a second argument if it is specified). `extend_batch` is a method that will be called once with the
+        list of all returned rows (and the same optional context) and must return the list of extended rows. It is used
+        instead of `extend` when specified.
+
         `filters` is a list which each entry can be in one of the following formats:
 
             entry: simple_filter | conjuntion
@@ -83,13 +97,102 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         options = options.copy()
 
         aliases = {}
+        if options['relationships'] and not options['count']:
+            aliases = self._get_joins(table)
+
+        cache_key = table_cache.key(table.name, filters, options)
+        if cache_key is None:
+            result = await self._fetch(table, aliases, filters, options)
+        else:
+            hit, result = table_cache.get(
+                table.name, cache_key,
+                {table.name} | {self._get_original_table(alias).name for alias in aliases.values()},
+            )
+            if not hit:
+                generation = result
+                result = await self._fetch(table, aliases, filters, options)
+                table_cache.put(table.name, cache_key, result, generation)
+
+        if options['count']:
+            return result
+
+        relationships = [{} for row in result]
+        if options['relationships']:
+            # This will only fetch many-to-many relationships for primary table, not for joins, but that's enough
+            relationships = await self._fetch_many_to_many(table, result)
+
+        result = await self._queryset_serialize(
+            result,
+            table, aliases, relationships, options['extend'], options['extend_context'], options['extend_batch'],
+            options['prefix'], options['select'], options['extra'],
+        )
+
+        if options['get']:
+            try:
+                return result[0]
+            except IndexError:
+                raise MatchNotFound() from None
+
+        return result
+
+    @accepts(Str('name'), Ref('query-options'), trusted_internal=True)
+    async def config(self, name, options):
+        """
+        Get configuration settings object for a given `name`.
+
+        This is a shortcut for `query(name, {"get": true})`.
+        """
+        options['get'] = True
+        return await self.query(name, [], options)
+
+    async def _fetch(self, table, aliases, filters, options):
+        if query_cache.dialect is not None:
+            values = []
+            try:
+                key = (
+                    table.name, options['relationships'], options['count'], options['prefix'],
+                    filters_shape(filters, values), tuple(options['order_by']),
+                    bool(options['offset'] or options['limit']),
+                )
+                hash(key)
+            except (TypeError, ValueError):
+                pass
+            else:
+                params = {f'filter_{i + 1}': value for i, value in enumerate(values)}
+                if options['offset'] or options['limit']:
+                    params.update(self._limit_params(options))
+
+                compiled = query_cache.get(key)
+                if compiled is None:
+                    compiled, cached = query_cache.compile(key, self._build_query(table, aliases, filters, options, []),
+                                                           params)
+                    if not cached:
+                        params = {}
+
+                return self._fetch_result(await self.middleware.call("datastore.fetchall", compiled, params), options)
+
+        return self._fetch_result(
+            await self.middleware.call("datastore.fetchall", self._build_query(table, aliases, filters, options)),
+            options,
+        )
+
+    def _fetch_result(self, rows, options):
+        if options['count']:
+            return rows[0][0]
+
+        return rows
+
+    def _build_query(self, table, aliases, filters, options, params=None):
+        """
+        When `params` list is given, filter values, `offset` and `limit` are passed as named bind parameters so the
+        compiled statement can be cached.
+        """
         if options['count']:
             qs = select([func.count(self._get_pk(table))])
         else:
             columns = list(table.c)
             from_ = table
             if options['relationships']:
-                aliases = self._get_queryset_joins(table)
                 for foreign_key, alias in aliases.items():
                     columns.extend(list(alias.c))
                     from_ = from_.outerjoin(alias, alias.c[foreign_key.column.name] == foreign_key.parent)
@@ -99,10 +202,10 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         prefix = options['prefix']
 
         if filters:
-            qs = qs.where(and_(*self._filters_to_queryset(filters, table, prefix, aliases)))
+            qs = qs.where(and_(*self._filters_to_queryset(filters, table, prefix, aliases, params)))
 
         if options['count']:
-            return (await self.middleware.call("datastore.fetchall", qs))[0][0]
+            return qs
 
         order_by = options['order_by']
         if order_by:
@@ -148,42 +251,35 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
 
             qs = qs.order_by(*order_by)
 
-        if options['offset']:
-            qs = qs.offset(options['offset'])
+        if params is None:
+            if options['offset']:
+                qs = qs.offset(options['offset'])
 
-        if options['limit']:
-            qs = qs.limit(options['limit'])
+            if options['limit']:
+                qs = qs.limit(options['limit'])
+        elif options['offset'] or options['limit']:
+            # SQLite always renders both, missing one as a constant
+            limit_params = self._limit_params(options)
+            qs = qs.limit(bindparam('limit', limit_params['limit'])).offset(bindparam('offset', limit_params['offset']))
 
-        result = await self.middleware.call("datastore.fetchall", qs)
+        return qs
 
-        relationships = [{} for row in result]
-        if options['relationships']:
-            # This will only fetch many-to-many relationships for primary table, not for joins, but that's enough
-            relationships = await self._fetch_many_to_many(table, result)
+    def _limit_params(self, options):
+        return {'limit': options['limit'] or -1, 'offset': options['offset']}
 
-        result = await self._queryset_serialize(
-            result,
-            table, aliases, relationships, options['extend'], options['extend_context'], options['prefix'],
-            options['select'], options['extra'],
-        )
+    def _get_original_table(self, table):
+        while isinstance(table, Alias):
+            table = table.original
 
-        if options['get']:
-            try:
-                return result[0]
-            except IndexError:
-                raise MatchNotFound() from None
+        return table
 
-        return result
-
-    @accepts(Str('name'), Ref('query-options'))
-    async def config(self, name, options):
-        """
-        Get configuration settings object for a given `name`.
-
-        This is a shortcut for `query(name, {"get": true})`.
-        """
-        options['get'] = True
-        return await self.query(name, [], options)
+    def _get_joins(self, table):
+        # Schema does not change at runtime. Compiled statements cached by `query_cache` refer to these aliases
+        try:
+            return self.joins[table.name]
+        except KeyError:
+            self.joins[table.name] = joins = self._get_queryset_joins(table)
+            return joins
 
     def _get_queryset_joins(self, table):
         result = {}
@@ -202,21 +298,37 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         return result
 
     async def _queryset_serialize(
-        self, qs, table, aliases, relationships, extend, extend_context, field_prefix, select, extra_options,
+        self, qs, table, aliases, relationships, extend, extend_context, extend_batch, field_prefix, select,
+        extra_options,
     ):
         rows = []
         for i, row in enumerate(qs):
             rows.append(self._serialize(row, table, aliases, relationships[i], field_prefix))
 
-        if extend_context:
-            extend_context_value = await self.middleware.call(extend_context, rows, extra_options)
-        else:
-            extend_context_value = None
+        if extend or extend_batch:
+            started_at = time.monotonic()
+
+            if extend_context:
+                extend_context_value = await self.middleware.call(extend_context, rows, extra_options)
+            else:
+                extend_context_value = None
+
+            if extend_batch:
+                rows = await self.middleware.call(
+                    extend_batch, rows, *([extend_context_value] if extend_context else [])
+                )
+            else:
+                rows = [await self._extend(data, extend, extend_context, extend_context_value) for data in rows]
+
+            timings = self.extend_timings[table.name]
+            timings['queries'] += 1
+            timings['rows'] += len(rows)
+            timings['time'] += time.monotonic() - started_at
 
-        return [
-            await self._extend(data, extend, extend_context, extend_context_value, select)
-            for data in rows
-        ]
+        if not select:
+            return rows
+        else:
+            return [{k: v for k, v in data.items() if k in select} for data in rows]
 
     def _serialize(self, obj, table, aliases, relationships, field_prefix):
         data = self._serialize_row(obj, table, aliases)
@@ -224,17 +336,18 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
 
         return {self._strip_prefix(k, field_prefix): v for k, v in data.items()}
 
-    async def _extend(self, data, extend, extend_context, extend_context_value, select):
-        if extend:
-            if extend_context:
-                data = await self.middleware.call(extend, data, extend_context_value)
-            else:
-                data = await self.middleware.call(extend, data)
-
-        if not select:
-            return data
+    async def _extend(self, data, extend, extend_context, extend_context_value):
+        if extend_context:
+            return await self.middleware.call(extend, data, extend_context_value)
         else:
-            return {k: v for k, v in data.items() if k in select}
+            return await self.middleware.call(extend, data)
+
+    async def extend_stats(self):
+        """
+        Returns the number of queries, extended rows and total time (in seconds) spent in the extend phase
+        (`extend_context` and `extend`/`extend_batch` methods) for each table.
+        """
+        return {k: dict(v) for k, v in self.extend_timings.items()}
 
     def _strip_prefix(self, k, field_prefix):
         return k[len(field_prefix):] if field_prefix and k.startswith(field_prefix) else k
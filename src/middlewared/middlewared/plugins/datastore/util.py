@@ -42,6 +42,16 @@ class DatastoreService(Service, SchemaMixin):
         except Exception as e:
             raise CallError(e)
 
+    @private
+    async def sql_batch(self, queries):
+        """
+        Execute a list of `[query, params]` in a single transaction (used to replicate `datastore.bulk_write`).
+        """
+        try:
+            await self.middleware.call('datastore.execute_batch', queries)
+        except Exception as e:
+            raise CallError(e)
+
     @accepts()
     async def dump_json(self):
         models = []
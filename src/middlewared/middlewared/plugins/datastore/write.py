@@ -1,7 +1,7 @@
 from sqlalchemy import and_, types
 from sqlalchemy.sql import sqltypes
 
-from middlewared.schema import accepts, Any, Bool, Dict, Str
+from middlewared.schema import accepts, Any, Bool, Dict, List, Str
 from middlewared.service import Service
 
 from .filter import FilterMixin
@@ -27,17 +27,10 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         Insert a new entry to `name`.
         """
         table = self._get_table(name)
-        insert, relationships = self._extract_relationships(table, options['prefix'], data)
-
-        for column in table.c:
-            if column.default is not None:
-                insert.setdefault(column.name, column.default.arg)
-            if not column.nullable:
-                if isinstance(column.type, (types.String, types.Text)):
-                    insert.setdefault(column.name, '')
+        insert, relationships = self._prepare_insert(table, options['prefix'], data)
 
         pk_column = self._get_pk(table)
-        return_last_insert_rowid = type(pk_column.type) == sqltypes.Integer
+        return_last_insert_rowid = type(pk_column.type) is sqltypes.Integer
         result = await self.middleware.call(
             'datastore.execute_write',
             table.insert().values(**insert),
@@ -72,23 +65,8 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         Update an entry `id` in `name`.
         """
         table = self._get_table(name)
-        data = data.copy()
-
-        if isinstance(id_or_filters, list):
-            rows = await self.middleware.call('datastore.query', name, id_or_filters, {'prefix': options['prefix']})
-            if len(rows) != 1:
-                raise RuntimeError(f'{len(rows)} found, expecting one')
-
-            id = rows[0][self._get_pk(table).name]
-        else:
-            id = id_or_filters
-
-        for column in table.c:
-            if column.foreign_keys:
-                if column.name[:-3] in data:
-                    data[column.name] = data.pop(column.name[:-3])
-
-        update, relationships = self._extract_relationships(table, options['prefix'], data)
+        id = await self._get_id(name, table, id_or_filters, options['prefix'])
+        update, relationships = self._prepare_update(table, options['prefix'], data)
 
         if update:
             result = await self.middleware.call(
@@ -107,6 +85,38 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
 
         return id
 
+    async def _get_id(self, name, table, id_or_filters, prefix):
+        if isinstance(id_or_filters, list):
+            rows = await self.middleware.call('datastore.query', name, id_or_filters, {'prefix': prefix})
+            if len(rows) != 1:
+                raise RuntimeError(f'{len(rows)} found, expecting one')
+
+            return rows[0][self._get_pk(table).name]
+
+        return id_or_filters
+
+    def _prepare_insert(self, table, prefix, data):
+        insert, relationships = self._extract_relationships(table, prefix, data)
+
+        for column in table.c:
+            if column.default is not None:
+                insert.setdefault(column.name, column.default.arg)
+            if not column.nullable:
+                if isinstance(column.type, (types.String, types.Text)):
+                    insert.setdefault(column.name, '')
+
+        return insert, relationships
+
+    def _prepare_update(self, table, prefix, data):
+        data = data.copy()
+
+        for column in table.c:
+            if column.foreign_keys:
+                if column.name[:-3] in data:
+                    data[column.name] = data.pop(column.name[:-3])
+
+        return self._extract_relationships(table, prefix, data)
+
     def _extract_relationships(self, table, prefix, data):
         relationships = self._get_relationships(table)
 
@@ -122,6 +132,12 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
         return insert, insert_relationships
 
     async def _handle_relationships(self, pk, relationships):
+        stmts = self._relationships_statements(pk, relationships)
+        if stmts:
+            await self.middleware.call('datastore.execute_write_batch', stmts)
+
+    def _relationships_statements(self, pk, relationships):
+        stmts = []
         for relationship, values in relationships:
             assert len(relationship.synchronize_pairs) == 1
             assert len(relationship.secondary_synchronize_pairs) == 1
@@ -129,19 +145,18 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
             local_pk, relationship_local_pk = relationship.synchronize_pairs[0]
             remote_pk, relationship_remote_pk = relationship.secondary_synchronize_pairs[0]
 
-            await self.middleware.call(
-                'datastore.execute_write',
-                relationship_local_pk.table.delete().where(relationship_local_pk == pk)
-            )
+            stmts.append(relationship_local_pk.table.delete().where(relationship_local_pk == pk))
 
-            for value in values:
-                await self.middleware.call(
-                    'datastore.execute_write',
-                    relationship_local_pk.table.insert().values({
+            if values:
+                stmts.append(relationship_local_pk.table.insert().values([
+                    {
                         relationship_local_pk.name: pk,
                         relationship_remote_pk.name: value,
-                    })
-                )
+                    }
+                    for value in values
+                ]))
+
+        return stmts
 
     def _where_clause(self, table, id_or_filters, options):
         if isinstance(id_or_filters, list):
@@ -177,3 +192,122 @@ class DatastoreService(Service, FilterMixin, SchemaMixin):
             await self.middleware.call('datastore.send_delete_events', name, id_or_filters)
 
         return True
+
+    @accepts(
+        List('operations', items=[
+            Dict(
+                'operation',
+                Str('type', enum=['INSERT', 'UPDATE', 'DELETE'], required=True),
+                Str('name', required=True),
+                Any('id', null=True, default=None),
+                Dict('data', additional_attrs=True),
+                Str('prefix', default=''),
+            ),
+        ]),
+        Dict(
+            'options',
+            Bool('ha_sync', default=True),
+        ),
+    )
+    async def bulk_write(self, operations, options):
+        """
+        Run a list of `INSERT`, `UPDATE` and `DELETE` `operations` in a single transaction: either all of them are
+        applied or none of them are. `id` is an id or a list of filters for `UPDATE` and `DELETE` operations (like in
+        `datastore.update` and `datastore.delete`).
+
+        All the queries are replicated to the other controller as a single batch. Events are coalesced, i.e. a row
+        that was updated several times only gets one `CHANGED` event.
+
+        Returns a list with the result of each operation (the same values `datastore.insert`, `datastore.update` and
+        `datastore.delete` return).
+        """
+        stmts = []
+        changes = []
+        pks = []
+        for operation in operations:
+            name = operation['name']
+            table = self._get_table(name)
+            prefix = operation['prefix']
+
+            if operation['type'] == 'INSERT':
+                insert, relationships = self._prepare_insert(table, prefix, operation['data'])
+
+                pk_column = self._get_pk(table)
+                if type(pk_column.type) is sqltypes.Integer:
+                    pk = self._lastrowid(len(stmts))
+                else:
+                    pk = self._value(insert[pk_column.name])
+
+                stmts.append(table.insert().values(**insert))
+                if relationships:
+                    stmts.append(self._relationships_callback(pk, relationships))
+
+                changes.append(('INSERT', name, pk, insert, pk_column.name))
+            elif operation['type'] == 'UPDATE':
+                id = await self._get_id(name, table, operation['id'], prefix)
+                update, relationships = self._prepare_update(table, prefix, operation['data'])
+                pk = self._value(id)
+
+                if update:
+                    stmts.append(table.update().values(**update).where(self._where_clause(table, id, {'prefix': prefix})))
+                    stmts.append(self._check_updated_callback(len(stmts) - 1))
+                    changes.append(('UPDATE', name, pk, None, None))
+
+                if relationships:
+                    stmts.append(self._relationships_callback(pk, relationships))
+            else:
+                stmts.append(table.delete().where(self._where_clause(table, operation['id'], {'prefix': prefix})))
+                pk = self._value(True)
+
+                # FIXME: Sending events for batch deletes not implemented yet
+                if not isinstance(operation['id'], list):
+                    changes.append(('DELETE', name, self._value(operation['id']), None, None))
+
+            pks.append(pk)
+
+        results = await self.middleware.call('datastore.execute_write_batch', stmts, {'ha_sync': options['ha_sync']})
+
+        await self._send_bulk_events(changes, results)
+
+        return [pk(results) for pk in pks]
+
+    def _value(self, value):
+        return lambda results: value
+
+    def _lastrowid(self, index):
+        return lambda results: results[index].lastrowid
+
+    def _relationships_callback(self, pk, relationships):
+        return lambda results: self._relationships_statements(pk(results), relationships)
+
+    def _check_updated_callback(self, index):
+        def check(results):
+            if results[index].rowcount != 1:
+                raise RuntimeError('No rows were updated')
+
+            return []
+
+        return check
+
+    async def _send_bulk_events(self, changes, results):
+        events = {}
+        for event_type, name, pk, insert, pk_name in changes:
+            id = pk(results)
+            key = name, id
+            if event_type == 'INSERT':
+                events[key] = event_type, dict(insert, **{pk_name: id})
+            elif event_type == 'UPDATE':
+                events.setdefault(key, (event_type, None))
+            elif events.get(key, (None,))[0] == 'INSERT':
+                # Row was inserted and deleted by the same batch
+                events.pop(key)
+            else:
+                events[key] = event_type, None
+
+        for (name, id), (event_type, row) in events.items():
+            if event_type == 'INSERT':
+                await self.middleware.call('datastore.send_insert_events', name, row)
+            elif event_type == 'UPDATE':
+                await self.middleware.call('datastore.send_update_events', name, id)
+            else:
+                await self.middleware.call('datastore.send_delete_events', name, id)
@@ -52,6 +52,11 @@ class DiskService(CRUDService):
         datastore_prefix = 'disk_'
         datastore_extend = 'disk.disk_extend'
         datastore_extend_context = 'disk.disk_extend_context'
+        datastore_raw_fields = (
+            'identifier', 'name', 'subsystem', 'number', 'serial', 'lunid', 'description', 'transfermode',
+            'togglesmart', 'smartoptions', 'expiretime', 'critical', 'difference', 'informational', 'model',
+            'rotationrate', 'type', 'zfs_guid', 'bus',
+        )
         datastore_primary_key = 'identifier'
         datastore_primary_key_type = 'string'
         event_register = False
@@ -77,6 +77,9 @@ class DiskService(Service, ServiceChangeMixin):
 
         seen_disks = {}
         changed = False
+        # Database is updated using as few transactions as possible, it is very slow on HA systems with lots of drives
+        operations = []
+        enclosure_sync = []
         encs = await self.middleware.call('enclosure.query')
         for disk in (
             await self.middleware.call('datastore.query', 'storage.disk', [], {'order_by': ['disk_expiretime']})
@@ -92,7 +95,7 @@ class DiskService(Service, ServiceChangeMixin):
                 # If we cant translate the identifier to a device, give up
                 if not disk['disk_expiretime']:
                     disk['disk_expiretime'] = datetime.utcnow() + timedelta(days=self.DISK_EXPIRECACHE_DAYS)
-                    await self.middleware.call('datastore.update', 'storage.disk', disk['disk_identifier'], disk)
+                    operations.append(self._update_operation(disk))
                     changed = True
                 elif disk['disk_expiretime'] < datetime.utcnow():
                     # Disk expire time has surpassed, go ahead and remove it
@@ -100,7 +103,7 @@ class DiskService(Service, ServiceChangeMixin):
                         asyncio.ensure_future(self.middleware.call(
                             'kmip.reset_sed_disk_password', disk['disk_identifier'], disk['disk_kmip_uid']
                         ))
-                    await self.middleware.call('datastore.delete', 'storage.disk', disk['disk_identifier'])
+                    operations.append({'type': 'DELETE', 'name': 'storage.disk', 'id': disk['disk_identifier']})
                     changed = True
                 continue
             else:
@@ -117,23 +120,28 @@ class DiskService(Service, ServiceChangeMixin):
             # Do not issue unnecessary updates, they are slow on HA systems and cause severe boot delays
             # when lots of drives are present
             if self._disk_changed(disk, original_disk):
-                await self.middleware.call('datastore.update', 'storage.disk', disk['disk_identifier'], disk)
+                operations.append(self._update_operation(disk))
                 changed = True
 
-            try:
-                await self.middleware.call('enclosure.sync_disk', disk['disk_identifier'], encs)
-            except Exception:
-                self.middleware.logger.error('Unhandled exception in enclosure.sync_disk for %r',
-                                             disk['disk_identifier'], exc_info=True)
+            enclosure_sync.append(disk['disk_identifier'])
 
             seen_disks[name] = disk
 
+        # Disks that are not seen yet are looked up by identifier, deleted disks must not be found
+        await self._bulk_write(operations)
+
+        # Disks inserted by this batch are not in the database yet but other system disks (e.g. multipath members or
+        # disks with duplicate serial numbers) might have the same identifier, these must be updated instead
+        pending_inserts = {}
         for name in sys_disks:
             if name not in seen_disks:
                 disk_identifier = await self.middleware.call('disk.device_to_identifier', name, sys_disks)
-                qs = await self.middleware.call(
-                    'datastore.query', 'storage.disk', [('disk_identifier', '=', disk_identifier)]
-                )
+                if disk_identifier in pending_inserts:
+                    qs = [pending_inserts[disk_identifier].copy()]
+                else:
+                    qs = await self.middleware.call(
+                        'datastore.query', 'storage.disk', [('disk_identifier', '=', disk_identifier)]
+                    )
                 if qs:
                     new = False
                     disk = qs[0]
@@ -148,22 +156,37 @@ class DiskService(Service, ServiceChangeMixin):
                     # Do not issue unnecessary updates, they are slow on HA systems and cause severe boot delays
                     # when lots of drives are present
                     if self._disk_changed(disk, original_disk):
-                        await self.middleware.call('datastore.update', 'storage.disk', disk['disk_identifier'], disk)
+                        operations.append(self._update_operation(disk))
                         changed = True
                 else:
-                    await self.middleware.call('datastore.insert', 'storage.disk', disk)
+                    operations.append({'type': 'INSERT', 'name': 'storage.disk', 'data': disk})
+                    pending_inserts[disk_identifier] = disk
                     changed = True
 
-                try:
-                    await self.middleware.call('enclosure.sync_disk', disk['disk_identifier'], encs)
-                except Exception:
-                    self.middleware.logger.error('Unhandled exception in enclosure.sync_disk for %r',
-                                                 disk['disk_identifier'], exc_info=True)
+                enclosure_sync.append(disk['disk_identifier'])
+
+        await self._bulk_write(operations)
+
+        # `enclosure.sync_disk` reads disks from the database so it can only be run after they were written
+        for disk_identifier in enclosure_sync:
+            try:
+                await self.middleware.call('enclosure.sync_disk', disk_identifier, encs)
+            except Exception:
+                self.middleware.logger.error('Unhandled exception in enclosure.sync_disk for %r',
+                                             disk_identifier, exc_info=True)
 
         if changed:
             await self.middleware.call('disk.restart_services_after_sync')
         return 'OK'
 
+    def _update_operation(self, disk):
+        return {'type': 'UPDATE', 'name': 'storage.disk', 'id': disk['disk_identifier'], 'data': disk}
+
+    async def _bulk_write(self, operations):
+        if operations:
+            await self.middleware.call('datastore.bulk_write', operations)
+            operations.clear()
+
     def _disk_changed(self, disk, original_disk):
         # storage_disk.disk_size is a string
         return dict(disk, disk_size=None if disk.get('disk_size') is None else str(disk['disk_size'])) != original_disk
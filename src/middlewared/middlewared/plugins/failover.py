@@ -18,7 +18,6 @@ from middlewared.service import (
 import middlewared.sqlalchemy as sa
 from middlewared.plugins.auth import AuthService, SessionManagerCredentials
 from middlewared.plugins.config import FREENAS_DATABASE
-from middlewared.plugins.datastore.connection import DatastoreService
 from middlewared.utils.contextlib import asyncnullcontext
 
 ENCRYPTION_CACHE_LOCK = asyncio.Lock()
@@ -399,11 +398,12 @@ class FailoverService(ConfigService):
 
     @private
     async def send_database(self):
-        await self.middleware.run_in_executor(DatastoreService.thread_pool, self._send_database)
+        await self.middleware.call('datastore.checkpoint', self._send_database)
 
     def _send_database(self):
-        # We are in the `DatastoreService` thread so until the end of this method an item that we put into `SQL_QUEUE`
-        # will be the last one and no one else is able to write neither to the database nor to the journal.
+        # We are in the `DatastoreService` thread (right after the WAL checkpoint) so until the end of this method an
+        # item that we put into `SQL_QUEUE` will be the last one and no one else is able to write neither to the
+        # database nor to the journal.
 
         # Journal thread will see that this is special value and will clear journal.
         SQL_QUEUE.put(None)
@@ -414,8 +414,7 @@ class FailoverService(ConfigService):
 
     @private
     def receive_database(self):
-        os.rename(FREENAS_DATABASE + '.sync', FREENAS_DATABASE)
-        self.middleware.call_sync('datastore.setup')
+        self.middleware.call_sync('datastore.replace_database', FREENAS_DATABASE + '.sync')
 
     @private
     def send_small_file(self, path, dest=None):
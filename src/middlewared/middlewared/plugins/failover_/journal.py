@@ -76,10 +76,17 @@ class JournalSync:
 
     def _flush_journal(self):
         while self.journal:
-            query, params = self.journal.peek()
+            item = self.journal.peek()
+            if isinstance(item, list):
+                # Queries of a single `datastore.bulk_write` call
+                method, args = 'datastore.sql_batch', [item]
+                query = '; '.join(query for query, params in item)
+            else:
+                query, params = item
+                method, args = 'datastore.sql', [query, params]
 
             try:
-                self.middleware.call_sync('failover.call_remote', 'datastore.sql', [query, params])
+                self.middleware.call_sync('failover.call_remote', method, args)
             except Exception as e:
                 if isinstance(e, CallError) and e.errno in [ECONNREFUSED, ECONNRESET]:
                     logger.trace('Skipping journal sync, node down')
@@ -117,8 +124,9 @@ class JournalSync:
             elif self.failover_status == 'MASTER':
                 self.journal.append(item)
             else:
-                query, params = item
-                logger.warning('Node status %s but executed SQL query: %s', self.failover_status, query)
+                queries = item if isinstance(item, list) else [item]
+                for query, params in queries:
+                    logger.warning('Node status %s but executed SQL query: %s', self.failover_status, query)
 
     def _update_failover_status(self):
         self.failover_status = self.middleware.call_sync('failover.status')
@@ -162,8 +170,9 @@ class Journal:
         return bool(self.journal)
 
     def __iter__(self):
-        for query, params in self.journal:
-            yield query, params
+        for item in self.journal:
+            for query, params in (item if isinstance(item, list) else [item]):
+                yield query, params
 
     def __len__(self):
         return len(self.journal)
@@ -238,6 +247,13 @@ def hook_datastore_execute_write(middleware, sql, params, options):
     SQL_QUEUE.put((sql, params))
 
 
+def hook_datastore_execute_write_batch(middleware, queries, options):
+    if not options['ha_sync'] or not queries:
+        return
+
+    SQL_QUEUE.put([(sql, params) for sql, params in queries])
+
+
 async def _event_system(middleware, *args, **kwargs):
     global JOURNAL_THREAD
     licensed = await middleware.call('failover.licensed')
@@ -251,5 +267,6 @@ async def setup(middleware):
         return
 
     middleware.register_hook('datastore.post_execute_write', hook_datastore_execute_write, inline=True)
+    middleware.register_hook('datastore.post_execute_write_batch', hook_datastore_execute_write_batch, inline=True)
     middleware.register_hook('system.post_license_update', _event_system)  # catch license change
     ensure_future(_event_system(middleware))  # start thread on middlewared service start/restart
@@ -14,7 +14,8 @@ from middlewared.service import CallError, Service, job, private
 from middlewared.utils import start_daemon_thread
 from middlewared.utils.osc import set_thread_name
 
-
+# Failover plugin registers its remote events callbacks before the remote client is connected
+SETUP_DEPENDS = ['failover']
 logger = logging.getLogger('failover.remote')
 
 
@@ -13,10 +13,11 @@ import pyinotify
 from middlewared.event import EventSource
 from middlewared.plugins.pwenc import PWENC_FILE_SECRET
 from middlewared.plugins.cluster_linux.utils import CTDBConfig, FuseConfig
-from middlewared.plugins.filesystem_ import chflags, stat_x
+from middlewared.plugins.filesystem_ import acl_xattr, chflags, stat_x
 from middlewared.schema import accepts, Bool, Dict, Float, Int, List, Ref, returns, Path, Str
 from middlewared.service import private, CallError, filterable_returns, Service, job
 from middlewared.utils import filter_list
+from middlewared.utils.db import FREENAS_DATABASE
 
 
 class FilesystemService(Service):
@@ -132,7 +133,7 @@ class FilesystemService(Service):
           mode(int): file mode/permission
           uid(int): user id of entry owner
           gid(int): group id of entry onwer
-          acl(bool): extended ACL is present on file
+          acl(bool): extended ACL is present on file (only if `query-options.extra.acl` is set, `null` otherwise)
         """
         path = self.resolve_cluster_path(path)
         path = pathlib.Path(path)
@@ -142,49 +143,57 @@ class FilesystemService(Service):
         if not path.is_dir():
             raise CallError(f'Path {path} is not a directory', errno.ENOTDIR)
 
+        options = options or {}
+        acl = options.get('extra', {}).get('acl', False)
+
         rv = []
-        only_top_level = path.absolute() == pathlib.Path('/mnt')
-        for entry in path.iterdir():
-            if only_top_level and not entry.is_mount():
-                # sometimes (on failures) the top-level directory
-                # where the zpool is mounted does not get removed
-                # after the zpool is exported. WebUI calls this
-                # specifying `/mnt` as the path. This is used when
-                # configuring shares in the "Path" drop-down. To
-                # prevent shares from being configured to point to
-                # a path that doesn't exist on a zpool, we'll
-                # filter these here.
-                continue
-            if entry.is_symlink():
-                etype = 'SYMLINK'
-            elif entry.is_dir():
-                etype = 'DIRECTORY'
-            elif entry.is_file():
-                etype = 'FILE'
-            else:
-                etype = 'OTHER'
-
-            data = {
-                'name': entry.name,
-                'path': entry.as_posix().replace(
-                    f'{FuseConfig.FUSE_PATH_BASE.value}/', FuseConfig.FUSE_PATH_SUBST.value
-                ),
-                'realpath': entry.resolve().as_posix() if etype == 'SYMLINK' else entry.absolute().as_posix(),
-                'type': etype,
-            }
-            try:
-                stat = entry.stat()
-                data.update({
-                    'size': stat.st_size,
-                    'mode': stat.st_mode,
-                    'acl': False if self.acl_is_trivial(data["path"]) else True,
-                    'uid': stat.st_uid,
-                    'gid': stat.st_gid,
-                })
-            except FileNotFoundError:
-                data.update({'size': None, 'mode': None, 'acl': None, 'uid': None, 'gid': None})
-            rv.append(data)
-        return filter_list(rv, filters=filters or [], options=options or {})
+        path = path.absolute()
+        only_top_level = path == pathlib.Path('/mnt')
+        with os.scandir(path) as sdir:
+            for entry in sdir:
+                if only_top_level and not os.path.ismount(entry.path):
+                    # sometimes (on failures) the top-level directory
+                    # where the zpool is mounted does not get removed
+                    # after the zpool is exported. WebUI calls this
+                    # specifying `/mnt` as the path. This is used when
+                    # configuring shares in the "Path" drop-down. To
+                    # prevent shares from being configured to point to
+                    # a path that doesn't exist on a zpool, we'll
+                    # filter these here.
+                    continue
+
+                # Entry type comes from the directory entry itself (no extra syscalls on most filesystems)
+                if entry.is_symlink():
+                    etype = 'SYMLINK'
+                elif entry.is_dir():
+                    etype = 'DIRECTORY'
+                elif entry.is_file():
+                    etype = 'FILE'
+                else:
+                    etype = 'OTHER'
+
+                data = {
+                    'name': entry.name,
+                    'path': entry.path.replace(
+                        f'{FuseConfig.FUSE_PATH_BASE.value}/', FuseConfig.FUSE_PATH_SUBST.value
+                    ),
+                    'realpath': os.path.realpath(entry.path) if etype == 'SYMLINK' else entry.path,
+                    'type': etype,
+                }
+                try:
+                    stat = entry.stat()
+                    data.update({
+                        'size': stat.st_size,
+                        'mode': stat.st_mode,
+                        'acl': not acl_xattr.acl_is_trivial(entry.path) if acl else None,
+                        'uid': stat.st_uid,
+                        'gid': stat.st_gid,
+                    })
+                except FileNotFoundError:
+                    data.update({'size': None, 'mode': None, 'acl': None, 'uid': None, 'gid': None})
+                rv.append(data)
+
+        return filter_list(rv, filters=filters or [], options=options)
 
     @accepts(Str('path'))
     @returns(Dict(
@@ -261,6 +270,10 @@ class FilesystemService(Service):
 
         `content` must be a base 64 encoded file content.
         """
+        if path == FREENAS_DATABASE:
+            # Database file can't be overwritten while it is open, `failover.receive_database` must be used
+            raise CallError(f'{path} can not be received directly')
+
         dirname = os.path.dirname(path)
         if not os.path.exists(dirname):
             os.makedirs(dirname)
@@ -453,8 +466,7 @@ class FilesystemService(Service):
         if not os.path.exists(path):
             raise CallError(f'Path not found [{path}].', errno.ENOENT)
 
-        acl = self.middleware.call_sync('filesystem.getacl', path, True)
-        return acl['trivial']
+        return acl_xattr.acl_is_trivial(path)
 
 
 class FileFollowTailEventSource(EventSource):
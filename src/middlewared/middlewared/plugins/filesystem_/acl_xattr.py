@@ -0,0 +1,124 @@
+import errno
+import os
+import struct
+
+POSIX_ACL_ACCESS_XATTR = 'system.posix_acl_access'
+POSIX_ACL_DEFAULT_XATTR = 'system.posix_acl_default'
+NFS4_ACL_XATTR = 'system.nfs4_acl_xdr'
+
+# linux/posix_acl_xattr.h (native byte order is little-endian on all supported platforms)
+POSIX_ACL_XATTR_VERSION = 2
+POSIX_ACL_HEADER = struct.Struct('<I')  # version
+POSIX_ACL_ENTRY = struct.Struct('<HHI')  # tag, perm, id
+POSIX_ACL_TAGS = {0x01: 'USER_OBJ', 0x02: 'USER', 0x04: 'GROUP_OBJ', 0x08: 'GROUP', 0x10: 'MASK', 0x20: 'OTHER'}
+
+# nfs41acl.x (XDR encoding is big-endian)
+NFS4_ACL_HEADER = struct.Struct('>II')  # acl flags, number of aces
+NFS4_ACE = struct.Struct('>IIIII')  # type, flags, iflags, access mask, who
+NFS4_ACL_IS_TRIVIAL = 0x10000
+NFS4_ACE_IDENTIFIER_GROUP = 0x40
+NFS4_ACEI_SPECIAL_WHO = 0x1
+NFS4_SPECIAL_WHO = {1: 'owner@', 2: 'group@', 3: 'everyone@'}
+NFS4_ACE_TYPES = {0: 'ALLOW', 1: 'DENY', 2: 'AUDIT', 3: 'ALARM'}
+
+
+def decode_posix_acl(data, default=False):
+    """
+    Decode `system.posix_acl_access` (or `system.posix_acl_default` if `default` is set) xattr value into entries
+    in the same format as `filesystem.getacl` returns.
+    """
+    version, = POSIX_ACL_HEADER.unpack_from(data)
+    if version != POSIX_ACL_XATTR_VERSION:
+        raise ValueError(f'Unsupported POSIX ACL xattr version: {version}')
+
+    acl = []
+    for tag, perm, id in POSIX_ACL_ENTRY.iter_unpack(data[POSIX_ACL_HEADER.size:]):
+        tag = POSIX_ACL_TAGS[tag]
+        acl.append({
+            'default': default,
+            'tag': tag,
+            'id': id if tag in ('USER', 'GROUP') else -1,
+            'perms': {
+                'READ': bool(perm & 0x4),
+                'WRITE': bool(perm & 0x2),
+                'EXECUTE': bool(perm & 0x1),
+            },
+        })
+
+    return acl
+
+
+def decode_nfs4_acl(data):
+    """
+    Decode `system.nfs4_acl_xdr` xattr value. `trivial` is computed by ZFS which sets it when the ACL is equivalent to
+    the file mode.
+    """
+    acl_flags, count = NFS4_ACL_HEADER.unpack_from(data)
+    end = NFS4_ACL_HEADER.size + count * NFS4_ACE.size
+    if len(data) < end:
+        raise ValueError(f'NFSv4 ACL xattr is truncated: {count} entries do not fit in {len(data)} bytes')
+
+    aces = []
+    for type, flags, iflags, access_mask, who in NFS4_ACE.iter_unpack(data[NFS4_ACL_HEADER.size:end]):
+        if iflags & NFS4_ACEI_SPECIAL_WHO:
+            tag = NFS4_SPECIAL_WHO[who]
+            id = -1
+        else:
+            tag = 'GROUP' if flags & NFS4_ACE_IDENTIFIER_GROUP else 'USER'
+            id = who
+
+        aces.append({
+            'tag': tag,
+            'id': id,
+            'type': NFS4_ACE_TYPES[type],
+            'flags': flags,
+            'access_mask': access_mask,
+        })
+
+    return {
+        'acl_flags': acl_flags,
+        'trivial': bool(acl_flags & NFS4_ACL_IS_TRIVIAL),
+        'aces': aces,
+    }
+
+
+def _getxattr(path, name):
+    # Returns `None` if ACL is supported but absent
+    try:
+        return os.getxattr(path, name)
+    except OSError as e:
+        if e.errno == errno.ENODATA:
+            return None
+
+        raise
+
+
+def acl_is_trivial(path):
+    """
+    Returns True if the ACL of `path` can be fully expressed as a file mode. ACL type is detected the same way
+    `filesystem.path_get_acltype` does it and triviality is checked the same way `filesystem.getacl` does it but ACL
+    xattrs are decoded in-process instead of running `getfacl` / `nfs4xdr_getfacl`.
+    """
+    try:
+        data = _getxattr(path, POSIX_ACL_ACCESS_XATTR)
+    except OSError as e:
+        if e.errno != errno.EOPNOTSUPP:
+            raise
+    else:
+        # Any default ACL entries are not trivial. Minimal access ACL (`USER_OBJ`, `GROUP_OBJ` and `OTHER`) is usually
+        # not stored at all
+        if _getxattr(path, POSIX_ACL_DEFAULT_XATTR) is not None:
+            return False
+
+        return data is None or len(decode_posix_acl(data)) == 3
+
+    try:
+        data = _getxattr(path, NFS4_ACL_XATTR)
+    except OSError as e:
+        if e.errno == errno.EOPNOTSUPP:
+            # ACL support is disabled
+            return True
+
+        raise
+
+    return data is None or decode_nfs4_acl(data)['trivial']
@@ -13,6 +13,8 @@ import errno
 import os
 import subprocess
 
+# Setup only scans IPMI channels (which is slow) and no other plugin uses them
+SETUP_CONCURRENT = True
 channels = []
 
 
@@ -5,6 +5,8 @@ import os
 
 from middlewared.service import Service
 
+# `iscsi.host.injection` uses `iscsi.host` cache that is read in its setup
+SETUP_DEPENDS = ["iscsi_.host_crud"]
 CollectedHost = namedtuple("CollectedHost", ["ip", "iqn"])
 
 
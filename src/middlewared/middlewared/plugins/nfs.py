@@ -13,7 +13,7 @@ from middlewared.service import private, SharingService, SystemServiceService, V
 import middlewared.sqlalchemy as sa
 from middlewared.utils import osc
 from middlewared.utils.asyncio_ import asyncio_map
-from middlewared.utils.path import is_child
+from middlewared.utils.path import is_child, path_in_locked_datasets
 
 
 class NFSModel(sa.Model):
@@ -267,6 +267,10 @@ class SharingNFSService(SharingService):
         datastore = "sharing.nfs_share"
         datastore_prefix = "nfs_"
         datastore_extend = "sharing.nfs.extend"
+        datastore_raw_fields = (
+            "id", "comment", "alldirs", "ro", "quiet", "maproot_user", "maproot_group", "mapall_user", "mapall_group",
+            "enabled",
+        )
         cli_namespace = "sharing.nfs"
 
     ENTRY = Patch(
@@ -286,11 +290,7 @@ class SharingNFSService(SharingService):
 
     @private
     async def sharing_task_determine_locked(self, data, locked_datasets):
-        for path in data[self.path_field]:
-            if await self.middleware.call('pool.dataset.path_in_locked_datasets', path, locked_datasets):
-                return True
-        else:
-            return False
+        return any(path_in_locked_datasets(path, locked_datasets) for path in data[self.path_field])
 
     @accepts(Dict(
         "sharingnfs_create",
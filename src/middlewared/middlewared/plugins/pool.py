@@ -35,7 +35,7 @@ from middlewared.service_exception import InstanceNotFound, ValidationError
 import middlewared.sqlalchemy as sa
 from middlewared.utils import Popen, filter_list, run
 from middlewared.utils.asyncio_ import asyncio_map
-from middlewared.utils.path import is_child
+from middlewared.utils.path import path_in_locked_datasets
 from middlewared.utils.shell import join_commandline
 from middlewared.validators import Exact, Match, Or, Range, Time
 
@@ -2898,7 +2898,7 @@ class PoolDatasetService(CRUDService):
     def path_in_locked_datasets(self, path, locked_datasets=None):
         if locked_datasets is None:
             locked_datasets = self.middleware.call_sync('zfs.dataset.locked_datasets')
-        return any(is_child(path, d['mountpoint']) for d in locked_datasets if d['mountpoint'])
+        return path_in_locked_datasets(path, locked_datasets)
 
     @filterable
     def query(self, filters, options):
@@ -2977,11 +2977,15 @@ class PoolDatasetService(CRUDService):
         """
 
         def transform(dataset):
+            # `zfs.dataset.query` in flat mode shares children datasets between entries so we never modify
+            # the objects we were given and build a new one instead
+            properties = dataset['properties']
+            dataset = dataset.copy()
             for orig_name, new_name, method in get_props_of_interest_mapping():
-                if orig_name not in dataset['properties']:
+                if orig_name not in properties:
                     continue
                 i = new_name or orig_name
-                dataset[i] = dataset['properties'][orig_name]
+                dataset[i] = properties[orig_name].copy()
                 if method:
                     dataset[i]['value'] = method(dataset[i]['value'])
 
@@ -2992,7 +2996,7 @@ class PoolDatasetService(CRUDService):
                 dataset['mountpoint'] = None
 
             dataset['user_properties'] = {
-                k: v for k, v in dataset['properties'].items() if ':' in k and k not in self._internal_user_props()
+                k: v.copy() for k, v in properties.items() if ':' in k and k not in self._internal_user_props()
             }
             del dataset['properties']
 
@@ -6,6 +6,7 @@ from middlewared.service_exception import CallError, MatchNotFound
 from middlewared.plugins.smb_.smbconf.reg_global_smb import LOGLEVEL_MAP
 import middlewared.sqlalchemy as sa
 from middlewared.utils import osc, Popen, run
+from middlewared.utils.path import path_in_locked_datasets
 from pathlib import Path
 
 import asyncio
@@ -901,6 +902,10 @@ class SharingSMBService(SharingService):
         datastore = 'sharing.cifs_share'
         datastore_prefix = 'cifs_'
         datastore_extend = 'sharing.smb.extend'
+        datastore_raw_fields = (
+            'id', 'purpose', 'path', 'path_suffix', 'home', 'name', 'comment', 'ro', 'browsable', 'recyclebin',
+            'guestok', 'timemachine', 'timemachine_quota', 'vuid', 'enabled', 'cluster_volname', 'afp',
+        )
         cli_namespace = 'sharing.smb'
 
     LP_CTX = param.LoadParm(SMBPath.GLOBALCONF.value[0])
@@ -914,9 +919,7 @@ class SharingSMBService(SharingService):
 
     @private
     async def sharing_task_determine_locked(self, data, locked_datasets):
-        return await self.middleware.call(
-            'pool.dataset.path_in_locked_datasets', data[self.path_field], locked_datasets
-        ) if data[self.path_field] else False
+        return path_in_locked_datasets(data[self.path_field], locked_datasets) if data[self.path_field] else False
 
     @private
     async def strip_comments(self, data):
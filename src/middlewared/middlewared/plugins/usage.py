@@ -11,6 +11,9 @@ from datetime import datetime
 from middlewared.service import Service
 from middlewared.utils import osc
 
+# Setup only schedules sending usage statistics
+SETUP_CONCURRENT = True
+
 
 class UsageService(Service):
 
@@ -9,9 +9,11 @@ from middlewared.async_validators import resolve_hostname
 from middlewared.schema import accepts, Any, Bool, Dict, Int, Str, Patch
 from middlewared.service import CallError, CRUDService, job, private, ValidationErrors
 import middlewared.sqlalchemy as sa
+from middlewared.utils.lazy_import import lazy_import
 
-from pyVim import connect, task as VimTask
-from pyVmomi import vim, vmodl
+connect = lazy_import('pyVim.connect')
+VimTask = lazy_import('pyVim.task')
+pyVmomi = lazy_import('pyVmomi')
 
 
 class VMWareModel(sa.Model):
@@ -288,16 +290,18 @@ class VMWareService(CRUDService):
                 pwd=data['password'],
                 sslContext=ssl_context,
             )
-        except (vim.fault.InvalidLogin, vim.fault.NoPermission, vim.fault.RestrictedVersion) as e:
+        except (
+            pyVmomi.vim.fault.InvalidLogin, pyVmomi.vim.fault.NoPermission, pyVmomi.vim.fault.RestrictedVersion,
+        ) as e:
             raise CallError(e.msg, errno.EPERM)
-        except vmodl.RuntimeFault as e:
+        except pyVmomi.vmodl.RuntimeFault as e:
             raise CallError(e.msg)
         except (socket.gaierror, socket.error, OSError) as e:
             raise CallError(str(e), e.errno)
 
         content = server_instance.RetrieveContent()
         objview = content.viewManager.CreateContainerView(
-            content.rootFolder, [vim.HostSystem], True
+            content.rootFolder, [pyVmomi.vim.HostSystem], True
         )
 
         esxi_hosts = objview.view
@@ -364,7 +368,7 @@ class VMWareService(CRUDService):
         )
 
         content = server_instance.RetrieveContent()
-        objview = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
+        objview = content.viewManager.CreateContainerView(content.rootFolder, [pyVmomi.vim.VirtualMachine], True)
         vm_view = objview.view
         objview.Destroy()
 
@@ -438,7 +442,7 @@ class VMWareService(CRUDService):
                 continue
 
             # There's no point to even consider VMs that are paused or powered off.
-            vm_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
+            vm_view = content.viewManager.CreateContainerView(content.rootFolder, [pyVmomi.vim.VirtualMachine], True)
             for vm in vm_view.view:
                 if vm.summary.runtime.powerState != "poweredOn":
                     continue
@@ -599,7 +603,7 @@ class VMWareService(CRUDService):
         try:
             # check for PCI pass-through devices
             for device in vm.config.hardware.device:
-                if isinstance(device, vim.VirtualPCIPassthrough):
+                if isinstance(device, pyVmomi.vim.VirtualPCIPassthrough):
                     return False
             # consider supporting more cases of VMs that can't be snapshoted
             # https://kb.vmware.com/selfservice/microsites/search.do?language=en_US&cmd=displayKC&externalId=1006392
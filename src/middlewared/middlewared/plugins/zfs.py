@@ -2,7 +2,6 @@ import copy
 import errno
 import subprocess
 from collections import defaultdict
-from copy import deepcopy
 
 import libzfs
 
@@ -12,6 +11,7 @@ from middlewared.service import (
 )
 from middlewared.utils import filter_list, filter_getattrs
 from middlewared.utils.path import is_child
+from middlewared.plugins.zfs_.utils import flatten_datasets
 from middlewared.validators import Match, ReplicationSnapshotNamingSchema
 
 
@@ -426,7 +426,7 @@ class ZFSDatasetService(CRUDService):
 
             query_filters.append(['id', 'in', names_optimized])
 
-        result = self.flatten_datasets(self.query(query_filters, {
+        result = flatten_datasets(self.query(query_filters, {
             'extra': {
                 'flat': False,  # So child datasets are also queried
                 'properties': ['encryption', 'keystatus', 'mountpoint']
@@ -456,7 +456,7 @@ class ZFSDatasetService(CRUDService):
         ]
 
     def flatten_datasets(self, datasets):
-        return sum([[deepcopy(ds)] + self.flatten_datasets(ds.get('children') or []) for ds in datasets], [])
+        return list(flatten_datasets(datasets))
 
     @filterable
     def query(self, filters, options):
@@ -477,7 +477,9 @@ class ZFSDatasetService(CRUDService):
         We provide 2 ways how zfs.dataset.query returns dataset's data. First is a flat structure ( default ), which
         means that all the datasets in the system are returned as separate objects which also contain all the data
         their is for their children. This retrieval type is slightly slower because of duplicates which exist in
-        each object.
+        each object. Please note that datasets in flat mode share the objects of their children (a child dataset is
+        the same object in the result list and in its parent's `children` list), so results must be treated as
+        read-only and copied before being modified.
         Second type is hierarchical where only top level datasets are returned in the list and they contain all the
         children there are for them in `children` key. This retrieval type is slightly faster.
         These options are controlled by `query-options.extra.flat` attribute which defaults to true.
@@ -519,7 +521,7 @@ class ZFSDatasetService(CRUDService):
 
             datasets = zfs.datasets_serialized(**kwargs)
             if flat:
-                datasets = self.flatten_datasets(datasets)
+                datasets = list(flatten_datasets(datasets))
             else:
                 datasets = list(datasets)
 
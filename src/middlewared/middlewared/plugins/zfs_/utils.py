@@ -0,0 +1,16 @@
+def flatten_datasets(datasets):
+    """
+    Yield every dataset from a hierarchical `zfs.dataset.query` result, each parent followed by its children.
+
+    Datasets are not copied: every yielded dataset is the same object that is referenced by its parent's `children`
+    list, so consumers must treat them as read-only and copy a dataset before modifying it. They are not wrapped in
+    read-only mappings because query results are pickled by the process pool and encoded as JSON by the API.
+    """
+    stack = [iter(datasets)]
+    while stack:
+        for dataset in stack[-1]:
+            yield dataset
+            stack.append(iter(dataset.get('children') or []))
+            break
+        else:
+            stack.pop()
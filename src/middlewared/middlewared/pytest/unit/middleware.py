@@ -36,6 +36,9 @@ class Middleware(dict):
             result = await result
         return result
 
+    async def call_internal(self, name, *args):
+        return await self.call(name, *args)
+
     def call_sync(self, name, *args):
         return self[name](*args)
 
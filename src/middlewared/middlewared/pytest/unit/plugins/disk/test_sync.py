@@ -0,0 +1,28 @@
+from asynctest import Mock
+import pytest
+
+from middlewared.plugins.disk_.sync import DiskService
+from middlewared.pytest.unit.middleware import Middleware
+
+
+@pytest.mark.asyncio
+async def test__sync_all__same_identifier_inserted_once():
+    m = Middleware()
+    m["device.get_disks"] = Mock(return_value={
+        "sda": {"name": "sda", "ident": "1", "lunid": None, "serial": "1", "size": 1024},
+        "sdb": {"name": "sdb", "ident": "1", "lunid": None, "serial": "1", "size": 1024},
+    })
+    m["enclosure.query"] = Mock(return_value=[])
+    m["datastore.query"] = Mock(return_value=[])
+    m["disk.device_to_identifier"] = Mock(return_value="{serial}1")
+    operations = []
+    m["datastore.bulk_write"] = Mock(side_effect=lambda ops: operations.extend(ops))
+    m["enclosure.sync_disk"] = Mock()
+    m["disk.restart_services_after_sync"] = Mock()
+
+    await DiskService(m).sync_all(Mock())
+
+    assert [(operation["type"], operation["data"]["disk_name"]) for operation in operations] == [
+        ("INSERT", "sda"),
+        ("UPDATE", "sdb"),
+    ]
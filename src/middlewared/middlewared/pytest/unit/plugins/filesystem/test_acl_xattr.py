@@ -0,0 +1,90 @@
+import errno
+import struct
+from unittest.mock import patch
+
+import pytest
+
+from middlewared.plugins.filesystem_.acl_xattr import acl_is_trivial, decode_nfs4_acl, decode_posix_acl
+
+
+def posix_acl(*entries):
+    return struct.pack('<I', 2) + b''.join(struct.pack('<HHI', *entry) for entry in entries)
+
+
+def nfs4_acl(flags, *aces):
+    return struct.pack('>II', flags, len(aces)) + b''.join(struct.pack('>IIIII', *ace) for ace in aces)
+
+
+MINIMAL_POSIX_ACL = posix_acl((0x01, 7, 0xffffffff), (0x04, 5, 0xffffffff), (0x20, 4, 0xffffffff))
+EXTENDED_POSIX_ACL = posix_acl(
+    (0x01, 7, 0xffffffff), (0x02, 6, 1000), (0x04, 5, 0xffffffff), (0x10, 7, 0xffffffff), (0x20, 0, 0xffffffff),
+)
+TRIVIAL_NFS4_ACL = nfs4_acl(0x10000, (0, 0, 1, 0x1f01ff, 1), (0, 0x40, 1, 0x1200a9, 2), (0, 0, 1, 0x1200a9, 3))
+NFS4_ACL = nfs4_acl(0, (0, 0x3, 0, 0x1f01ff, 1000), (1, 0x40, 0, 0x6, 1001))
+
+
+def test__decode_posix_acl():
+    acl = decode_posix_acl(EXTENDED_POSIX_ACL)
+    assert [(entry['tag'], entry['id']) for entry in acl] == [
+        ('USER_OBJ', -1), ('USER', 1000), ('GROUP_OBJ', -1), ('MASK', -1), ('OTHER', -1),
+    ]
+    assert acl[1]['perms'] == {'READ': True, 'WRITE': True, 'EXECUTE': False}
+    assert not acl[1]['default']
+
+
+def test__decode_posix_acl_invalid_version():
+    with pytest.raises(ValueError):
+        decode_posix_acl(struct.pack('<I', 1))
+
+
+def test__decode_nfs4_acl():
+    acl = decode_nfs4_acl(NFS4_ACL)
+    assert not acl['trivial']
+    assert acl['aces'] == [
+        {'tag': 'USER', 'id': 1000, 'type': 'ALLOW', 'flags': 0x3, 'access_mask': 0x1f01ff},
+        {'tag': 'GROUP', 'id': 1001, 'type': 'DENY', 'flags': 0x40, 'access_mask': 0x6},
+    ]
+
+    acl = decode_nfs4_acl(TRIVIAL_NFS4_ACL)
+    assert acl['trivial']
+    assert [ace['tag'] for ace in acl['aces']] == ['owner@', 'group@', 'everyone@']
+
+
+def test__decode_nfs4_acl_truncated():
+    with pytest.raises(ValueError):
+        decode_nfs4_acl(NFS4_ACL[:-1])
+
+
+def getxattr(xattrs):
+    def getxattr(path, name):
+        value = xattrs.get(name, errno.ENODATA)
+        if isinstance(value, int):
+            raise OSError(value, 'error')
+        return value
+
+    return getxattr
+
+
+@pytest.mark.parametrize("xattrs,trivial", [
+    ({}, True),
+    ({'system.posix_acl_access': MINIMAL_POSIX_ACL}, True),
+    ({'system.posix_acl_access': EXTENDED_POSIX_ACL}, False),
+    ({'system.posix_acl_default': MINIMAL_POSIX_ACL}, False),
+    ({'system.posix_acl_access': errno.EOPNOTSUPP, 'system.posix_acl_default': errno.EOPNOTSUPP,
+      'system.nfs4_acl_xdr': TRIVIAL_NFS4_ACL}, True),
+    ({'system.posix_acl_access': errno.EOPNOTSUPP, 'system.posix_acl_default': errno.EOPNOTSUPP,
+      'system.nfs4_acl_xdr': NFS4_ACL}, False),
+    ({'system.posix_acl_access': errno.EOPNOTSUPP, 'system.posix_acl_default': errno.EOPNOTSUPP,
+      'system.nfs4_acl_xdr': errno.EOPNOTSUPP}, True),
+])
+def test__acl_is_trivial(xattrs, trivial):
+    with patch("middlewared.plugins.filesystem_.acl_xattr.os.getxattr", getxattr(xattrs)):
+        assert acl_is_trivial("/mnt/tank/file") == trivial
+
+
+def test__acl_is_trivial_error():
+    with patch("middlewared.plugins.filesystem_.acl_xattr.os.getxattr", getxattr({
+        'system.posix_acl_access': errno.EACCES,
+    })):
+        with pytest.raises(PermissionError):
+            acl_is_trivial("/mnt/tank/file")
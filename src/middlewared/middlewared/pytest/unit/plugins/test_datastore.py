@@ -1,6 +1,9 @@
+import asyncio
 from contextlib import asynccontextmanager
 import datetime
-from unittest.mock import ANY, patch
+import os
+import sqlite3
+from unittest.mock import ANY, Mock, patch
 
 import pytest
 import sqlalchemy as sa
@@ -11,6 +14,7 @@ from sqlalchemy.orm import relationship
 from middlewared.sqlalchemy import EncryptedText, JSON, Time
 
 import middlewared.plugins.datastore  # noqa
+from middlewared.plugins.datastore.cache import hook_datastore_execute_write, query_cache, table_cache, TableCache
 import middlewared.plugins.datastore.connection  # noqa
 import middlewared.plugins.datastore.schema  # noqa
 import middlewared.plugins.datastore.util  # noqa
@@ -24,9 +28,9 @@ Model = declarative_base()
 
 
 @asynccontextmanager
-async def datastore_test():
+async def datastore_test(database=":memory:"):
     m = Middleware()
-    with patch("middlewared.plugins.datastore.connection.FREENAS_DATABASE", ":memory:"):
+    with patch("middlewared.plugins.datastore.connection.FREENAS_DATABASE", database):
         with patch("middlewared.plugins.datastore.schema.Model", Model):
             with patch("middlewared.plugins.datastore.util.Model", Model):
                 ds = DatastoreService(m)
@@ -41,6 +45,7 @@ async def datastore_test():
 
                 m["datastore.execute"] = ds.execute
                 m["datastore.execute_write"] = ds.execute_write
+                m["datastore.execute_write_batch"] = ds.execute_write_batch
                 m["datastore.fetchall"] = ds.fetchall
 
                 m["datastore.query"] = ds.query
@@ -776,3 +781,268 @@ async def test__null_order_by(order_by, result):
         await ds.insert("test.null", {"value": 1})
 
         assert [row["id"] for row in await ds.query("test.null", [], {"order_by": order_by})] == result
+
+
+@pytest.mark.asyncio
+async def test__extend():
+    async with datastore_test() as ds:
+        await ds.insert("test.null", {"value": 1})
+        await ds.insert("test.null", {"value": 2})
+
+        ds.middleware["test.extend"] = Mock(side_effect=lambda row: dict(row, extended=True))
+
+        assert await ds.query("test.null", [], {"extend": "test.extend"}) == [
+            {"id": 1, "value": 1, "extended": True},
+            {"id": 2, "value": 2, "extended": True},
+        ]
+        assert ds.middleware["test.extend"].call_count == 2
+
+
+@pytest.mark.asyncio
+async def test__extend_batch():
+    async with datastore_test() as ds:
+        await ds.insert("test.null", {"value": 1})
+        await ds.insert("test.null", {"value": 2})
+
+        ds.middleware["test.extend"] = Mock()
+        ds.middleware["test.extend_context"] = Mock(return_value={"extended": True})
+        ds.middleware["test.extend_batch"] = Mock(
+            side_effect=lambda rows, context: [dict(row, **context) for row in rows],
+        )
+        stats = (await ds.extend_stats()).get("test_null", {"queries": 0, "rows": 0})
+
+        assert await ds.query("test.null", [], {
+            "extend": "test.extend",
+            "extend_context": "test.extend_context",
+            "extend_batch": "test.extend_batch",
+            "select": ["value", "extended"],
+        }) == [
+            {"value": 1, "extended": True},
+            {"value": 2, "extended": True},
+        ]
+        assert ds.middleware["test.extend_batch"].call_count == 1
+        ds.middleware["test.extend"].assert_not_called()
+
+        new_stats = (await ds.extend_stats())["test_null"]
+        assert new_stats["queries"] == stats["queries"] + 1
+        assert new_stats["rows"] == stats["rows"] + 2
+
+
+@pytest.mark.asyncio
+async def test__cache():
+    async with datastore_test() as ds:
+        ds.middleware.call_hook_inline = Mock(side_effect=lambda name, *args: hook_datastore_execute_write(
+            ds.middleware, *args,
+        ))
+        ds.enable_cache("test.null")
+        try:
+            await ds.insert("test.null", {"value": 1})
+            stats = ds.cache_stats().get("test_null", {"hits": 0, "misses": 0, "invalidations": 0})
+
+            with patch.object(ds.middleware, "run_in_executor", wraps=ds.middleware.run_in_executor) as executor:
+                assert [row["value"] for row in await ds.query("test.null")] == [1]
+                assert [row["value"] for row in await ds.query("test.null")] == [1]
+                assert executor.call_count == 1
+
+            await ds.insert("test.null", {"value": 2})
+            assert [row["value"] for row in await ds.query("test.null")] == [1, 2]
+            assert await ds.query("test.null", [], {"count": True}) == 2
+
+            new_stats = ds.cache_stats()["test_null"]
+            assert new_stats["hits"] == stats["hits"] + 1
+            assert new_stats["misses"] == stats["misses"] + 3
+            assert new_stats["invalidations"] == stats["invalidations"] + 1
+        finally:
+            table_cache.tables.discard("test_null")
+            table_cache.invalidate()
+
+
+def test__cache_dependency_written_before_put():
+    cache = TableCache()
+    cache.enable("test_null")
+    key = cache.key("test_null", [], {})
+
+    hit, generation = cache.get("test_null", key, {"test_null", "test_joined"})
+    assert not hit
+    # i.e. a write to the joined table while the query is being executed
+    cache.invalidate("test_joined")
+    cache.put("test_null", key, [{"id": 1}], generation)
+
+    assert cache.get("test_null", key, {"test_null", "test_joined"}) == (False, generation + 1)
+
+
+@pytest.mark.asyncio
+async def test__wal(tmp_path):
+    async with datastore_test(str(tmp_path / "freenas-v1.db")) as ds:
+        part = [part for part in ds.parts if hasattr(part, "connection")][0]
+        assert part.wal
+
+        await ds.insert("test.null", {"value": 1})
+
+        assert await ds.checkpoint(lambda: os.path.getsize(tmp_path / "freenas-v1.db-wal")) == 0
+
+        assert [row["value"] for row in await ds.query("test.null")] == [1]
+        read_connection = part.read_connections.connection
+        assert read_connection is not part.connection
+
+        with pytest.raises(Exception):
+            await part.fetchall("DELETE FROM test_null")
+
+        await ds.setup()
+        assert [row["value"] for row in await ds.query("test.null")] == [1]
+        assert part.read_connections.connection is not read_connection
+
+
+@pytest.mark.asyncio
+async def test__replace_database(tmp_path):
+    async with datastore_test(str(tmp_path / "freenas-v1.db")) as ds:
+        part = [part for part in ds.parts if hasattr(part, "connection")][0]
+
+        await ds.insert("test.null", {"value": 1})
+        src, dst = sqlite3.connect(str(tmp_path / "freenas-v1.db")), sqlite3.connect(str(tmp_path / "new.db"))
+        src.backup(dst)
+        dst.execute("UPDATE test_null SET value = 2")
+        dst.commit()
+        src.close()
+        dst.close()
+
+        # Leave frames in the WAL and a read connection open in the read thread
+        await ds.insert("test.null", {"value": 3})
+        assert await asyncio.get_event_loop().run_in_executor(
+            part.read_thread_pool, part._fetchall_read, "SELECT value FROM test_null",
+        ) == [(1,), (3,)]
+
+        await ds.replace_database(str(tmp_path / "new.db"))
+
+        assert not (tmp_path / "new.db").exists()
+        assert [row["value"] for row in await ds.query("test.null")] == [2]
+        assert await asyncio.get_event_loop().run_in_executor(
+            part.read_thread_pool, part._fetchall_read, "SELECT value FROM test_null",
+        ) == [(2,)]
+
+    conn = sqlite3.connect(str(tmp_path / "freenas-v1.db"))
+    assert conn.execute("SELECT value FROM test_null").fetchall() == [(2,)]
+    conn.close()
+
+
+@pytest.mark.asyncio
+async def test__bulk_write():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO storage_disk VALUES (10)")
+        await ds.execute("INSERT INTO storage_disk VALUES (20)")
+        await ds.execute("INSERT INTO tasks_smarttest VALUES (100)")
+        await ds.execute("INSERT INTO tasks_smarttest_smarttest_disks VALUES (NULL, 100, 10)")
+
+        assert await ds.bulk_write([
+            {"type": "INSERT", "name": "tasks.smarttest", "data": {"disks": [10, 20]}, "prefix": "smarttest_"},
+            {"type": "UPDATE", "name": "tasks.smarttest", "id": 100, "data": {"disks": [20]}, "prefix": "smarttest_"},
+            {"type": "DELETE", "name": "storage.disk", "id": [["id", "=", 30]]},
+        ]) == [101, 100, True]
+
+        assert await ds.query("tasks.smarttest", [], {"prefix": "smarttest_"}) == [
+            {"id": 100, "disks": [{"id": 20}]},
+            {"id": 101, "disks": [{"id": 10}, {"id": 20}]},
+        ]
+
+        ds.middleware.call_hook_inline.assert_called_once_with(
+            "datastore.post_execute_write_batch",
+            [
+                ("INSERT INTO tasks_smarttest DEFAULT VALUES", []),
+                ("DELETE FROM tasks_smarttest_smarttest_disks WHERE tasks_smarttest_smarttest_disks.smarttest_id = ?",
+                 [101]),
+                ("INSERT INTO tasks_smarttest_smarttest_disks (smarttest_id, disk_id) VALUES (?, ?), (?, ?)",
+                 [101, 10, 101, 20]),
+                ("DELETE FROM tasks_smarttest_smarttest_disks WHERE tasks_smarttest_smarttest_disks.smarttest_id = ?",
+                 [100]),
+                ("INSERT INTO tasks_smarttest_smarttest_disks (smarttest_id, disk_id) VALUES (?, ?)", [100, 20]),
+                ("DELETE FROM storage_disk WHERE storage_disk.id = ?", [30]),
+            ],
+            ANY,
+        )
+
+
+@pytest.mark.asyncio
+async def test__bulk_write_rollback():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO test_null VALUES (1, 10)")
+
+        with pytest.raises(RuntimeError):
+            await ds.bulk_write([
+                {"type": "INSERT", "name": "test.null", "data": {"value": 20}},
+                {"type": "UPDATE", "name": "test.null", "id": 1, "data": {"value": 11}},
+                {"type": "UPDATE", "name": "test.null", "id": 5, "data": {"value": 30}},
+            ])
+
+        assert await ds.query("test.null") == [{"id": 1, "value": 10}]
+        ds.middleware.call_hook_inline.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test__bulk_write_events():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO test_null VALUES (1, 10)")
+        await ds.execute("INSERT INTO test_null VALUES (2, 20)")
+
+        with patch.object(ds, "send_insert_events") as send_insert_events, \
+                patch.object(ds, "send_update_events") as send_update_events, \
+                patch.object(ds, "send_delete_events") as send_delete_events:
+            ds.middleware["datastore.send_insert_events"] = send_insert_events
+            ds.middleware["datastore.send_update_events"] = send_update_events
+            ds.middleware["datastore.send_delete_events"] = send_delete_events
+
+            await ds.bulk_write([
+                {"type": "UPDATE", "name": "test.null", "id": 1, "data": {"value": 11}},
+                {"type": "UPDATE", "name": "test.null", "id": 1, "data": {"value": 12}},
+                {"type": "INSERT", "name": "test.null", "data": {"value": 30}},
+                {"type": "DELETE", "name": "test.null", "id": 3},
+                {"type": "DELETE", "name": "test.null", "id": 2},
+            ])
+
+        send_insert_events.assert_not_called()
+        send_update_events.assert_called_once_with("test.null", 1)
+        send_delete_events.assert_called_once_with("test.null", 2)
+
+
+@pytest.mark.parametrize("filters,options,ids", [
+    ([("integer", "in", [1, 3])], {}, [1, 3]),
+    ([("integer", "in", [2, None, 4])], {}, [2, 4, 6]),
+    ([("integer", "nin", [1, 2, 3])], {}, [4, 5]),
+    ([("integer", "in", [])], {}, []),
+    ([("integer", "=", None)], {}, [6]),
+    ([("OR", [("integer", ">=", 4), ("integer", "<=", 2)])], {"order_by": ["-integer"]}, [5, 4, 2, 1]),
+    ([("integer", ">", 1)], {"offset": 1, "limit": 2}, [3, 4]),
+    ([("integer", ">", 1)], {"limit": 2}, [2, 3]),
+    ([("integer", ">", 1)], {"offset": 3}, [5]),
+    ([], {"order_by": ["nulls_first:integer"]}, [6, 1, 2, 3, 4, 5]),
+])
+@pytest.mark.asyncio
+async def test__query_cache(filters, options, ids):
+    async with datastore_test() as ds:
+        for i in range(1, 6):
+            await ds.execute(f"INSERT INTO test_integer VALUES ({i}, {i})")
+        await ds.execute("INSERT INTO test_integer VALUES (6, NULL)")
+
+        for i in range(2):
+            assert [row["id"] for row in await ds.query("test.integer", filters, options)] == ids
+            count = await ds.query("test.integer", filters, {"count": True})
+            assert count == len(await ds.query("test.integer", filters))
+
+        # Different values, same compiled statement
+        assert [row["id"] for row in await ds.query("test.integer", [("id", "in", [4, 5])])] == [4, 5]
+        hits = query_cache.stats["hits"]
+        assert [row["id"] for row in await ds.query("test.integer", [("id", "in", [2])])] == [2]
+        assert query_cache.stats["hits"] == hits + 1
+
+
+@pytest.mark.asyncio
+async def test__query_cache_join():
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (10, 1010)")
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (20, 2020)")
+        await ds.execute("INSERT INTO `account_bsdusers` VALUES (4, 44, 10)")
+        await ds.execute("INSERT INTO `account_bsdusers` VALUES (5, 55, 20)")
+
+        for gid, id in [(2020, 5), (1010, 4), (2020, 5)]:
+            assert await ds.query("account.bsdusers", [("bsdusr_group__bsdgrp_gid", "=", gid)]) == [
+                {"id": id, "bsdusr_uid": id * 11, "bsdusr_group": {"id": gid // 101, "bsdgrp_gid": gid}},
+            ]
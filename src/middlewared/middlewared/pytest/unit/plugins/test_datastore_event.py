@@ -0,0 +1,95 @@
+import asyncio
+from collections import defaultdict
+from unittest.mock import Mock, patch
+
+import pytest
+
+from middlewared.plugins.datastore.event import DatastoreService
+from middlewared.pytest.unit.middleware import Middleware
+
+
+@pytest.fixture
+def datastore():
+    with patch.object(DatastoreService, "events", defaultdict(list)), \
+            patch.object(DatastoreService, "pending_update_events", {}), \
+            patch.object(DatastoreService, "last_fields", defaultdict(dict)), \
+            patch("middlewared.plugins.datastore.event.UPDATE_EVENTS_INTERVAL", 0):
+        m = Middleware()
+        m.has_event_subscribers = Mock(return_value=True)
+        m["test.query"] = Mock(return_value=[{"id": 1, "name": "test", "value": 1}])
+        yield DatastoreService(m)
+
+
+async def register(datastore, mode="FULL"):
+    await datastore.register_event({
+        "description": "Test",
+        "datastore": "test.test",
+        "plugin": "test",
+        "mode": mode,
+    })
+
+
+async def wait_pending_events(datastore):
+    while datastore.pending_update_events:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test__update_events_coalesced(datastore):
+    await register(datastore)
+
+    for i in range(3):
+        await datastore.send_update_events("test.test", 1)
+    await wait_pending_events(datastore)
+
+    datastore.middleware["test.query"].assert_called_once_with([["id", "=", 1]], {"get": False})
+    datastore.middleware.send_event.assert_called_once_with(
+        "test.query", "CHANGED", id=1, fields={"id": 1, "name": "test", "value": 1},
+    )
+
+
+@pytest.mark.asyncio
+async def test__update_events_no_subscribers(datastore):
+    datastore.middleware.has_event_subscribers.return_value = False
+    await register(datastore)
+
+    await datastore.send_insert_events("test.test", {"id": 1})
+    await datastore.send_update_events("test.test", 1)
+    await wait_pending_events(datastore)
+
+    datastore.middleware["test.query"].assert_not_called()
+    datastore.middleware.send_event.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test__update_events_cancelled_by_delete(datastore):
+    await register(datastore)
+
+    await datastore.send_update_events("test.test", 1)
+    await datastore.send_delete_events("test.test", 1)
+    await wait_pending_events(datastore)
+
+    datastore.middleware["test.query"].assert_not_called()
+    assert [c[0][1] for c in datastore.middleware.send_event.call_args_list] == ["CHANGED", "REMOVED"]
+
+
+@pytest.mark.asyncio
+async def test__update_events_diff(datastore):
+    await register(datastore, "DIFF")
+
+    await datastore.send_update_events("test.test", 1)
+    await wait_pending_events(datastore)
+
+    datastore.middleware["test.query"].return_value = [{"id": 1, "name": "test", "value": 2}]
+    await datastore.send_update_events("test.test", 1)
+    await wait_pending_events(datastore)
+
+    # Nothing has changed
+    await datastore.send_update_events("test.test", 1)
+    await wait_pending_events(datastore)
+
+    assert [c[1]["fields"] for c in datastore.middleware.send_event.call_args_list] == [
+        {"id": 1, "name": "test", "value": 1},
+        {"value": 2},
+    ]
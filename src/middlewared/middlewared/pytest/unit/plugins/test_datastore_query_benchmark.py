@@ -0,0 +1,51 @@
+"""
+Measures `datastore.query` CPU time per query with and without compiled statements cache. Timings are reported with
+`record_property` (run with `--junitxml` to see them).
+"""
+import time
+
+import pytest
+
+from middlewared.plugins.datastore.cache import query_cache
+from middlewared.pytest.unit.plugins.test_datastore import datastore_test
+
+REPEAT = 200
+
+
+async def measure(ds, name, filters, options):
+    start = time.process_time()
+    for i in range(REPEAT):
+        result = await ds.query(name, filters, options)
+    return (time.process_time() - start) / REPEAT, result
+
+
+@pytest.mark.parametrize("name,filters,options", [
+    ("account.bsdgroupmembership", [], {}),
+    ("account.bsdusers", [("bsdusr_group__bsdgrp_gid", "=", 2020)], {}),
+    ("account.bsdusers", [("bsdusr_uid", "in", [44, 55])], {"order_by": ["-bsdusr_uid"], "limit": 1}),
+    ("tasks.smarttest", [], {"prefix": "smarttest_"}),
+])
+@pytest.mark.asyncio
+async def test__query_benchmark(record_property, monkeypatch, name, filters, options):
+    async with datastore_test() as ds:
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (10, 1010)")
+        await ds.execute("INSERT INTO `account_bsdgroups` VALUES (20, 2020)")
+        await ds.execute("INSERT INTO `account_bsdusers` VALUES (4, 44, 10)")
+        await ds.execute("INSERT INTO `account_bsdusers` VALUES (5, 55, 20)")
+        await ds.execute("INSERT INTO `account_bsdgroupmembership` VALUES (1, 10, 5)")
+        await ds.execute("INSERT INTO storage_disk VALUES (10)")
+        await ds.execute("INSERT INTO storage_disk VALUES (20)")
+        await ds.execute("INSERT INTO tasks_smarttest VALUES (100)")
+        await ds.execute("INSERT INTO tasks_smarttest_smarttest_disks VALUES (NULL, 100, 10)")
+        await ds.execute("INSERT INTO tasks_smarttest_smarttest_disks VALUES (NULL, 100, 20)")
+
+        with monkeypatch.context() as m:
+            m.setattr(query_cache, "max_entries", 0)
+            uncached_time, uncached_result = await measure(ds, name, filters, options)
+
+        cached_time, cached_result = await measure(ds, name, filters, options)
+
+    assert cached_result == uncached_result
+
+    record_property("uncached_us", round(uncached_time * 1000000, 1))
+    record_property("cached_us", round(cached_time * 1000000, 1))
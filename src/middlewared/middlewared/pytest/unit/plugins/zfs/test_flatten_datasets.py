@@ -0,0 +1,31 @@
+from middlewared.plugins.zfs_.utils import flatten_datasets
+
+
+def dataset(name, *children):
+    return {'id': name, 'children': list(children)}
+
+
+DATASETS = [
+    dataset(
+        'tank',
+        dataset('tank/a', dataset('tank/a/b', dataset('tank/a/b/c'))),
+        dataset('tank/d'),
+    ),
+    dataset('boot-pool', dataset('boot-pool/ROOT')),
+]
+
+
+def test__flatten_datasets__order():
+    assert [ds['id'] for ds in flatten_datasets(DATASETS)] == [
+        'tank', 'tank/a', 'tank/a/b', 'tank/a/b/c', 'tank/d', 'boot-pool', 'boot-pool/ROOT',
+    ]
+
+
+def test__flatten_datasets__shares_children():
+    flat = list(flatten_datasets(DATASETS))
+    assert flat[1] is DATASETS[0]['children'][0]
+    assert flat[1]['children'][0] is flat[2]
+
+
+def test__flatten_datasets__no_children_key():
+    assert list(flatten_datasets([{'id': 'tank'}])) == [{'id': 'tank'}]
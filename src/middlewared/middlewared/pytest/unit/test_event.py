@@ -0,0 +1,37 @@
+from unittest.mock import Mock
+
+from middlewared.event import event_message, EventSubscriptions
+
+
+def test__event_message():
+    assert event_message("pool.query", "CHANGED", id=1, fields={"name": "tank"}, cleared=False, extra=True) == {
+        "msg": "changed",
+        "collection": "pool.query",
+        "id": 1,
+        "fields": {"name": "tank"},
+        "cleared": False,
+        "extra": {"extra": True},
+    }
+
+
+def test__event_subscriptions():
+    app1 = Mock(session_id="1")
+    app2 = Mock(session_id="2")
+    subscriptions = EventSubscriptions()
+
+    subscriptions.add("pool.query", app1)
+    subscriptions.add("*", app2)
+    subscriptions.add("pool.query", app2)
+
+    assert subscriptions.subscribers("pool.query") == [app1, app2]
+    assert subscriptions.subscribers("disk.query") == [app2]
+
+    subscriptions.remove("*", app2)
+    assert subscriptions.subscribers("disk.query") == []
+    assert not subscriptions.has_subscribers("disk.query")
+
+    subscriptions.remove_app(app1)
+    assert subscriptions.subscribers("pool.query") == [app2]
+
+    subscriptions.remove_app(app2)
+    assert not subscriptions.has_subscribers("pool.query")
@@ -0,0 +1,212 @@
+import asyncio
+
+from mock import Mock, patch
+import pytest
+
+from middlewared.job import Job, JobsDeque, JobsQueue, State
+
+
+class FakeJob:
+    def __init__(self, lock=None, lock_queue_size=None):
+        self.options = {"lock": lock, "lock_queue_size": lock_queue_size, "transient": True}
+        self.id = None
+        self.lock = None
+        self.state = State.WAITING
+
+    def set_id(self, id):
+        self.id = id
+
+    def get_lock_name(self):
+        return self.options["lock"]
+
+    def get_lock(self):
+        return self.lock
+
+    def set_lock(self, lock):
+        self.lock = lock
+
+
+async def dispatch(queue):
+    jobs = []
+    while queue.ready:
+        jobs.append(await queue.next())
+    return jobs
+
+
+@pytest.mark.asyncio
+async def test__jobs_queue_locks():
+    queue = JobsQueue(Mock())
+    jobs = [FakeJob("a"), FakeJob("a"), FakeJob(), FakeJob("b"), FakeJob("a")]
+    for job in jobs:
+        queue.add(job)
+
+    assert await dispatch(queue) == [jobs[0], jobs[2], jobs[3]]
+    assert queue.job_locks["a"].get_jobs() == [jobs[1], jobs[4]]
+
+    queue.release_lock(jobs[0])
+    assert await dispatch(queue) == [jobs[1]]
+
+    queue.release_lock(jobs[3])
+    assert "b" not in queue.job_locks
+
+    queue.release_lock(jobs[1])
+    queue.release_lock(jobs[4])
+    assert await dispatch(queue) == [jobs[4]]
+    assert queue.job_locks == {}
+
+
+@pytest.mark.asyncio
+async def test__jobs_queue_lock_queue_size():
+    queue = JobsQueue(Mock())
+    running = queue.add(FakeJob("a", 1))
+    await dispatch(queue)
+
+    queued = queue.add(FakeJob("a", 1))
+    assert queue.add(FakeJob("a", 1)) is queued
+
+    queue.release_lock(running)
+    assert await dispatch(queue) == [queued]
+
+
+@pytest.mark.asyncio
+async def test__jobs_queue_next_waits():
+    queue = JobsQueue(Mock())
+    job = FakeJob()
+
+    next_ = asyncio.ensure_future(queue.next())
+    await asyncio.sleep(0)
+    assert not next_.done()
+
+    queue.add(job)
+    assert await asyncio.wait_for(next_, 1) is job
+
+
+@pytest.mark.asyncio
+async def test__jobs_queue_lock_stats():
+    queue = JobsQueue(Mock())
+    running = queue.add(FakeJob("a"))
+    queue.add(FakeJob("a"))
+
+    assert queue.lock_stats() == [
+        {"name": "a", "running": True, "queued": 1, "started": 1, "wait_time_avg": pytest.approx(0, abs=0.1),
+         "wait_time_max": pytest.approx(0, abs=0.1)},
+    ]
+
+    queue.release_lock(running)
+    assert queue.lock_stats()[0]["started"] == 2
+
+
+@pytest.mark.asyncio
+async def test__job_progress_events_rate_limited():
+    middleware = Mock(loop=asyncio.get_event_loop())
+    job = Job(middleware, "test.job", None, None, [], {"check_pipes": False, "description": None}, None, None)
+    job.set_id(1)
+
+    with patch("middlewared.job.PROGRESS_EVENTS_PER_SECOND", 10):
+        for i in range(1, 11):
+            job.set_progress(i * 10, f"Step {i}")
+
+        assert middleware.send_event.call_count == 1
+        assert middleware.send_event.call_args[1]["fields"] == {
+            "id": 1, "state": "WAITING", "progress": {"percent": 10, "description": "Step 1", "extra": None},
+        }
+
+        await asyncio.sleep(0.2)
+
+    assert middleware.send_event.call_count == 2
+    assert middleware.send_event.call_args[1]["fields"] == {
+        "id": 1, "state": "WAITING", "progress": {"percent": 100, "description": "Step 10", "extra": None},
+    }
+
+
+def create_job(middleware, **options):
+    return Job(middleware, "test.job", None, None, [], {
+        "check_pipes": False, "description": None, "abortable": False, "transient": False, "lock": None,
+        "lock_queue_size": None, **options,
+    }, None, None)
+
+
+def finished_job(middleware, result):
+    job = create_job(middleware)
+    middleware.dump_args.return_value = []
+    job.set_result(result)
+    job.set_state("RUNNING")
+    job.set_state("SUCCESS")
+    return job
+
+
+def test__jobs_deque_compact_spills_result(tmp_path):
+    middleware = Mock(loop=asyncio.new_event_loop())
+    with patch("middlewared.job.LOGS_DIR", str(tmp_path)), patch("middlewared.job.RESULTS_DIR", str(tmp_path)):
+        jobs = JobsDeque(spill_size=100)
+        small = finished_job(middleware, {"small": True})
+        large = finished_job(middleware, ["x" * 10] * 100)
+        for job in [small, large]:
+            jobs.add(job)
+            job.compact(jobs.spill_size)
+            jobs.compacted(job)
+
+        assert small.result_path is None
+        assert large.result_path is not None
+        assert jobs.spilled_size == large.result_spilled_size
+
+        assert [job["result"] for job in jobs.query([], {})] == [{"small": True}, ["x" * 10] * 100]
+        assert jobs.query([["id", "=", large.id]], {"get": True, "select": ["id", "result"]}) == {
+            "id": large.id, "result": ["x" * 10] * 100,
+        }
+
+        jobs.remove(large.id)
+        assert jobs.spilled_size == 0
+        assert not (tmp_path / f"{large.id}.json").exists()
+
+
+def test__jobs_deque_compact_keeps_result_in_memory(tmp_path):
+    middleware = Mock(loop=asyncio.new_event_loop())
+    with patch("middlewared.job.LOGS_DIR", str(tmp_path)), patch("middlewared.job.RESULTS_DIR", str(tmp_path)):
+        jobs = JobsDeque(spill_size=100)
+        result = ["x" * 10] * 100
+        job = finished_job(middleware, result)
+        jobs.add(job)
+        job.compact(jobs.spill_size)
+        jobs.compacted(job)
+
+        assert job.result_path is not None
+        assert job.result is result
+
+        job.release_result()
+        assert jobs.query([["id", "=", job.id]], {"get": True})["result"] == result
+        assert job._result is None
+
+        assert job.result == result
+        assert job._result is None
+
+
+@pytest.mark.parametrize("result", [
+    [("x" * 10, 1)] * 100,
+    {i: "x" * 10 for i in range(100)},
+])
+def test__jobs_deque_compact_does_not_spill_changed_result(tmp_path, result):
+    middleware = Mock(loop=asyncio.new_event_loop())
+    with patch("middlewared.job.LOGS_DIR", str(tmp_path)), patch("middlewared.job.RESULTS_DIR", str(tmp_path)):
+        jobs = JobsDeque(spill_size=100)
+        job = finished_job(middleware, result)
+        jobs.add(job)
+        job.compact(jobs.spill_size)
+        jobs.compacted(job)
+
+        assert job.result_path is None
+        assert job.result is result
+
+
+def test__jobs_deque_evicts_spilled_results(tmp_path):
+    middleware = Mock(loop=asyncio.new_event_loop())
+    with patch("middlewared.job.LOGS_DIR", str(tmp_path)), patch("middlewared.job.RESULTS_DIR", str(tmp_path)):
+        jobs = JobsDeque(spill_size=100, max_spilled_size=1500)
+        for i in range(3):
+            job = finished_job(middleware, ["x" * 10] * 100)
+            jobs.add(job)
+            job.compact(jobs.spill_size)
+            jobs.compacted(job)
+
+        assert [job["id"] for job in jobs.query([], {})] == [3]
+        assert jobs.query([["state", "=", "SUCCESS"]], {"count": True}) == 1
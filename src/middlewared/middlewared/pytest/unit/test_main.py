@@ -1,5 +1,6 @@
 # -*- coding=utf-8 -*-
 import asyncio
+import errno
 import json
 import logging
 from unittest.mock import Mock, patch
@@ -8,9 +9,10 @@ from asyncmock import AsyncMock  # FIXME: python 3.8
 import pytest
 
 from middlewared.main import Application, Middleware
-from middlewared.service import accepts, job, CoreService, CRUDService
+from middlewared.service import accepts, job, CoreService, CRUDService, Service
 from middlewared.plugins.datastore.read import DatastoreService
 from middlewared.schema import Dict, Str
+from middlewared.service_exception import CallError, ValidationErrors
 
 
 class MockService(CRUDService):
@@ -86,3 +88,180 @@ async def test__job_service(caplog, method):
     result = json.loads(await fut)
 
     assert result["result"][0]["arguments"] == [{"password": "********"}]
+
+
+class BatchService(CRUDService):
+    @accepts(Str("value"))
+    async def echo(self, value):
+        return value
+
+    @accepts()
+    async def fail(self):
+        raise Exception("failed")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [False, True])
+async def test__batch(stream):
+    with patch("middlewared.main.multiprocessing"):
+        middleware = Middleware()
+    middleware.loop = asyncio.get_event_loop()
+    middleware.add_service(BatchService(middleware))
+
+    messages = []
+    fut = asyncio.Future()
+
+    def send_str(data):
+        message = json.loads(data)
+        messages.append(message)
+        if message["msg"] == "batch_result":
+            fut.set_result(message)
+
+    application = Application(middleware, asyncio.get_event_loop(), Mock(), Mock(send_str=AsyncMock(side_effect=send_str)))
+    application._py_exceptions = True
+    application.authenticated = True
+    application.authenticated_credentials = Mock(authorize=Mock(side_effect=lambda t, method: method != "batch.fail"))
+    application.handshake = True
+    await application.on_message({"id": "1", "msg": "batch", "stream": stream, "calls": [
+        {"id": "2", "method": "batch.echo", "params": ["a"]},
+        {"id": "3", "method": "batch.fail", "params": []},
+        {"id": "4", "method": "batch.echo", "params": ["b"]},
+    ]})
+    batch_result = await asyncio.wait_for(fut, 1)
+
+    if stream:
+        assert batch_result["results"] is None
+        results = {message["id"]: message for message in messages[:-1]}
+    else:
+        assert len(messages) == 1
+        assert [result["id"] for result in batch_result["results"]] == ["2", "3", "4"]
+        results = {result["id"]: result for result in batch_result["results"]}
+
+    assert results["2"]["result"] == "a"
+    assert results["3"]["error"]["reason"] == "Not authorized"
+    assert results["4"]["result"] == "b"
+    assert application.call_scheduler.counter == 0
+    assert middleware.metrics.snapshot()["methods"]["batch.echo"]["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test__batch_too_many_calls():
+    with patch("middlewared.main.multiprocessing"):
+        middleware = Middleware()
+    middleware.loop = asyncio.get_event_loop()
+
+    fut = asyncio.Future()
+    application = Application(middleware, asyncio.get_event_loop(), Mock(), Mock(send_str=AsyncMock(side_effect=fut.set_result)))
+    application.authenticated = True
+    application.handshake = True
+    with patch("middlewared.main.BATCH_MAX_CALLS", 1):
+        await application.on_message({"id": "1", "msg": "batch", "calls": [
+            {"id": "2", "method": "batch.echo", "params": ["a"]},
+            {"id": "3", "method": "batch.echo", "params": ["b"]},
+        ]})
+        result = json.loads(await asyncio.wait_for(fut, 1))
+
+    assert result["id"] == "1"
+    assert result["error"]["error"] == errno.E2BIG
+
+
+class TrustedService(Service):
+    @accepts(Str("data", max_length=1), trusted_internal=True)
+    async def echo(self, data):
+        return data
+
+
+@pytest.mark.asyncio
+async def test__call_internal_trusted():
+    with patch("middlewared.main.multiprocessing"):
+        middleware = Middleware()
+    middleware.loop = asyncio.get_event_loop()
+    middleware.add_service(TrustedService(middleware))
+
+    # Not being called on behalf of a websocket client does not make the call trusted
+    with pytest.raises(ValidationErrors):
+        await middleware.call("trusted.echo", "long")
+
+    assert await middleware.call_internal("trusted.echo", "long") == "long"
+
+
+def test__plugins_setup_graph():
+    with patch("middlewared.main.Middleware.EARLY_SETUP_PLUGINS", ["datastore", "auth", "system"]):
+        graph = Middleware._plugins_setup_graph([
+            ("smb", None, [], False),
+            ("system", None, [], False),
+            ("datastore", None, [], False),
+            ("failover_.remote", None, ["failover"], True),
+            ("ipmi", None, [], True),
+            ("failover", None, [], False),
+            ("kmip", None, ["missing"], False),
+        ])
+
+    assert graph == {
+        "datastore": set(),
+        "system": {"datastore"},
+        "smb": {"datastore", "system"},
+        "failover_.remote": {"datastore", "system", "failover"},
+        "ipmi": {"datastore", "system"},
+        "failover": {"datastore", "system", "smb"},
+        "kmip": {"datastore", "system", "failover"},
+    }
+
+
+def test__plugins_setup_graph_cycle():
+    with pytest.raises(RuntimeError) as e:
+        Middleware._plugins_setup_graph([("a", None, ["b"], True), ("b", None, ["a"], True)])
+
+    assert "cycle" in str(e.value)
+
+
+@pytest.mark.asyncio
+async def test__plugins_setup_concurrently():
+    with patch("middlewared.main.multiprocessing"):
+        middleware = Middleware()
+    middleware.loop = asyncio.get_event_loop()
+
+    events = []
+
+    def setup_func(name, delay):
+        async def setup(middleware):
+            events.append(f"{name} started")
+            await asyncio.sleep(delay)
+            events.append(f"{name} finished")
+        return setup
+
+    with patch("middlewared.main.Middleware.EARLY_SETUP_PLUGINS", ["datastore"]):
+        await middleware._Middleware__plugins_setup([
+            ("a", setup_func("a", 0.2), [], True),
+            ("b", setup_func("b", 0.1), [], True),
+            ("c", setup_func("c", 0), ["a"], True),
+            ("d", setup_func("d", 0.05), [], False),
+            ("e", setup_func("e", 0), [], False),
+            ("datastore", setup_func("datastore", 0), [], False),
+        ])
+
+    assert events == [
+        "datastore started", "datastore finished",
+        "a started", "b started", "d started", "d finished", "e started", "e finished", "b finished", "a finished",
+        "c started", "c finished",
+    ]
+    assert set(middleware.startup_timings["setup"]) == {"a", "b", "c", "d", "e", "datastore"}
+
+
+@pytest.mark.asyncio
+async def test__sampling_profiler():
+    with patch("middlewared.main.multiprocessing"):
+        middleware = Middleware()
+    middleware.loop = asyncio.get_event_loop()
+
+    async with middleware.sampling_profiler(0.001) as profiler:
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(CallError) as e:
+            async with middleware.sampling_profiler():
+                pass
+
+        assert e.value.errno == errno.EBUSY
+
+    assert profiler.count > 1
+    assert any(stack[0] == "MainThread" for stack in profiler.samples)
@@ -4,7 +4,7 @@ from mock import Mock
 from middlewared.service import job
 from middlewared.service_exception import ValidationErrors
 from middlewared.schema import (
-    accepts, Bool, Cron, Dict, Dir, File, Float, Int, IPAddr, List, Str, UnixPerm,
+    accepts, Any, Bool, Cron, Dict, Dir, File, Float, Int, IPAddr, List, Str, trusted_internal_method, UnixPerm,
 )
 
 
@@ -746,4 +746,67 @@ def test__schema_or_error_handler_attribute_name(schema, attribute):
     with pytest.raises(ValidationErrors) as ei:
         meth({})
 
-    assert ei.value.errors[0].attribute == attribute
\ No newline at end of file
+    assert ei.value.errors[0].attribute == attribute
+
+
+def test__schema_does_not_modify_arguments():
+
+    @accepts(Dict('data', Int('id'), List('items', items=[Dict('item', Str('name'), Int('size', default=0))]),
+                  Any('extra'), additional_attrs=True))
+    def meth(self, data):
+        data['items'][0]['name'] = 'changed'
+        data['extra']['key'] = 'changed'
+        data['other']['key'] = 'changed'
+        return data
+
+    data = {'id': '1', 'items': [{'name': 'a'}], 'extra': {'key': 'value'}, 'other': {'key': 'value'}}
+
+    assert meth(Mock(), data) == {
+        'id': 1, 'items': [{'name': 'changed', 'size': 0}], 'extra': {'key': 'changed'}, 'other': {'key': 'changed'},
+    }
+    assert data == {'id': '1', 'items': [{'name': 'a'}], 'extra': {'key': 'value'}, 'other': {'key': 'value'}}
+
+
+@pytest.mark.parametrize("attr,value", [
+    (Str('data'), 1),
+    (Str('data'), None),
+    (Str('data', null=True), None),
+    (Str('data', empty=False), ''),
+    (Str('data', max_length=3), 'long'),
+    (Int('data'), '5'),
+    (Int('data'), True),
+    (Bool('data'), 1),
+    (Bool('data', null=True, default=None), None),
+    (Dict('data', Str('name', required=True), Int('size', default=1)), {'name': 'a'}),
+    (Dict('data', Str('name', required=True)), {}),
+    (Dict('data', Str('name')), {'other': 1}),
+    (Dict('data', Str('name', max_length=1)), {'name': 'ab'}),
+    (List('data', items=[Int('item'), Str('item')]), [1, 'a']),
+    (List('data', items=[Int('item')]), ['a']),
+])
+def test__schema_compiled(attr, value):
+    def result(clean, validate):
+        try:
+            value_ = clean(value)
+            if validate is not None:
+                validate(value_)
+            return value_
+        except Exception as e:
+            return type(e), str(e)
+
+    assert result(*attr.compiled()) == result(attr.clean, attr.validate)
+
+
+def test__schema_trusted_internal():
+
+    class Service:
+        @accepts(Str('data', max_length=1), Int('count', default=1), trusted_internal=True)
+        def meth(self, data, count):
+            return data, count
+
+    service = Service()
+
+    with pytest.raises(ValidationErrors):
+        service.meth('long')
+
+    assert trusted_internal_method(service.meth)('long') == ('long', 1)
@@ -0,0 +1,95 @@
+"""
+Microbenchmarks for `@accepts` arguments cleaning and validation of frequently called internal methods. Compiled
+validators (with and without the `trusted_internal` fast path) are compared with deep copying arguments and walking
+the schema (the previous implementation). Timings are reported with `record_property` (run with `--junitxml` to
+see them).
+"""
+import copy
+import time
+
+import pytest
+
+from middlewared.plugins.cache import CacheService
+from middlewared.plugins.datastore.read import DatastoreService
+from middlewared.schema import Bool, clean_and_validate_arg, Dict, Int, List, Schemas, Str
+from middlewared.service_exception import ValidationErrors
+
+REPEAT = 2000
+
+SHARE_CREATE = Dict(
+    'sharing_create',
+    Str('path', required=True),
+    Str('name', max_length=80),
+    Str('comment', default=''),
+    List('hostsallow', items=[Str('host')]),
+    List('hostsdeny', items=[Str('host')]),
+    Bool('enabled', default=True),
+    Bool('ro', default=False),
+    Bool('browsable', default=True),
+    Bool('recyclebin', default=False),
+    Bool('guestok', default=False),
+    Bool('abe', default=False),
+    Bool('timemachine', default=False),
+    Int('timemachine_quota', default=0),
+    Str('purpose', enum=['NO_PRESET', 'DEFAULT_SHARE'], default='DEFAULT_SHARE'),
+    Dict('options', Str('vfsobjects', default=''), Int('max_connections', default=0)),
+)
+
+
+def resolve(accepts):
+    # Plugin method schemas are shared with other tests, only their copies can be resolved here
+    schemas = Schemas()
+    return [copy.deepcopy(attr).resolve(schemas) for attr in accepts]
+
+
+def measure(f):
+    start = time.perf_counter()
+    for i in range(REPEAT):
+        result = f()
+    return (time.perf_counter() - start) / REPEAT, result
+
+
+def legacy(accepts, args):
+    args = copy.deepcopy(args)
+    for attr, arg in zip(accepts, args):
+        attr.validate(attr.clean(arg))
+
+
+def compiled(accepts, args, validate=True):
+    verrors = ValidationErrors()
+    result = [clean_and_validate_arg(verrors, attr, arg, validate) for attr, arg in zip(accepts, args)]
+    verrors.check()
+    return result
+
+
+@pytest.mark.parametrize('name,accepts,args', [
+    (
+        'datastore.query',
+        DatastoreService.query.accepts,
+        ['account.bsdusers', [['id', '=', 1]], {'prefix': 'bsdusr_', 'get': True}],
+    ),
+    (
+        'datastore.query (extend)',
+        DatastoreService.query.accepts,
+        ['storage.disk', [], {'prefix': 'disk_', 'extend': 'disk.disk_extend', 'order_by': ['name']}],
+    ),
+    ('cache.put', CacheService.put.accepts, ['key', {'value': [1, 2, 3]}, 60]),
+    ('cache.get', CacheService.get.accepts, ['key']),
+    (
+        'sharing.create',
+        [SHARE_CREATE],
+        [{'path': '/mnt/tank/share', 'name': 'share', 'hostsallow': ['10.0.0.1', '10.0.0.2'], 'options': {}}],
+    ),
+])
+def test__schema_benchmark(record_property, name, accepts, args):
+    accepts = resolve(accepts)
+
+    legacy_time, _ = measure(lambda: legacy(accepts, args))
+    compiled_time, compiled_result = measure(lambda: compiled(accepts, args))
+    trusted_time, trusted_result = measure(lambda: compiled(accepts, args, False))
+
+    assert compiled_result == trusted_result == [attr.clean(copy.deepcopy(arg)) for attr, arg in zip(accepts, args)]
+
+    record_property('legacy_us', round(legacy_time * 1000000, 3))
+    record_property('compiled_us', round(compiled_time * 1000000, 3))
+    record_property('trusted_us', round(trusted_time * 1000000, 3))
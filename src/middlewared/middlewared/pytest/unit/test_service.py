@@ -1,10 +1,12 @@
 import asyncio
 import threading
 import time
+from unittest.mock import Mock, patch
 
 import pytest
 
-from middlewared.service import throttle
+from middlewared.pytest.unit.middleware import Middleware
+from middlewared.service import CoreService, CRUDService, throttle
 
 
 @pytest.mark.timeout(10)
@@ -69,3 +71,89 @@ async def test__async_throttle():
     assert values[0] - start < 1
     assert 1.99 <= values[1] - values[0] < 3
     assert 1.99 <= values[2] - values[1] < 3
+
+
+class RawFieldsService(CRUDService):
+    class Config:
+        datastore = 'test.test'
+        datastore_extend = 'test.extend'
+        datastore_raw_fields = ('id', 'name')
+
+
+@pytest.mark.parametrize('filters,options,sql_filters,sql_options,post_filters', [
+    (
+        [['id', '=', 1]], {'limit': 1},
+        [['id', '=', 1]], {'limit': 1}, None,
+    ),
+    (
+        [['OR', [['id', '=', 1], ['name', 'in', ['a', 'b']]]]], {'order_by': ['-name']},
+        [['OR', [['id', '=', 1], ['name', 'in', ['a', 'b']]]]], {'order_by': ['-name']}, None,
+    ),
+    (
+        [['id', '=', 1], ['extended', '=', True]], {'limit': 1},
+        [['id', '=', 1]], {'limit': None}, [['extended', '=', True]],
+    ),
+    (
+        [['id', '=', 1]], {'order_by': ['extended']},
+        [['id', '=', 1]], {'order_by': None}, [],
+    ),
+    (
+        [['name', '~', 'a']], {},
+        [], {}, [['name', '~', 'a']],
+    ),
+])
+@pytest.mark.asyncio
+async def test__crud_service__query_raw_fields(filters, options, sql_filters, sql_options, post_filters):
+    m = Middleware()
+    m['datastore.query'] = Mock(return_value=[])
+    with patch('middlewared.service.filter_list') as filter_list:
+        query = RawFieldsService.query
+        while hasattr(query, 'wraps'):
+            query = query.wraps
+        await query(RawFieldsService(m), filters, {'force_sql_filters': False, **options})
+
+    assert m['datastore.query'].call_args[0][1] == sql_filters
+    for k, v in sql_options.items():
+        assert m['datastore.query'].call_args[0][2].get(k) == v
+    if post_filters is None:
+        filter_list.assert_not_called()
+    else:
+        assert filter_list.call_args[0][1] == post_filters
+
+
+@pytest.mark.parametrize("concurrency,max_running", [(1, 1), (3, 3)])
+@pytest.mark.asyncio
+async def test__core_bulk(concurrency, max_running):
+    running = 0
+    running_max = 0
+
+    async def method(i):
+        nonlocal running, running_max
+        running += 1
+        running_max = max(running, running_max)
+        await asyncio.sleep(0.01 * (5 - i))
+        running -= 1
+        if i == 2:
+            raise ValueError("Invalid")
+        return i * 10
+
+    m = Middleware()
+    m["test.method"] = method
+    job = Mock()
+
+    statuses = await CoreService(m).bulk(job, "test.method", [[i] for i in range(5)], None, concurrency)
+
+    assert statuses == [
+        {"result": 0, "error": None},
+        {"result": 10, "error": None},
+        {"result": None, "error": "Invalid"},
+        {"result": 30, "error": None},
+        {"result": 40, "error": None},
+    ]
+    assert running_max == max_running
+    assert job.set_progress.call_args[0][0] == 100
+    assert sorted(
+        status["index"]
+        for call in job.set_progress.call_args_list
+        for status in (call[1].get("extra") or {}).get("statuses", [])
+    ) == list(range(5))
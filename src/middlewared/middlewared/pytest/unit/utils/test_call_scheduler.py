@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from middlewared.service import call_priority, no_auth_required
+from middlewared.utils.call_scheduler import CallPriority, CallScheduler, LoopLag, method_priority
+from middlewared.utils.lock import SoftHardSemaphoreLimit
+
+
+async def hold(scheduler, priority, started, release, name):
+    async with scheduler.slot(priority, name):
+        started.append(name)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test__priorities():
+    scheduler = CallScheduler(2, 20)
+    release = asyncio.Event()
+    started = []
+
+    tasks = [
+        asyncio.ensure_future(hold(scheduler, priority, started, release, name))
+        for priority, name in [
+            (CallPriority.BACKGROUND, "background1"),
+            (CallPriority.BACKGROUND, "background2"),
+            (CallPriority.BULK, "bulk"),
+            (CallPriority.BACKGROUND, "background3"),
+            (CallPriority.INTERACTIVE, "interactive"),
+        ]
+    ]
+    await asyncio.sleep(0)
+
+    assert started == ["background1", "background2", "interactive"]
+    assert scheduler.running == 3
+    assert [call["method"] for call in scheduler.stats()["queued"]] == ["background3", "bulk"]
+
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*tasks), 1)
+
+    assert started[3:] == ["background3", "bulk"]
+    assert scheduler.counter == 0
+
+
+@pytest.mark.asyncio
+async def test__hardlimit():
+    scheduler = CallScheduler(1, 2)
+    release = asyncio.Event()
+    started = []
+
+    tasks = [
+        asyncio.ensure_future(hold(scheduler, CallPriority.BACKGROUND, started, release, str(i)))
+        for i in range(2)
+    ]
+    await asyncio.sleep(0)
+
+    with pytest.raises(SoftHardSemaphoreLimit):
+        async with scheduler.slot(CallPriority.BACKGROUND):
+            pass
+
+    async with scheduler.slot(CallPriority.INTERACTIVE):
+        pass
+
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*tasks), 1)
+
+
+@pytest.mark.asyncio
+async def test__cancelled_call_leaves_queue():
+    scheduler = CallScheduler(1, 20)
+    release = asyncio.Event()
+    started = []
+
+    running = asyncio.ensure_future(hold(scheduler, CallPriority.BACKGROUND, started, release, "running"))
+    queued = asyncio.ensure_future(hold(scheduler, CallPriority.BACKGROUND, started, release, "queued"))
+    await asyncio.sleep(0)
+
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+
+    assert scheduler.queued == 0
+
+    release.set()
+    await asyncio.wait_for(running, 1)
+    assert scheduler.counter == 0
+
+
+def test__loop_lag_limit():
+    lag = LoopLag(threshold=0.1, min_factor=0.2, step=0.1)
+    scheduler = CallScheduler(10, 20, lag)
+
+    lag.update(0.5)
+    assert scheduler.limit == 5
+    assert scheduler.priority_limit(CallPriority.BULK) == 2
+
+    for i in range(5):
+        lag.update(0.5)
+    assert scheduler.limit == 2
+
+    lag.update(0)
+    assert scheduler.limit == 3
+
+
+def test__method_priority():
+    @call_priority(CallPriority.BULK)
+    def bulk():
+        pass
+
+    @no_auth_required
+    def login():
+        pass
+
+    def query():
+        pass
+
+    assert method_priority(bulk) == CallPriority.BULK
+    assert method_priority(login) == CallPriority.INTERACTIVE
+    assert method_priority(query) == CallPriority.BACKGROUND
@@ -1,3 +1,6 @@
+import pytest
+
+from middlewared.service_exception import MatchNotFound
 from middlewared.utils import filter_list
 
 
@@ -84,3 +87,107 @@ def test__filter_list_OR_eq2():
         ['number', '=', 1],
         ['number', '=', 2],
     ]]])) == 2
+
+
+def test__filter_list_dotted_path():
+    assert filter_list([{'a': {'b': 1}}, {'a': {'b': 2}}, {'a.b': 1}], [['a.b', '=', 1]]) == [{'a': {'b': 1}}]
+
+
+def test__filter_list_escaped_dot():
+    assert filter_list([{'a': {'b': 1}}, {'a.b': 1}], [['a\\.b', '=', 1]]) == [{'a.b': 1}]
+
+
+def test__filter_list_objects():
+    class Obj:
+        def __init__(self, foo):
+            self.foo = foo
+
+    assert [o.foo for o in filter_list([Obj(1), Obj(2)], [['foo', '>', 1]])] == [2]
+
+
+def test__filter_list_invalid_operation():
+    with pytest.raises(ValueError):
+        filter_list(DATA, [['foo', '===', 1]])
+
+
+def test__filter_list_select():
+    assert filter_list(DATA, [['number', '=', 1]], {'select': ['foo']}) == [{'foo': 'foo1'}]
+
+
+def test__filter_list_count():
+    assert filter_list(DATA, [['number', '>', 1]], {'count': True}) == 2
+
+
+def test__filter_list_get():
+    assert filter_list(DATA, [['number', '>', 1]], {'get': True})['number'] == 2
+
+
+def test__filter_list_get_order_by():
+    assert filter_list(DATA, [['number', '>', 1]], {'get': True, 'order_by': ['-number']})['number'] == 3
+
+
+def test__filter_list_get_not_found():
+    with pytest.raises(MatchNotFound):
+        filter_list(DATA, [['number', '>', 3]], {'get': True})
+
+
+def test__filter_list_offset_limit():
+    assert [i['number'] for i in filter_list(DATA, [], {'offset': 1, 'limit': 1})] == [2]
+
+
+def test__filter_list_limit_generator():
+    assert [i['number'] for i in filter_list(iter(DATA), [['number', '>', 0]], {'limit': 2})] == [1, 2]
+
+
+@pytest.mark.parametrize('order_by,result', [
+    (['a', 'b'], [(1, 1), (2, 1), (1, 2), (2, 2)]),
+    (['-a', '-b'], [(2, 2), (1, 2), (2, 1), (1, 1)]),
+    (['a', '-b'], [(1, 2), (2, 2), (1, 1), (2, 1)]),
+    (['-a', 'b'], [(2, 1), (1, 1), (2, 2), (1, 2)]),
+])
+def test__filter_list_order_by_composite(order_by, result):
+    data = [{'a': a, 'b': b} for a, b in [(2, 1), (1, 2), (2, 2), (1, 1)]]
+    assert [(i['a'], i['b']) for i in filter_list(data, [], {'order_by': order_by})] == result
+
+
+@pytest.mark.parametrize('order_by', [
+    ['a', 'b'],
+    ['b', 'a'],
+    ['-a', 'b', 'c'],
+    ['a', '-b', '-c'],
+    ['-c', '-a', '-b'],
+])
+def test__filter_list_order_by_composite_matches_sequential_sort(order_by):
+    data = [{'a': i % 2, 'b': i % 3, 'c': i % 5, 'id': i} for i in range(30)]
+
+    # `filter_list` used to sort the list by each `order_by` item in turn
+    result = data
+    for o in order_by:
+        result = sorted(result, key=lambda i: i[o.lstrip('-')], reverse=o.startswith('-'))
+
+    assert [i['id'] for i in filter_list(data, [], {'order_by': order_by})] == [i['id'] for i in result]
+
+
+@pytest.mark.parametrize('order_by,result', [
+    (['nulls_first:a'], [None, 1, 2]),
+    (['nulls_last:a'], [1, 2, None]),
+    (['nulls_first:-a'], [None, 2, 1]),
+    (['nulls_last:-a'], [2, 1, None]),
+    (['nulls_first:-a', 'b'], [None, 2, 1]),
+    (['nulls_last:a', '-b'], [1, 2, None]),
+])
+def test__filter_list_order_by_nulls(order_by, result):
+    data = [{'a': a, 'b': 0} for a in [2, None, 1]]
+    assert [i['a'] for i in filter_list(data, [], {'order_by': order_by})] == result
+
+
+def test__filter_list_cache_does_not_share_values():
+    values = [1]
+    assert len(filter_list(DATA, [['number', 'in', values]])) == 1
+    values.append(2)
+    assert len(filter_list(DATA, [['number', 'in', values]])) == 2
+
+
+def test__filter_list_cache_distinguishes_types():
+    assert filter_list(DATA, [], {'get': 1}) == DATA
+    assert filter_list(DATA, [], {'get': True}) == DATA[0]
@@ -0,0 +1,75 @@
+"""
+Microbenchmarks for `filter_list`. Results are compared with the previous (interpreted) implementation and timings
+are reported with `record_property` (run with `--junitxml` to see them).
+"""
+import re
+import time
+
+import pytest
+
+from middlewared.utils import filter_list
+from middlewared.utils.filters import get
+
+ROWS = [
+    {
+        'id': i,
+        'name': f'tank/dataset{i}',
+        'type': 'FILESYSTEM' if i % 10 else 'VOLUME',
+        'properties': {'used': {'parsed': i * 1024}, 'encryption': {'value': 'off' if i % 3 else 'on'}},
+    }
+    for i in range(5000)
+]
+REPEAT = 5
+
+
+def legacy_filter_list(_list, filters, options):
+    opmap = {
+        '=': lambda x, y: x == y,
+        '>': lambda x, y: x > y,
+        '~': lambda x, y: re.match(y, x),
+        'in': lambda x, y: x in y,
+        '^': lambda x, y: x is not None and x.startswith(y),
+    }
+
+    def filterop(i, f):
+        if len(f) == 2:
+            return any(filterop(i, f) for f in f[1])
+        name, op, value = f
+        return opmap[op](get(i, name), value)
+
+    rv = [i for i in _list if all(filterop(i, f) for f in filters)]
+    for o in options.get('order_by', []):
+        reverse = o.startswith('-')
+        rv = sorted(rv, key=lambda x: x[o.lstrip('-')], reverse=reverse)
+    if options.get('get'):
+        return rv[0]
+    if options.get('limit'):
+        return rv[:options['limit']]
+    return rv
+
+
+def measure(f, *args):
+    start = time.perf_counter()
+    for i in range(REPEAT):
+        result = f(*args)
+    return (time.perf_counter() - start) / REPEAT, result
+
+
+@pytest.mark.parametrize('filters,options', [
+    ([['type', '=', 'VOLUME']], {}),
+    ([['properties.encryption.value', '=', 'on'], ['properties.used.parsed', '>', 1024 * 1024]], {}),
+    ([['name', '~', r'tank/dataset1\d+$']], {}),
+    ([['OR', [['type', '=', 'VOLUME'], ['id', 'in', [1, 2, 3]]]]], {}),
+    ([['name', '^', 'tank/']], {'order_by': ['-id']}),
+    ([['name', '^', 'tank/']], {'order_by': ['-id', 'type']}),
+    ([['name', '^', 'tank/']], {'get': True}),
+    ([['name', '^', 'tank/']], {'limit': 10}),
+])
+def test__filter_list_benchmark(record_property, filters, options):
+    legacy_time, legacy_result = measure(legacy_filter_list, ROWS, filters, options)
+    compiled_time, compiled_result = measure(filter_list, ROWS, filters, options)
+
+    assert compiled_result == legacy_result
+
+    record_property('legacy_ms', round(legacy_time * 1000, 3))
+    record_property('compiled_ms', round(compiled_time * 1000, 3))
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+
+from middlewared.utils.io_thread_pool_executor import IoThreadPoolExecutor, is_priority
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test__elastic_size():
+    executor = IoThreadPoolExecutor('IoThread', 1, 3, idle_timeout=0.1)
+    try:
+        event = threading.Event()
+        futures = [executor.submit(event.wait) for i in range(5)]
+        assert executor.stats()['workers'] == 3
+        assert executor.stats()['saturated'] == 2
+
+        event.set()
+        assert all(future.result(5) for future in futures)
+
+        wait_for(lambda: executor.stats()['workers'] == 1)
+        assert executor.stats()['reaped'] == 2
+    finally:
+        executor.shutdown()
+
+
+def test__idle_threads_are_reused():
+    executor = IoThreadPoolExecutor('IoThread', 1, 3)
+    try:
+        for i in range(10):
+            assert executor.submit(sum, [i, 1]).result(5) == i + 1
+            wait_for(lambda: executor.stats()['idle'] == 1)
+
+        assert executor.stats()['spawned'] == 1
+    finally:
+        executor.shutdown()
+
+
+def test__exception():
+    executor = IoThreadPoolExecutor('IoThread', 1, 1)
+    try:
+        future = executor.submit(int, 'x')
+        assert isinstance(future.exception(5), ValueError)
+    finally:
+        executor.shutdown()
+
+
+def test__nested_calls_do_not_deadlock():
+    executor = IoThreadPoolExecutor('IoThread', 1, 2, max_overflow_workers=3)
+    try:
+        event = threading.Event()
+        blocker = executor.submit(event.wait)
+
+        def nested(depth):
+            if depth == 0:
+                return threading.current_thread().name
+            return executor.submit(nested, depth - 1).result(5)
+
+        assert executor.submit(nested, 3).result(5).startswith('IoThread_')
+        assert executor.stats()['overflow'] >= 2
+
+        event.set()
+        assert blocker.result(5)
+    finally:
+        executor.shutdown()
+
+
+def test__coroutines_waited_by_pool_threads_do_not_deadlock():
+    # i.e. `call_sync` of a coroutine method that does `run_in_thread`
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    executor = IoThreadPoolExecutor('IoThread', 1, 1)
+    try:
+        async def coroutine():
+            return await loop.run_in_executor(executor, sum, [1, 2])
+
+        def call_sync():
+            return asyncio.run_coroutine_threadsafe(coroutine(), loop).result(5)
+
+        assert executor.submit(call_sync).result(5) == 3
+        assert executor.stats()['overflow'] == 1
+    finally:
+        executor.shutdown()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def test__overflow_is_limited():
+    executor = IoThreadPoolExecutor('IoThread', 1, 1, max_overflow_workers=1)
+    try:
+        event = threading.Event()
+        futures = executor.submit(lambda: [executor.submit(event.wait) for i in range(3)]).result(5)
+        assert executor.stats()['workers'] == 2
+        assert executor.stats()['overflow'] == 1
+        assert executor.stats()['temporary'] == 2
+
+        event.set()
+        assert all(future.result(5) for future in futures)
+    finally:
+        executor.shutdown()
+
+
+def test__nested_calls_above_overflow_limit_do_not_deadlock():
+    executor = IoThreadPoolExecutor('IoThread', 1, 1, max_overflow_workers=1)
+    try:
+        def nested(depth):
+            if depth == 0:
+                return threading.current_thread().name
+            return executor.submit(nested, depth - 1).result(5)
+
+        assert executor.submit(nested, 5).result(10).startswith('IoThread_temporary_')
+        assert executor.stats()['workers'] == 2
+        assert executor.stats()['overflow'] == 1
+        assert executor.stats()['temporary'] == 4
+    finally:
+        executor.shutdown()
+
+
+def test__background_tasks_lose_priority():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    executor = IoThreadPoolExecutor('IoThread', 1, 1)
+    try:
+        started = asyncio.Event(loop=loop)
+        priorities = []
+
+        async def background():
+            await started.wait()
+            priorities.append(is_priority())
+
+        async def coroutine():
+            priorities.append(is_priority())
+            return asyncio.ensure_future(background())
+
+        def call_sync():
+            return asyncio.run_coroutine_threadsafe(coroutine(), loop).result(5)
+
+        task = executor.submit(call_sync).result(5)
+        loop.call_soon_threadsafe(started.set)
+        wait_for(task.done)
+
+        assert priorities == [True, False]
+    finally:
+        executor.shutdown()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+def test__shutdown_runs_queued_calls():
+    executor = IoThreadPoolExecutor('IoThread', 1, 1)
+    event = threading.Event()
+    executor.submit(event.wait)
+    future = executor.submit(sum, [1, 2])
+
+    event.set()
+    executor.shutdown()
+    assert future.result(0) == 3
+    assert executor.stats()['workers'] == 0
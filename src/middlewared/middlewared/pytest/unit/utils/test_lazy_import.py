@@ -0,0 +1,13 @@
+import sys
+
+from middlewared.utils.lazy_import import lazy_import
+
+
+def test__lazy_import():
+    sys.modules.pop("xml.dom.minidom", None)
+
+    minidom = lazy_import("xml.dom.minidom")
+    assert "xml.dom.minidom" not in sys.modules
+
+    assert minidom.parseString("<a/>").documentElement.tagName == "a"
+    assert "xml.dom.minidom" in sys.modules
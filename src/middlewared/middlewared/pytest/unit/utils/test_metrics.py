@@ -0,0 +1,45 @@
+import pytest
+
+from middlewared.utils.call_scheduler import LoopLag
+from middlewared.utils.metrics import Histogram, Metrics
+
+
+def test__histogram_percentiles():
+    histogram = Histogram()
+    for i in range(98):
+        histogram.observe(0.001)
+    histogram.observe(0.5)
+    histogram.observe(2)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100
+    assert snapshot["max"] == 2
+    assert snapshot["avg"] == pytest.approx((0.098 + 2.5) / 100)
+    # Estimates are at most sqrt(2) times higher than the real value
+    assert 0.001 <= snapshot["p50"] <= 0.001 * 2 ** 0.5
+    assert 0.5 <= snapshot["p99"] <= 0.5 * 2 ** 0.5
+
+
+def test__histogram_percentile_never_exceeds_max():
+    histogram = Histogram()
+    histogram.observe(0.0011)
+
+    assert histogram.percentile(0.5) == 0.0011
+
+
+def test__histogram_empty():
+    assert Histogram().snapshot() == {"count": 0, "avg": None, "max": 0, "p50": None, "p90": None, "p99": None}
+
+
+def test__metrics_snapshot():
+    metrics = Metrics()
+    LoopLag(on_sample=metrics.loop_lag.observe).update(0.2)
+    metrics.observe_call("pool.query", 0.01)
+    metrics.observe_call("pool.query", 0.02, error=True)
+    metrics.observe_executor_wait("io_thread", 0.001)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["methods"]["pool.query"]["count"] == 2
+    assert snapshot["methods"]["pool.query"]["errors"] == 1
+    assert snapshot["executors"]["io_thread"]["count"] == 1
+    assert snapshot["loop_lag"]["max"] == 0.2
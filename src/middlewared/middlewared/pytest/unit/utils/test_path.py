@@ -0,0 +1,18 @@
+import pytest
+
+from middlewared.utils.path import path_in_locked_datasets
+
+LOCKED_DATASETS = [
+    {"id": "tank/locked", "mountpoint": "/mnt/tank/locked"},
+    {"id": "tank/unmounted", "mountpoint": None},
+]
+
+
+@pytest.mark.parametrize("path,locked", [
+    ("/mnt/tank/locked", True),
+    ("/mnt/tank/locked/share", True),
+    ("/mnt/tank/locked2", False),
+    ("/mnt/tank", False),
+])
+def test__path_in_locked_datasets(path, locked):
+    assert path_in_locked_datasets(path, LOCKED_DATASETS) == locked
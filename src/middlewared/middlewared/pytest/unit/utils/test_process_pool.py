@@ -0,0 +1,55 @@
+from concurrent.futures.process import BrokenProcessPool
+import functools
+import operator
+import os
+import time
+
+import pytest
+
+from middlewared.utils.process_pool import ProcessPool
+
+
+@pytest.fixture()
+def pool():
+    pool = ProcessPool(1, 2, initializer=functools.partial(os.umask, 0o027))
+    pool.start()
+    try:
+        yield pool
+    finally:
+        pool.shutdown()
+
+
+def test__call(pool):
+    assert pool.submit(operator.add, 1, 2).result(30) == 3
+    assert pool.submit(os.getpid).result(30) != os.getpid()
+
+
+def test__workers_are_forked_from_preloaded_zygote(pool):
+    # `os.umask` returns the previous value
+    assert pool.submit(os.umask, 0o027).result(30) == 0o027
+    assert pool.submit(os.getppid).result(30) != os.getpid()
+
+
+def test__exception(pool):
+    with pytest.raises(ZeroDivisionError):
+        pool.submit(operator.truediv, 1, 0).result(30)
+
+    assert pool.submit(operator.add, 1, 2).result(30) == 3
+
+
+def test__crashed_worker_is_replaced(pool):
+    pid = pool.submit(os.getpid).result(30)
+
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result(30)
+
+    assert pool.submit(os.getpid).result(30) != pid
+    assert pool.stats()["replaced"] == 1
+
+
+def test__elastic_size(pool):
+    futures = [pool.submit(time.sleep, 1) for i in range(4)]
+    for future in futures:
+        future.result(30)
+
+    assert pool.stats()["spawned"] == 2
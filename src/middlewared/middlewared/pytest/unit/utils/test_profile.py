@@ -0,0 +1,65 @@
+import threading
+
+from middlewared.utils.profile import (
+    format_collapsed, format_speedscope, SamplingProfiler, worker_profiled_call,
+)
+
+
+def busy_function(stop):
+    stop.wait()
+
+
+def test__sampling_profiler():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_function, args=(stop,), name='busy')
+    thread.start()
+    try:
+        profiler = SamplingProfiler(0.001)
+        profiler.run(0.05)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert profiler.count > 1
+    stacks = [stack for stack in profiler.samples if stack[0] == 'busy']
+    assert stacks
+    assert any(frame.startswith('busy_function (') for frame in stacks[0])
+    # Sampler thread does not sample itself
+    assert not any(stack[0] == 'MainThread' for stack in profiler.samples)
+
+
+def test__sampling_profiler_stop():
+    stop = threading.Event()
+    profiler = SamplingProfiler(10)
+    thread = threading.Thread(target=profiler.run, kwargs={'stop': stop})
+    thread.start()
+    stop.set()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert profiler.count <= 1
+
+
+def test__format_collapsed():
+    samples = {('MainThread', 'main (a.py:1)', 'f (a.py:5)'): 3, ('IoThread', 'run (b.py:1)'): 1}
+    assert format_collapsed(samples) == (
+        'IoThread;run (b.py:1) 1\n'
+        'MainThread;main (a.py:1);f (a.py:5) 3\n'
+    )
+
+
+def test__format_speedscope():
+    samples = {('MainThread', 'main', 'f'): 3, ('MainThread', 'main'): 1, ('IoThread', 'f'): 2}
+    result = format_speedscope(samples, 0.01)
+
+    frames = [frame['name'] for frame in result['shared']['frames']]
+    profiles = {profile['name']: profile for profile in result['profiles']}
+    assert [[frames[i] for i in stack] for stack in profiles['MainThread']['samples']] == [['main'], ['main', 'f']]
+    assert profiles['MainThread']['weights'] == [0.01, 0.03]
+    assert profiles['IoThread']['endValue'] == 0.02
+
+
+def test__worker_profiled_call():
+    result, samples = worker_profiled_call(0.001, sum, ([1, 2],), {})
+    assert result == 3
+    assert all(stack[0].startswith('worker ') for stack in samples)
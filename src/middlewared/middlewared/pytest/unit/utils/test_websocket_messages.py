@@ -0,0 +1,77 @@
+import json
+
+from middlewared.utils.websocket_messages import WebsocketMessagesRing
+
+
+def dump_args(params, method_name=None):
+    return ["********" if method_name == "auth.login" else param for param in params]
+
+
+def test__disabled_by_default():
+    ring = WebsocketMessagesRing(dump_args)
+
+    assert not ring.enabled
+
+
+def test__entries():
+    ring = WebsocketMessagesRing(dump_args)
+    ring.set_enabled(True)
+    ring.append("incoming", "1", json.dumps({"id": "1", "msg": "method", "method": "auth.login", "params": ["secret"]}))
+    ring.append("outgoing", "1", json.dumps({"id": "1", "msg": "result", "result": True}))
+
+    assert ring.entries() == [
+        {
+            "type": "incoming",
+            "session_id": "1",
+            "message": {"id": "1", "msg": "method", "method": "auth.login", "params": ["********"]},
+        },
+        {"type": "outgoing", "session_id": "1", "message": {"id": "1", "msg": "result", "result": True}},
+    ]
+
+
+def test__entries_batch():
+    ring = WebsocketMessagesRing(dump_args)
+    ring.set_enabled(True)
+    ring.append("incoming", "1", json.dumps({"id": "1", "msg": "batch", "calls": [
+        {"id": "2", "method": "auth.login", "params": ["secret"]},
+        {"id": "3", "method": "system.info", "params": []},
+    ]}))
+
+    assert ring.entries()[0]["message"]["calls"] == [
+        {"id": "2", "method": "auth.login", "params": ["********"]},
+        {"id": "3", "method": "system.info", "params": []},
+    ]
+
+
+def test__redacted_when_stored():
+    ring = WebsocketMessagesRing(dump_args)
+    ring.set_enabled(True)
+    ring.append("incoming", "1", json.dumps({"id": "1", "msg": "method", "method": "auth.login", "params": ["secret"]}))
+
+    assert "secret" not in repr(ring.messages)
+
+
+def test__maxlen():
+    ring = WebsocketMessagesRing(dump_args, maxlen=2)
+    ring.set_enabled(True)
+    for i in range(3):
+        ring.append("outgoing", "1", json.dumps({"id": str(i)}))
+
+    assert [entry["message"]["id"] for entry in ring.entries()] == ["1", "2"]
+
+
+def test__truncated():
+    ring = WebsocketMessagesRing(dump_args, max_message_size=16)
+    ring.set_enabled(True)
+    ring.append("incoming", "1", json.dumps({"id": "1", "msg": "method", "method": "auth.login", "params": ["secret"]}))
+
+    assert ring.entries()[0]["message"]["truncated"] is True
+
+
+def test__disable_clears():
+    ring = WebsocketMessagesRing(dump_args)
+    ring.set_enabled(True)
+    ring.append("outgoing", "1", "{}")
+    ring.set_enabled(False)
+
+    assert ring.entries() == []
@@ -10,6 +10,7 @@ import errno
 import inspect
 import ipaddress
 import os
+import types
 
 from croniter import croniter
 
@@ -18,6 +19,16 @@ from middlewared.settings import conf
 from middlewared.utils import filter_list
 
 NOT_PROVIDED = object()
+IMMUTABLE_TYPES = (type(None), bool, int, float, str)
+
+
+def copy_value(value):
+    """
+    Copies a value that is not described by a schema so that it is not shared between the caller and the callee.
+    """
+    if type(value) in IMMUTABLE_TYPES:
+        return value
+    return copy.deepcopy(value)
 
 
 def convert_schema(spec):
@@ -115,13 +126,61 @@ class Attribute(object):
             raise Error(self.name, 'null not allowed')
         if value is NOT_PROVIDED:
             if self.has_default:
-                value = copy.deepcopy(self.default)
+                value = copy_value(self.default)
             else:
                 raise Error(self.name, 'attribute required')
         if not self.editable and value != self.default:
             raise Error(self.name, 'Field is not editable.')
         return value
 
+    def compiled(self):
+        """
+        Returns `(clean, validate)` functions specialized for this attribute. `validate` is `None` if it does nothing.
+        Compiled functions are cached until the attribute is resolved again.
+        """
+        compiled = self.__dict__.get('_compiled')
+        if compiled is None:
+            compiled = self._compiled = (self._compile_clean(), self._compile_validate())
+        return compiled
+
+    def _compile_clean(self):
+        return self.clean
+
+    def _compile_validate(self):
+        if type(self).validate is Attribute.validate and not self.validators:
+            return None
+        return self.validate
+
+    def _compile_scalar_clean(self, convert):
+        """
+        Compiles `Attribute.clean` followed by `convert(value)` for values that are not `None`.
+        """
+        if not self.editable or getattr(self, 'enum', None) is not None:
+            return self.clean
+
+        name, null, has_default, default = self.name, self.null, self.has_default, self.default
+
+        def clean(value):
+            if value is None:
+                if not null:
+                    raise Error(name, 'null not allowed')
+                return value
+            if value is NOT_PROVIDED:
+                if not has_default:
+                    raise Error(name, 'attribute required')
+                value = copy_value(default)
+                if value is None:
+                    return value
+            return convert(value)
+
+        return clean
+
+    def __getstate__(self):
+        # Compiled functions are bound to the original attribute
+        state = self.__dict__.copy()
+        state.pop('_compiled', None)
+        return state
+
     def has_private(self):
         return self.private
 
@@ -183,6 +242,7 @@ class Attribute(object):
         )
         """
         self.resolved = True
+        self._compiled = None
         if self.register:
             schemas.add(self)
         return self
@@ -195,6 +255,9 @@ class Attribute(object):
 
 class Any(Attribute):
 
+    def clean(self, value):
+        return copy_value(super().clean(value))
+
     def to_json_schema(self, parent=None):
         return {
             'anyOf': [
@@ -228,6 +291,43 @@ class Str(EnumMixin, Attribute):
             raise Error(self.name, 'Empty value not allowed')
         return value
 
+    def _compile_clean(self):
+        if type(self).clean is not Str.clean:
+            return super()._compile_clean()
+
+        name, empty = self.name, self.empty
+
+        def convert(value):
+            if isinstance(value, int) and not isinstance(value, bool):
+                value = str(value)
+            if not isinstance(value, str):
+                raise Error(name, 'Not a string')
+            if not empty and not value:
+                raise Error(name, 'Empty value not allowed')
+            return value
+
+        return self._compile_scalar_clean(convert)
+
+    def _compile_validate(self):
+        if type(self).validate is not Str.validate:
+            return super()._compile_validate()
+
+        name, max_length, validators = self.name, self.max_length, self.validators
+
+        def validate(value):
+            if value is None:
+                return
+
+            if value and len(str(value)) > max_length:
+                verrors = ValidationErrors()
+                verrors.add(name, f'Value greater than {max_length} not allowed')
+                raise verrors
+
+            if validators:
+                Attribute.validate(self, value)
+
+        return validate
+
     def to_json_schema(self, parent=None):
         schema = self._to_json_schema_common(parent)
 
@@ -471,6 +571,19 @@ class Bool(Attribute):
             raise Error(self.name, 'Not a boolean')
         return value
 
+    def _compile_clean(self):
+        if type(self).clean is not Bool.clean:
+            return super()._compile_clean()
+
+        name = self.name
+
+        def convert(value):
+            if not isinstance(value, bool):
+                raise Error(name, 'Not a boolean')
+            return value
+
+        return self._compile_scalar_clean(convert)
+
     def to_json_schema(self, parent=None):
         return {
             'type': ['boolean', 'null'] if self.null else 'boolean',
@@ -490,6 +603,21 @@ class Int(EnumMixin, Attribute):
             raise Error(self.name, 'Not an integer')
         return value
 
+    def _compile_clean(self):
+        if type(self).clean is not Int.clean:
+            return super()._compile_clean()
+
+        name = self.name
+
+        def convert(value):
+            if not isinstance(value, int) or isinstance(value, bool):
+                if isinstance(value, str) and value.isdigit():
+                    return int(value)
+                raise Error(name, 'Not an integer')
+            return value
+
+        return self._compile_scalar_clean(convert)
+
     def to_json_schema(self, parent=None):
         return {
             'type': ['integer', 'null'] if self.null else 'integer',
@@ -529,6 +657,10 @@ class List(EnumMixin, Attribute):
         super(List, self).__init__(*args, **kwargs)
 
     def clean(self, value):
+        return self._clean(value, [i.clean for i in self.items])
+
+    def _clean(self, value, items):
+        # A new list is built so the caller's data is never modified
         value = super(List, self).clean(value)
         if value is None:
             return copy.deepcopy(self.default)
@@ -536,19 +668,38 @@ class List(EnumMixin, Attribute):
             raise Error(self.name, 'Not a list')
         if not self.empty and not value:
             raise Error(self.name, 'Empty value not allowed')
-        if self.items:
-            for index, v in enumerate(value):
-                for i in self.items:
-                    try:
-                        tmpval = copy.deepcopy(v)
-                        value[index] = i.clean(tmpval)
-                        found = True
-                        break
-                    except (Error, ValidationErrors) as e:
-                        found = e
-                if self.items and found is not True:
-                    raise Error(self.name, 'Item#{0} is not valid per list types: {1}'.format(index, found))
-        return value
+        if not items:
+            return copy_value(value)
+
+        result = []
+        for index, v in enumerate(value):
+            found = None
+            for clean in items:
+                try:
+                    result.append(clean(v))
+                    break
+                except (Error, ValidationErrors) as e:
+                    found = e
+            else:
+                raise Error(self.name, 'Item#{0} is not valid per list types: {1}'.format(index, found))
+        return result
+
+    def _compile_clean(self):
+        if type(self).clean is not List.clean:
+            return super()._compile_clean()
+
+        items = [i.compiled()[0] for i in self.items]
+        return lambda value: self._clean(value, items)
+
+    def _compile_validate(self):
+        if type(self).validate is not List.validate:
+            return super()._compile_validate()
+
+        # Items are validated until the first one that succeeds so nothing is done if the first one never fails
+        if self.unique or self.validators or (self.items and self.items[0].compiled()[1] is not None):
+            return self.validate
+
+        return None
 
     def has_private(self):
         return self.private or any(item.has_private() for item in self.items)
@@ -604,6 +755,7 @@ class List(EnumMixin, Attribute):
         if self.register:
             schemas.add(self)
         self.resolved = True
+        self._compiled = None
         return self
 
     def copy(self):
@@ -674,6 +826,10 @@ class Dict(Attribute):
         return skip_attrs
 
     def clean(self, data):
+        return self._clean(data, {name: attr.clean for name, attr in self.attrs.items()})
+
+    def _clean(self, data, cleaners):
+        # A new dict is built so the caller's data is never modified
         data = super().clean(data)
 
         if data is None:
@@ -686,38 +842,78 @@ class Dict(Attribute):
             raise Error(self.name, 'A dict was expected')
 
         verrors = ValidationErrors()
-        for key, value in list(data.items()):
-            if not self.additional_attrs:
-                if key not in self.attrs:
+        result = {}
+        for key, value in data.items():
+            clean = cleaners.get(key)
+            if clean is None:
+                if not self.additional_attrs:
                     verrors.add(f'{self.name}.{key}', 'Field was not expected')
-                    continue
 
-            attr = self.attrs.get(key)
-            if not attr:
+                result[key] = copy_value(value)
                 continue
 
-            data[key] = self._clean_attr(attr, value, verrors)
+            result[key] = self._clean_attr(clean, value, verrors)
 
         # Do not make any field and required and not populate default values
         if not self.update:
-            data.update(self.get_defaults(data, self.get_attrs_to_skip(data), verrors))
+            skip_attrs = self.get_attrs_to_skip(result) if self.conditional_defaults else {}
+            for name, attr in self.attrs.items():
+                if name not in result and name not in skip_attrs and (attr.required or attr.has_default):
+                    result[name] = self._clean_attr(cleaners[name], NOT_PROVIDED, verrors)
 
         verrors.check()
 
-        return data
+        return result
+
+    def _compile_clean(self):
+        if type(self).clean is not Dict.clean:
+            return super()._compile_clean()
+
+        cleaners = {name: attr.compiled()[0] for name, attr in self.attrs.items()}
+        return lambda data: self._clean(data, cleaners)
+
+    def _compile_validate(self):
+        if type(self).validate is not Dict.validate:
+            return super()._compile_validate()
+
+        validators = [
+            (name, validate) for name, validate in (
+                (name, attr.compiled()[1]) for name, attr in self.attrs.items()
+            ) if validate is not None
+        ]
+        if not validators:
+            return None
+
+        def validate(value):
+            if value is None:
+                return
+
+            verrors = ValidationErrors()
+
+            for name, attr_validate in validators:
+                if name in value:
+                    try:
+                        attr_validate(value[name])
+                    except ValidationErrors as e:
+                        verrors.add_child(self.name, e)
+
+            if verrors:
+                raise verrors
+
+        return validate
 
     def get_defaults(self, orig_data, skip_attrs, verrors, check_required=True):
-        data = copy.deepcopy(orig_data)
+        data = dict(orig_data)
         for attr in list(self.attrs.values()):
             if attr.name not in data and attr.name not in skip_attrs and (
                 (check_required and attr.required) or attr.has_default
             ):
-                data[attr.name] = self._clean_attr(attr, NOT_PROVIDED, verrors)
+                data[attr.name] = self._clean_attr(attr.clean, NOT_PROVIDED, verrors)
         return data
 
-    def _clean_attr(self, attr, value, verrors):
+    def _clean_attr(self, clean, value, verrors):
         try:
-            return attr.clean(value)
+            return clean(value)
         except Error as e:
             verrors.add(f'{self.name}.{e.attribute}', e.errmsg, e.errno)
         except ValidationErrors as e:
@@ -776,6 +972,7 @@ class Dict(Attribute):
         if self.register:
             schemas.add(self)
         self.resolved = True
+        self._compiled = None
         return self
 
     def copy(self):
@@ -995,8 +1192,7 @@ class OROperator:
         verrors = ValidationErrors()
         for index, i in enumerate(self.schemas):
             try:
-                tmpval = copy.deepcopy(value)
-                final_value = i.clean(tmpval)
+                final_value = i.clean(value)
             except (Error, ValidationErrors) as e:
                 if isinstance(e, Error):
                     verrors.add(e.attribute, e.errmsg, e.errno)
@@ -1035,6 +1231,9 @@ class OROperator:
             '_required_': self.required,
         }
 
+    def compiled(self):
+        return self.clean, self.validate
+
     def resolve(self, schemas):
         for index, i in enumerate(self.schemas):
             if not i.resolved:
@@ -1106,7 +1305,6 @@ def validate_return_type(func, result, schemas):
     elif not schemas:
         raise ValueError(f'Return schema missing for {func.__name__!r}')
 
-    result = copy.deepcopy(result)
     if not isinstance(result, tuple):
         result = [result]
 
@@ -1116,10 +1314,12 @@ def validate_return_type(func, result, schemas):
     verrors.check()
 
 
-def clean_and_validate_arg(verrors, attr, arg):
+def clean_and_validate_arg(verrors, attr, arg, validate=True):
+    clean, attr_validate = attr.compiled()
     try:
-        value = attr.clean(arg)
-        attr.validate(value)
+        value = clean(arg)
+        if validate and attr_validate is not None:
+            attr_validate(value)
         return value
     except Error as e:
         verrors.add(e.attribute, e.errmsg, e.errno)
@@ -1154,8 +1354,15 @@ def returns(*schema):
     return returns_internal
 
 
-def accepts(*schema, deprecated=None):
+def accepts(*schema, deprecated=None, trusted_internal=False):
     """
+    Arguments are cleaned and validated according to `schema`. Cleaning builds new containers so the caller's data
+    is never modified.
+
+    `trusted_internal` enables a fast path for `middleware.call_internal` calls (that are never made with the
+    arguments that come from a client): their arguments are only cleaned (i.e. default values are populated) but not
+    validated. It should only be used for frequently called internal methods which callers always pass valid data.
+
     `deprecated` is a list of pairs of functions that will adapt legacy method call signatures.
 
     First member of pair is a function that accepts a list of args and returns `True` if a legacy method call
@@ -1209,7 +1416,7 @@ def accepts(*schema, deprecated=None):
             args_index += f._skip_arg
         assert len(schema) == f.__code__.co_argcount - args_index  # -1 for self
 
-        def clean_and_validate_args(args, kwargs):
+        def clean_and_validate_args(args, kwargs, validate=True):
             args = list(args)
 
             common_args = args[:args_index]
@@ -1223,8 +1430,8 @@ def accepts(*schema, deprecated=None):
                         had_warning = True
                     signature_args = adapt(*signature_args)
 
-            args = common_args + copy.deepcopy(signature_args)
-            kwargs = copy.deepcopy(kwargs)
+            args = common_args + list(signature_args)
+            kwargs = dict(kwargs)
 
             verrors = ValidationErrors()
 
@@ -1233,7 +1440,9 @@ def accepts(*schema, deprecated=None):
             if len(args[args_index:]) > len(nf.accepts):
                 raise CallError(f'Too many arguments (expected {len(nf.accepts)}, found {len(args[args_index:])})')
             for _ in args[args_index:]:
-                args[args_index + i] = clean_and_validate_arg(verrors, nf.accepts[i], args[args_index + i])
+                args[args_index + i] = clean_and_validate_arg(
+                    verrors, nf.accepts[i], args[args_index + i], validate,
+                )
                 i += 1
 
             # Use i counter to map keyword argument to rpc positional
@@ -1253,7 +1462,7 @@ def accepts(*schema, deprecated=None):
                     i += 1
                     continue
 
-                kwargs[kwarg] = clean_and_validate_arg(verrors, attr, value)
+                kwargs[kwarg] = clean_and_validate_arg(verrors, attr, value, validate)
 
             if verrors:
                 raise verrors
@@ -1264,11 +1473,19 @@ def accepts(*schema, deprecated=None):
             async def nf(*args, **kwargs):
                 args, kwargs = clean_and_validate_args(args, kwargs)
                 return await func(*args, **kwargs)
+
+            async def trusted_nf(*args, **kwargs):
+                args, kwargs = clean_and_validate_args(args, kwargs, False)
+                return await func(*args, **kwargs)
         else:
             def nf(*args, **kwargs):
                 args, kwargs = clean_and_validate_args(args, kwargs)
                 return func(*args, **kwargs)
 
+            def trusted_nf(*args, **kwargs):
+                args, kwargs = clean_and_validate_args(args, kwargs, False)
+                return func(*args, **kwargs)
+
         from middlewared.utils.type import copy_function_metadata
         copy_function_metadata(f, nf)
         nf.accepts = list(schema)
@@ -1276,7 +1493,26 @@ def accepts(*schema, deprecated=None):
             nf.returns = func.returns
         nf.wraps = f
         nf.wrap = wrap
+        if trusted_internal:
+            nf.trusted_internal = (nf, trusted_nf)
 
         return nf
 
     return wrap
+
+
+def trusted_internal_method(methodobj):
+    """
+    Returns `@accepts(..., trusted_internal=True)` method variant that does not validate its arguments (or the
+    method itself if it has no such variant).
+    """
+    func = getattr(methodobj, '__func__', methodobj)
+    trusted = getattr(func, 'trusted_internal', None)
+    # Other decorators might have copied the attribute from the wrapped function
+    if trusted is None or trusted[0] is not func:
+        return methodobj
+
+    if func is not methodobj:
+        return types.MethodType(trusted[1], methodobj.__self__)
+
+    return trusted[1]
@@ -1,3 +1,4 @@
+import contextlib
 import copy
 from collections import defaultdict, namedtuple
 from functools import wraps
@@ -19,18 +20,24 @@ import ipaddress
 import psutil
 
 from middlewared.common.environ import environ_update
+from middlewared.event import EventSource
 import middlewared.main
-from middlewared.schema import accepts, Any, Bool, convert_schema, Dict, Int, List, OROperator, Patch, Ref, returns, Str
+from middlewared.schema import (
+    accepts, Any, Bool, convert_schema, Dict, Float, Int, List, OROperator, Patch, Ref, returns, Str,
+)
 from middlewared.service_exception import (  # noqa
     CallException, CallError, InstanceNotFound, ValidationError, ValidationErrors
 )
 from middlewared.settings import conf
 from middlewared.utils import filter_list, osc
+from middlewared.utils.call_scheduler import CallPriority, method_priority  # noqa
 from middlewared.utils.debug import get_frame_details, get_threads_stacks
+from middlewared.utils.path import path_in_locked_datasets
 from middlewared.logger import Logger, reconfigure_logging, stop_logging
 from middlewared.job import Job
 from middlewared.pipe import Pipes
 from middlewared.utils.type import copy_function_metadata
+from middlewared.worker import client_stats as worker_client_stats
 from middlewared.async_validators import check_path_resides_within_volume
 from middlewared.validators import Range, IpAddress
 
@@ -38,6 +45,10 @@ PeriodicTaskDescriptor = namedtuple("PeriodicTaskDescriptor", ["interval", "run_
 get_or_insert_lock = asyncio.Lock()
 LOCKS = defaultdict(asyncio.Lock)
 MIDDLEWARE_STARTED_SENTINEL_PATH = "/var/run/middlewared-started"
+# Operators that behave identically in `datastore.query` and `filter_list`
+RAW_FILTERS_OPERATORS = ('=', 'in', '>', '>=', '<', '<=')
+# `core.bulk` reports completed items statuses at most once per this interval (in seconds)
+BULK_PROGRESS_INTERVAL = 1
 
 
 def lock(lock_str):
@@ -249,6 +260,14 @@ def no_auth_required(fn):
     return fn
 
 
+def call_priority(priority):
+    """Schedule websocket calls of the given method with `priority` (see `CallPriority`)."""
+    def wrapper(fn):
+        fn._call_priority = priority
+        return fn
+    return wrapper
+
+
 def pass_app(rest=False):
     """Pass the application instance as parameter to the method."""
     def wrapper(fn):
@@ -340,6 +359,10 @@ class ServiceBase(type):
     Currently the following options are allowed:
       - datastore: name of the datastore mainly used in the service
       - datastore_extend: datastore `extend` option used in common `query` method
+      - datastore_extend_batch: datastore `extend_batch` option used in common `query` method (extends all rows in
+                                a single call and is used instead of `datastore_extend`)
+      - datastore_raw_fields: fields that are not changed by `datastore_extend`. Filters and ordering that only use
+                              these fields are evaluated by the database in common `query` method
       - datastore_prefix: datastore `prefix` option used in helper methods
       - service: system service `name` option used by `SystemServiceService`
       - service_model: system service datastore model option used by `SystemServiceService` (`service` if used if not provided)
@@ -383,6 +406,8 @@ def service_config(klass, config):
         'datastore_prefix': '',
         'datastore_extend': None,
         'datastore_extend_context': None,
+        'datastore_extend_batch': None,
+        'datastore_raw_fields': (),
         'datastore_primary_key': 'id',
         'datastore_primary_key_type': 'integer',
         'event_register': True,
@@ -554,6 +579,7 @@ class ConfigService(ServiceChangeMixin, Service, metaclass=ConfigServiceMetabase
         options = {}
         options['extend'] = self._config.datastore_extend
         options['extend_context'] = self._config.datastore_extend_context
+        options['extend_batch'] = self._config.datastore_extend_batch
         options['prefix'] = self._config.datastore_prefix
         return await self._get_or_insert(self._config.datastore, options)
 
@@ -567,14 +593,14 @@ class ConfigService(ServiceChangeMixin, Service, metaclass=ConfigServiceMetabase
     @private
     async def _get_or_insert(self, datastore, options):
         try:
-            return await self.middleware.call('datastore.config', datastore, options)
+            return await self.middleware.call_internal('datastore.config', datastore, options)
         except IndexError:
             async with get_or_insert_lock:
                 try:
-                    return await self.middleware.call('datastore.config', datastore, options)
+                    return await self.middleware.call_internal('datastore.config', datastore, options)
                 except IndexError:
                     await self.middleware.call('datastore.insert', datastore, {})
-                    return await self.middleware.call('datastore.config', datastore, options)
+                    return await self.middleware.call_internal('datastore.config', datastore, options)
 
 
 class TDBWrapConfigService(ConfigService):
@@ -741,6 +767,7 @@ class SystemServiceService(ConfigService):
             f'services.{self._config.service_model or self._config.service}', {
                 'extend': self._config.datastore_extend,
                 'extend_context': self._config.datastore_extend_context,
+                'extend_batch': self._config.datastore_extend_batch,
                 'prefix': self._config.datastore_prefix
             }
         )
@@ -868,6 +895,7 @@ class CRUDService(ServiceChangeMixin, Service, metaclass=CRUDServiceMetabase):
         options = options or {}
         options['extend'] = self._config.datastore_extend
         options['extend_context'] = self._config.datastore_extend_context
+        options['extend_batch'] = self._config.datastore_extend_batch
         options['prefix'] = self._config.datastore_prefix
         return options
 
@@ -885,22 +913,51 @@ class CRUDService(ServiceChangeMixin, Service, metaclass=CRUDServiceMetabase):
         options = await self.get_options(options)
 
         # In case we are extending which may transform the result in numerous ways
-        # we can only filter the final result. Exception is when forced to use sql
-        # for filters for performance reasons.
-        if not options['force_sql_filters'] and options['extend']:
-            datastore_options = options.copy()
-            datastore_options.pop('count', None)
-            datastore_options.pop('get', None)
-            result = await self.middleware.call(
-                'datastore.query', self._config.datastore, [], datastore_options
-            )
-            return await self.middleware.run_in_thread(
-                filter_list, result, filters, options
-            )
-        else:
-            return await self.middleware.call(
-                'datastore.query', self._config.datastore, filters, options,
-            )
+        # we can only filter the final result by fields that are not `datastore_raw_fields`.
+        # Exception is when forced to use sql for filters for performance reasons.
+        if not options['force_sql_filters'] and (options['extend'] or options['extend_batch']):
+            sql_filters, filters = self._split_datastore_filters(filters)
+            if filters or not all(map(self._is_raw_order_by, options.get('order_by') or [])):
+                datastore_options = options.copy()
+                for k in ('count', 'get', 'offset', 'limit', 'order_by'):
+                    datastore_options.pop(k, None)
+                result = await self.middleware.call_internal(
+                    'datastore.query', self._config.datastore, sql_filters, datastore_options
+                )
+                return await self.middleware.run_in_thread(
+                    filter_list, result, filters, options
+                )
+
+            filters = sql_filters
+
+        return await self.middleware.call_internal(
+            'datastore.query', self._config.datastore, filters, options,
+        )
+
+    def _split_datastore_filters(self, filters):
+        """
+        Splits `filters` into the ones that can be evaluated by the database (they only use `datastore_raw_fields`)
+        and the ones that must be applied to the extended rows.
+        """
+        sql_filters = []
+        other_filters = []
+        for f in filters:
+            (sql_filters if self._is_raw_filter(f) else other_filters).append(f)
+
+        return sql_filters, other_filters
+
+    def _is_raw_filter(self, f):
+        if len(f) == 2 and f[0] == 'OR':
+            return all(map(self._is_raw_filter, f[1]))
+
+        return len(f) == 3 and f[0] in self._config.datastore_raw_fields and f[1] in RAW_FILTERS_OPERATORS
+
+    def _is_raw_order_by(self, order_by):
+        for prefix in ('nulls_first:', 'nulls_last:'):
+            if order_by.startswith(prefix):
+                order_by = order_by[len(prefix):]
+
+        return order_by.lstrip('-') in self._config.datastore_raw_fields
 
     @pass_app(rest=True)
     async def create(self, app, data):
@@ -1090,9 +1147,7 @@ class SharingTaskService(CRUDService):
 
     @private
     async def sharing_task_determine_locked(self, data, locked_datasets):
-        return await self.middleware.call(
-            'pool.dataset.path_in_locked_datasets', data[self.path_field], locked_datasets
-        )
+        return path_in_locked_datasets(data[self.path_field], locked_datasets)
 
     @private
     async def sharing_task_extend(self, data, context):
@@ -1101,18 +1156,31 @@ class SharingTaskService(CRUDService):
         if self._config.datastore_extend:
             data = await self.middleware.call(self._config.datastore_extend, *args)
 
-        data[self.locked_field] = await self.middleware.call(
-            f'{self._config.namespace}.sharing_task_determine_locked', data, context['locked_datasets']
-        )
+        data[self.locked_field] = await self.sharing_task_determine_locked(data, context['locked_datasets'])
 
         return data
 
+    @private
+    async def sharing_task_extend_batch(self, rows, context):
+        args = [context['service_extend']] if self._config.datastore_extend_context else []
+
+        if self._config.datastore_extend_batch:
+            rows = await self.middleware.call(self._config.datastore_extend_batch, rows, *args)
+        elif self._config.datastore_extend:
+            rows = [await self.middleware.call(self._config.datastore_extend, row, *args) for row in rows]
+
+        for row in rows:
+            row[self.locked_field] = await self.sharing_task_determine_locked(row, context['locked_datasets'])
+
+        return rows
+
     @private
     async def get_options(self, options):
         return {
             **(await super().get_options(options)),
             'extend': f'{self._config.namespace}.sharing_task_extend',
             'extend_context': f'{self._config.namespace}.sharing_task_extend_context',
+            'extend_batch': f'{self._config.namespace}.sharing_task_extend_batch',
         }
 
     @private
@@ -1425,6 +1493,28 @@ class ServicePartBase(metaclass=ServicePartBaseMeta):
     pass
 
 
+class MetricsEventSource(EventSource):
+    """
+    Sends `core.metrics` every `interval` seconds.
+
+    Usage: core.metrics:{"interval": 10}
+    """
+
+    async def run(self):
+        options = {
+            "interval": 10,
+            **(self.arg or {}),
+        }
+        if options["interval"] < 1:
+            raise CallError("Interval should be >= 1")
+
+        while not self._cancel.is_set():
+            self.send_event("ADDED", fields=await self.middleware.call("core.metrics"))
+
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._cancel.wait(), options["interval"])
+
+
 class CoreService(Service):
 
     class Config:
@@ -1442,7 +1532,7 @@ class CoreService(Service):
         shell.resize(cols, rows)
 
     @filterable
-    def sessions(self, filters, options):
+    async def sessions(self, filters, options):
         """
         Get currently open websocket sessions.
         """
@@ -1461,7 +1551,8 @@ class CoreService(Service):
                     )
                 ),
                 'authenticated': i.authenticated,
-                'call_count': i._softhardsemaphore.counter,
+                'call_count': i.call_scheduler.counter,
+                'calls': i.call_scheduler.stats(),
             }
             for i in self.middleware.get_wsclients().values()
         ], filters, options)
@@ -1499,10 +1590,39 @@ class CoreService(Service):
     @filterable
     def get_jobs(self, filters, options):
         """Get the long running jobs."""
-        jobs = filter_list([
-            i.__encode__() for i in list(self.middleware.jobs.all().values())
-        ], filters, options)
-        return jobs
+        return self.middleware.jobs.query(filters, options)
+
+    @private
+    async def set_jobs_retention(self, options):
+        """
+        Configure how many finished jobs are kept (`maxlen`), for how long (`max_age`, in seconds), which results are
+        stored on disk (`spill_size`, in bytes) and how much space these can take (`max_spilled_size`, in bytes).
+        """
+        for k in ('maxlen', 'max_age', 'spill_size', 'max_spilled_size'):
+            if k in options:
+                setattr(self.middleware.jobs.deque, k, options[k])
+
+        self.middleware.jobs.deque.age_checked_at = 0
+        self.middleware.jobs.deque.evict()
+
+    @private
+    async def get_job_locks(self):
+        """
+        Returns queue depth and wait time (in seconds) statistics for each job lock name.
+        """
+        return self.middleware.jobs.lock_stats()
+
+    @private
+    async def metrics(self):
+        """
+        Returns middleware telemetry collected since start: per-method calls latencies (in seconds) and errors count,
+        executors queue wait times, event loop lag samples, process pool and IoThread pool state.
+        """
+        return {
+            **self.middleware.metrics.snapshot(),
+            'process_pool': self.middleware.process_pool_stats(),
+            'io_thread_pool': self.middleware.io_thread_pool_stats(),
+        }
 
     @accepts()
     @returns(List('websocket_messages', items=[Dict(
@@ -1514,8 +1634,28 @@ class CoreService(Service):
     def get_websocket_messages(self):
         """
         Retrieve last 1000 incoming/outgoing message(s) logged over websocket.
+
+        Messages are only logged while `core.set_websocket_messages_logging` is enabled.
+        """
+        return self.middleware.websocket_messages.entries()
+
+    @accepts(Bool('enabled'))
+    @returns()
+    async def set_websocket_messages_logging(self, enabled):
+        """
+        Enable or disable logging of websocket messages for `core.get_websocket_messages`.
+
+        Disabling it drops already logged messages.
+        """
+        self.middleware.websocket_messages.set_enabled(enabled)
+
+    @accepts()
+    @returns(Bool())
+    async def websocket_messages_logging_enabled(self):
+        """
+        Returns whether websocket messages are being logged for `core.get_websocket_messages`.
         """
-        return list(self.middleware.socket_messages_queue)
+        return self.middleware.websocket_messages.enabled
 
     @private
     def jobs_stop_logging(self):
@@ -1759,6 +1899,7 @@ class CoreService(Service):
                     'examples': examples,
                     'item_method': True if item_method else hasattr(method, '_item_method'),
                     'no_auth_required': hasattr(method, '_no_auth_required'),
+                    'call_priority': method_priority(method).name,
                     'filterable': hasattr(method, '_filterable'),
                     'filterable_schema': filterable_schema,
                     'pass_application': hasattr(method, '_pass_app'),
@@ -1832,6 +1973,7 @@ class CoreService(Service):
     async def event_send(self, name, event_type, kwargs):
         self.middleware.send_event(name, event_type, **kwargs)
 
+    @call_priority(CallPriority.INTERACTIVE)
     @accepts()
     def ping(self):
         """
@@ -2049,52 +2191,160 @@ class CoreService(Service):
             RemotePdb(options['bind_address'], options['bind_port']).set_trace()
 
     @private
-    async def profile(self, method, params=None):
-        return await self.middleware.call(method, *(params or []), profile=True)
+    @accepts(
+        Str('method'),
+        List('params', null=True),
+        Dict(
+            'options',
+            Str('mode', enum=['CPROFILE', 'SAMPLING'], default='CPROFILE'),
+            Str('format', enum=['COLLAPSED', 'SPEEDSCOPE'], default='COLLAPSED'),
+            Float('interval', default=0.01, validators=[Range(min=0.001)]),
+            Bool('workers', default=True),
+        ),
+    )
+    async def profile(self, method, params, options):
+        """
+        Profile a single `method` call.
+
+        `CPROFILE` mode returns `cProfile` statistics text followed by the call result. `SAMPLING` mode samples all
+        middlewared threads (and process pool workers if `workers` is set) every `interval` seconds while the call
+        runs and returns `{"result": ..., "profile": ...}` where profile is in collapsed stacks or speedscope format.
+        """
+        if options['mode'] == 'CPROFILE':
+            return await self.middleware.call(method, *(params or []), profile=True)
+
+        async with self.middleware.sampling_profiler(options['interval'], options['workers']) as profiler:
+            result = await self.middleware.call(method, *(params or []))
+
+        return {'result': result, 'profile': profiler.output(options['format'])}
+
+    @private
+    @accepts(Dict(
+        'core-profile-sampling',
+        Int('duration', default=10, validators=[Range(min=1, max=3600)]),
+        Str('format', enum=['COLLAPSED', 'SPEEDSCOPE'], default='COLLAPSED'),
+        Float('interval', default=0.01, validators=[Range(min=0.001)]),
+        Bool('workers', default=True),
+    ))
+    @job(lock='profile_sampling')
+    async def profile_sampling(self, job, options):
+        """
+        Sample stacks of the whole running middlewared (event loop, IoThreads, process pool workers calls) every
+        `interval` seconds for `duration` seconds.
+
+        Output can be fed to flamegraph.pl (`COLLAPSED`) or opened in https://www.speedscope.app/ (`SPEEDSCOPE`), e.g.
+        `midclt call -j 1 -jp description core.profile_sampling '{"duration": 30}' > middlewared.collapsed`
+        """
+        async with self.middleware.sampling_profiler(options['interval'], options['workers']) as profiler:
+            for i in range(options['duration']):
+                job.set_progress(i * 100 / options['duration'], 'Sampling')
+                await asyncio.sleep(1)
+
+        job.set_progress(100, f'Collected {profiler.count} samples')
+        return profiler.output(options['format'])
 
     @private
     def threads_stacks(self):
         return get_threads_stacks()
 
-    @accepts(Str("method"), List("params"), Str("description", null=True, default=None))
+    @private
+    async def worker_client_stats(self):
+        """
+        Returns number of connections opened versus calls served by the persistent middlewared client
+        of the process pool worker that happened to run this call.
+        """
+        return await self.middleware.run_in_proc(worker_client_stats)
+
+    @private
+    def process_pool_stats(self):
+        """
+        Returns number of running, idle and starting process pool workers, number of queued calls and how many workers
+        were started and replaced after a crash so far.
+        """
+        return self.middleware.process_pool_stats()
+
+    @private
+    def io_thread_pool_stats(self):
+        """
+        Returns number of running and idle IoThreads, number of queued calls (normal and priority lane) and how many
+        threads were started and reaped so far, how many calls were queued because the pool was saturated, how
+        many threads were started above the limit to run priority lane calls and how many priority lane calls were run
+        in temporary threads because that limit was reached too.
+        """
+        return self.middleware.io_thread_pool_stats()
+
+    @accepts(
+        Str("method"),
+        List("params"),
+        Str("description", null=True, default=None),
+        Int("concurrency", default=1, validators=[Range(min=1)]),
+    )
     @job(lock=lambda args: f"bulk:{args[0]}")
-    async def bulk(self, job, method, params, description):
+    @call_priority(CallPriority.BULK)
+    async def bulk(self, job, method, params, description, concurrency):
         """
         Will loop on a list of items for the given method, returning a list of
         dicts containing a result and error key.
 
         `description` contains format string for job progress (e.g. "Deleting snapshot {0[dataset]}@{0[name]}")
 
+        Up to `concurrency` items are processed at the same time.
+
+        Statuses of the items that were completed since the previous progress update are reported in job progress
+        `extra` as `{"statuses": [{"index": 0, "result": ..., "error": ...}]}` so they can be displayed before the
+        whole batch finishes (the same status might be reported more than once).
+
         Result will be the message returned by the method being called,
         or a string of an error, in which case the error key will be the
         exception
         """
-        statuses = []
+        statuses = [None] * len(params)
         if not params:
             return statuses
 
-        for i, p in enumerate(params):
-            progress_description = f"{i} / {len(params)}"
-            if description is not None:
-                progress_description += ": " + description.format(*p)
+        semaphore = asyncio.Semaphore(concurrency)
+        done = 0
+        completed = []
+        flushed_at = time.monotonic()
 
-            job.set_progress(100 * i / len(params), progress_description)
+        def set_progress():
+            job.set_progress(100 * done / len(params), extra={"statuses": list(completed)})
+            completed.clear()
 
-            try:
-                msg = await self.middleware.call(method, *p)
-                error = None
+        async def process(i, p):
+            nonlocal done, flushed_at
+
+            async with semaphore:
+                progress_description = f"{done} / {len(params)}"
+                if description is not None:
+                    progress_description += ": " + description.format(*p)
+
+                job.set_progress(100 * done / len(params), progress_description)
+
+                try:
+                    msg = await self.middleware.call(method, *p)
+                    error = None
+
+                    if isinstance(msg, Job):
+                        b_job = msg
+                        msg = await msg.wait()
+
+                        if b_job.error:
+                            error = b_job.error
 
-                if isinstance(msg, Job):
-                    b_job = msg
-                    msg = await msg.wait()
+                    statuses[i] = {"result": msg, "error": error}
+                except Exception as e:
+                    statuses[i] = {"result": None, "error": str(e)}
 
-                    if b_job.error:
-                        error = b_job.error
+            done += 1
+            completed.append({"index": i, **statuses[i]})
+            if time.monotonic() - flushed_at >= BULK_PROGRESS_INTERVAL:
+                flushed_at = time.monotonic()
+                set_progress()
 
-                statuses.append({"result": msg, "error": error})
-            except Exception as e:
-                statuses.append({"result": None, "error": str(e)})
+        await asyncio.gather(*[process(i, p) for i, p in enumerate(params)])
 
+        set_progress()
         return statuses
 
     _environ = {}
@@ -0,0 +1,166 @@
+import asyncio
+from collections import deque
+import contextlib
+import enum
+import time
+
+from .lock import SoftHardSemaphoreLimit
+
+# Interactive calls can run in this many slots above the connection budget
+INTERACTIVE_RESERVE = 2
+
+
+class CallPriority(enum.IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+    BULK = 2
+
+
+def method_priority(methodobj):
+    """
+    Methods can set their priority with `@call_priority`. Methods that do not require authentication (i.e.
+    `auth.login`) are interactive, everything else runs in the background.
+    """
+    priority = getattr(methodobj, '_call_priority', None)
+    if priority is not None:
+        return priority
+
+    if hasattr(methodobj, '_no_auth_required'):
+        return CallPriority.INTERACTIVE
+
+    return CallPriority.BACKGROUND
+
+
+class LoopLag:
+    """
+    Measures how late event loop callbacks run and derives `factor` (`min_factor` <= factor <= 1) that per-connection
+    call budgets are multiplied by. The factor is halved each time the lag exceeds `threshold` and grows back by `step`
+    otherwise. Every lag sample is also passed to `on_sample`.
+    """
+
+    def __init__(self, interval=0.5, threshold=0.1, min_factor=0.2, step=0.1, on_sample=None):
+        self.interval = interval
+        self.threshold = threshold
+        self.min_factor = min_factor
+        self.step = step
+        self.on_sample = on_sample
+
+        self.loop = None
+        self.expected = None
+        self.lag = 0
+        self.factor = 1.0
+
+    def start(self, loop):
+        self.loop = loop
+        self._schedule()
+
+    def _schedule(self):
+        self.expected = self.loop.time() + self.interval
+        self.loop.call_at(self.expected, self._tick)
+
+    def _tick(self):
+        self.update(self.loop.time() - self.expected)
+        self._schedule()
+
+    def update(self, lag):
+        self.lag = lag
+        if self.on_sample is not None:
+            self.on_sample(lag)
+        if lag > self.threshold:
+            self.factor = max(self.min_factor, self.factor / 2)
+        else:
+            self.factor = min(1.0, self.factor + self.step)
+
+
+class CallScheduler:
+    """
+    Per-connection replacement for `SoftHardSemaphore` that admits queued calls by priority.
+
+    At most `softlimit` (scaled down by `lag.factor` when the event loop lags) calls run concurrently. Interactive calls
+    may use `INTERACTIVE_RESERVE` slots more and bulk calls at most half of them. When all the slots are busy calls are
+    queued (FIFO within a priority) and interactive ones are admitted first. `SoftHardSemaphoreLimit` is raised when
+    more than `hardlimit` calls are running or queued (interactive calls have their reserve here too).
+    """
+
+    def __init__(self, softlimit, hardlimit, lag=None):
+        self.softlimit = softlimit
+        self.hardlimit = hardlimit
+        self.lag = lag
+
+        self.running = 0
+        self.queues = {priority: deque() for priority in CallPriority}
+
+    @property
+    def limit(self):
+        return max(1, int(self.softlimit * (self.lag.factor if self.lag else 1)))
+
+    @property
+    def queued(self):
+        return sum(map(len, self.queues.values()))
+
+    @property
+    def counter(self):
+        return self.running + self.queued
+
+    def priority_limit(self, priority):
+        limit = self.limit
+        if priority == CallPriority.INTERACTIVE:
+            return limit + INTERACTIVE_RESERVE
+        if priority == CallPriority.BULK:
+            return max(1, limit // 2)
+        return limit
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority, method=None):
+        hardlimit = self.hardlimit + (INTERACTIVE_RESERVE if priority == CallPriority.INTERACTIVE else 0)
+        if self.counter >= hardlimit:
+            raise SoftHardSemaphoreLimit(self.hardlimit)
+
+        if self.running < self.priority_limit(priority) and not any(
+            self.queues[p] for p in CallPriority if p <= priority
+        ):
+            self.running += 1
+        else:
+            fut = asyncio.get_event_loop().create_future()
+            item = (fut, method, time.monotonic())
+            self.queues[priority].append(item)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    # Slot was granted right before cancellation
+                    self._release()
+                else:
+                    self.queues[priority].remove(item)
+                raise
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        self.running -= 1
+        self._wakeup()
+
+    def _wakeup(self):
+        for priority in CallPriority:
+            queue = self.queues[priority]
+            while queue and self.running < self.priority_limit(priority):
+                fut = queue.popleft()[0]
+                if not fut.done():
+                    self.running += 1
+                    fut.set_result(None)
+
+    def stats(self):
+        # Must be called from the event loop thread (queues are mutated there)
+        now = time.monotonic()
+        return {
+            'limit': self.limit,
+            'running': self.running,
+            'queued': [
+                {'method': method, 'priority': priority.name, 'waiting': now - queued_at}
+                for priority in CallPriority
+                for fut, method, queued_at in self.queues[priority]
+            ],
+        }
@@ -0,0 +1,297 @@
+import functools
+import itertools
+import operator
+import re
+
+from middlewared.service_exception import MatchNotFound
+
+OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '~': lambda x, y: y.match(x),  # `y` is compiled by `compile_filter`
+    'in': lambda x, y: x in y,
+    'nin': lambda x, y: x not in y,
+    'rin': lambda x, y: x is not None and y in x,
+    'rnin': lambda x, y: x is not None and y not in x,
+    '^': lambda x, y: x is not None and x.startswith(y),
+    '!^': lambda x, y: x is not None and not x.startswith(y),
+    '$': lambda x, y: x is not None and x.endswith(y),
+    '!$': lambda x, y: x is not None and not x.endswith(y),
+}
+OPTIONS = ('select', 'order_by', 'count', 'get', 'offset', 'limit')
+
+
+def partition(s):
+    rv = ''
+    while True:
+        left, sep, right = s.partition('.')
+        if not sep:
+            return rv + left, right
+        if left[-1] == '\\':
+            rv += left[:-1] + sep
+            s = right
+        else:
+            return rv + left, right
+
+
+def split_path(path):
+    parts = []
+    while path:
+        left, path = partition(path)
+        parts.append(left)
+    return parts
+
+
+def get_parts(obj, parts):
+    cur = obj
+    for left in parts:
+        if isinstance(cur, dict):
+            cur = cur.get(left)
+        elif isinstance(cur, (list, tuple)):
+            left = int(left)
+            cur = cur[left] if left < len(cur) else None
+    return cur
+
+
+def get(obj, path):
+    """
+    Get a path in obj using dot notation
+
+    e.g.
+        obj = {'foo': {'bar': '1'}, 'foo.bar': '2', 'foobar': ['first', 'second', 'third']}
+
+        path = 'foo.bar' returns '1'
+        path = 'foo\\.bar' returns '2'
+        path = 'foobar.0' returns 'first'
+    """
+    return get_parts(obj, split_path(path))
+
+
+class Reversed(object):
+    """
+    Inverts ordering of a value so that keys sorted in different directions can be combined into one sort key.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def reversed_key(key):
+    return lambda i: Reversed(key(i))
+
+
+class CompiledFilters(object):
+    """
+    Reusable representation of a `filters`/`options` pair. Call it with a list (or any iterable) to filter it.
+    """
+
+    def __init__(self, filters, options):
+        self.predicate = compile_predicate(filters) if filters else None
+        self.select = options.get('select')
+        self.count = options.get('count') is True
+        self.get = options.get('get') is True
+        self.offset = options.get('offset') or 0
+        self.limit = options.get('limit') or None
+        self.sort_key, self.reverse = compile_sort_key(options.get('order_by'))
+
+    def __call__(self, _list):
+        rv = _list if self.predicate is None else filter(self.predicate, _list)
+
+        if self.count:
+            return len(rv) if isinstance(rv, (list, tuple)) else sum(1 for i in rv)
+
+        if self.sort_key is not None:
+            rv = sorted(rv, key=self.sort_key, reverse=self.reverse)
+
+        if self.get:
+            # Without ordering we stop at the first match
+            for i in rv:
+                return self.project(i)
+            raise MatchNotFound()
+
+        if self.offset or self.limit:
+            stop = self.offset + self.limit if self.limit else None
+            if isinstance(rv, list):
+                rv = rv[self.offset:stop]
+            else:
+                rv = list(itertools.islice(rv, self.offset, stop))
+        elif self.predicate is not None and not isinstance(rv, list):
+            rv = list(rv)
+
+        if self.select:
+            rv = [self.project(i) for i in rv]
+
+        return rv
+
+    def project(self, i):
+        if not self.select:
+            return i
+
+        return {s: i[s] for s in self.select if s in i}
+
+
+def compile_getter(name):
+    if '.' not in name and '\\' not in name:
+        def getter(i):
+            if isinstance(i, dict):
+                return i.get(name)
+            return getattr(i, name)
+    else:
+        parts = split_path(name)
+
+        def getter(i):
+            if isinstance(i, dict):
+                return get_parts(i, parts)
+            return getattr(i, name)
+
+    return getter
+
+
+def compile_filter(f):
+    if len(f) == 2:
+        op, value = f
+        if op != 'OR':
+            raise ValueError(f'Invalid operation: {op}')
+
+        predicates = [compile_filter(f) for f in value]
+
+        def predicate(i):
+            for p in predicates:
+                if p(i):
+                    return True
+            return False
+
+        return predicate
+
+    if len(f) != 3:
+        raise ValueError(f'Invalid filter {f}')
+
+    name, op, value = f
+    if op not in OPERATORS:
+        raise ValueError(f'Invalid operation: {op}')
+    if op == '~':
+        value = re.compile(value)
+
+    getter = compile_getter(name)
+    opfunc = OPERATORS[op]
+    return lambda i: opfunc(getter(i), value)
+
+
+def compile_predicate(filters):
+    predicates = [compile_filter(f) for f in filters]
+    if len(predicates) == 1:
+        return predicates[0]
+
+    def predicate(i):
+        for p in predicates:
+            if not p(i):
+                return False
+        return True
+
+    return predicate
+
+
+def compile_sort_key(order_by):
+    """
+    Compiles `order_by` into a single composite sort key and global `reverse` flag. The last item is the primary one
+    (the result is the same as sorting the list by each item in turn). `nulls_first:` and `nulls_last:` prefixes are
+    supported the same way as in `datastore.query`.
+    """
+    if not order_by:
+        return None, False
+
+    keys = []
+    for o in reversed(order_by):
+        nulls = None
+        for prefix in ('nulls_first:', 'nulls_last:'):
+            if o.startswith(prefix):
+                nulls = prefix
+                o = o[len(prefix):]
+        reverse = o.startswith('-')
+        if reverse:
+            o = o[1:]
+        keys.append((o, reverse, nulls))
+
+    reverse = keys[0][1]
+    mixed = any(k[1] != reverse for k in keys)
+    if not mixed and all(k[2] is None for k in keys):
+        return operator.itemgetter(*[k[0] for k in keys]), reverse
+
+    parts = []
+    for name, key_reverse, nulls in keys:
+        if nulls is None:
+            part = operator.itemgetter(name)
+        else:
+            # Whether `None` must precede other values before the descending keys are reversed
+            none_first = (nulls == 'nulls_first:') != key_reverse
+
+            def part(i, name=name, none_first=none_first):
+                value = i[name]
+                return ((value is not None) if none_first else (value is None)), value
+
+        if mixed and key_reverse:
+            part = reversed_key(part)
+
+        parts.append(part)
+
+    return (lambda i: tuple(part(i) for part in parts)), reverse and not mixed
+
+
+def freeze(value):
+    """
+    Builds a hashable representation of a filters/options structure that can be converted back using `thaw`.
+    Raises `TypeError` for values that can not be hashed.
+    """
+    if type(value) in (list, tuple):
+        return type(value), tuple(freeze(v) for v in value)
+    if type(value) is dict:
+        return dict, tuple((k, freeze(v)) for k, v in value.items())
+    hash(value)
+    # Type is a part of the key so that i.e. `True` and `1` are not considered the same
+    return type(value), value
+
+
+def thaw(value):
+    kind, value = value
+    if kind is dict:
+        return {k: thaw(v) for k, v in value}
+    if kind in (list, tuple):
+        return kind(thaw(v) for v in value)
+    return value
+
+
+@functools.lru_cache(maxsize=512)
+def compile_frozen_filters(frozen):
+    return CompiledFilters(*thaw(frozen))
+
+
+def compile_filters(filters=None, options=None):
+    """
+    Compiles `filters`/`options` into a `CompiledFilters` object. Compiled objects are cached by their structure so
+    repeated queries with the same filters do not have to be compiled again.
+    """
+    filters = filters or []
+    options = {k: options[k] for k in OPTIONS if k in options} if options else {}
+
+    try:
+        frozen = freeze((filters, options))
+    except TypeError:
+        return CompiledFilters(filters, options)
+
+    return compile_frozen_filters(frozen)
+
+
+def filter_list(_list, filters=None, options=None):
+    return compile_filters(filters, options)(_list)
@@ -1,30 +1,221 @@
+from collections import deque
+import concurrent.futures
+import contextvars
+import itertools
+import logging
 from os import cpu_count
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 
 from middlewared.utils.osc import set_thread_name
 
+logger = logging.getLogger(__name__)
 
-class IoThreadPoolExecutor(ThreadPoolExecutor):
+# Set in the pool threads to the future of the call that is being run. Coroutines scheduled from a pool thread (i.e.
+# by `call_sync`) inherit it (`asyncio` runs them in a copy of the submitting thread context) so everything they (and
+# the tasks they create) submit to the pool goes to the priority lane while that call is still waiting for them.
+priority_context = contextvars.ContextVar('io_thread_priority', default=None)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._initializer = set_thread_name('IoThread')
 
-        # we set these to 21 or 33 respectively so that we
-        # always have a 1 idle thread buffer when we check
-        # the semaphore which should help prevent a non-fatal
-        # race condition with the caller of this method
-        # minimally we have 21 - 1 thread available
-        # on large cpu count systems we set it to 33 - 1 (to match upstream)
-        self._max_workers = 21 if ((cpu_count() or 1) + 4) < 32 else 33
+def is_priority():
+    future = priority_context.get()
+    return future is not None and not future.done()
 
-    @property
-    def no_idle_threads(self):
-        # note, this is "technically" an implementation
-        # detail of the threading.Semaphore class so upstream
-        # can change this variable at any time so I'm noting
-        # it here so my future self doesn't pull their hair
-        # out when this occurs :)
 
-        # give ourselvs a single idle thread buffer
-        return self._idle_semaphore._value - 1 <= 1
+class Worker:
+    def __init__(self):
+        self.thread = None
+        self.busy = False
+
+    def __repr__(self):
+        return f'<Worker {self.thread.name} {"busy" if self.busy else "idle"}>'
+
+
+class IoThreadPoolExecutor(concurrent.futures.Executor):
+    """
+    Elastic thread pool for blocking calls.
+
+    The pool keeps `core_workers` threads and starts new ones (up to `max_workers`) when there are more queued calls
+    than idle threads. Threads above `core_workers` exit after being idle for `idle_timeout` seconds.
+
+    Calls submitted from the pool threads (directly or by the coroutines they wait for with `call_sync`) go to the
+    priority lane: they are run first and may start up to `max_overflow_workers` threads above `max_workers` because
+    the thread that waits for them can't be released until they finish. Otherwise a chain of `call_sync` calls would
+    deadlock a saturated pool. Past that limit priority lane calls that no idle thread can pick up are run in
+    temporary threads (that exit when the call finishes) because every pool thread might be waiting for them.
+    Background tasks that outlive the call that created them lose their priority.
+    """
+
+    def __init__(self, thread_name_prefix='IoThread', core_workers=5, max_workers=None, idle_timeout=60,
+                 max_overflow_workers=None):
+        if max_workers is None:
+            # upstream `ThreadPoolExecutor` default for small systems, capped on large cpu count systems
+            max_workers = 20 if ((cpu_count() or 1) + 4) < 32 else 32
+
+        self.thread_name_prefix = thread_name_prefix
+        self.core_workers = core_workers
+        self.max_workers = max(core_workers, max_workers)
+        self.max_overflow_workers = self.max_workers if max_overflow_workers is None else max_overflow_workers
+        self.idle_timeout = idle_timeout
+
+        self.workers = []
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._queue = deque()
+        self._priority_queue = deque()
+        self._idle = 0
+        self._counter = itertools.count()
+        self._shutdown = False
+
+        # Number of started and idle-reaped threads
+        self.spawned = 0
+        self.reaped = 0
+        # Number of calls that were queued because the pool was at its thread limit and had no idle threads
+        self.saturated = 0
+        # Number of threads started above `max_workers` for the priority lane
+        self.overflow = 0
+        # Number of temporary threads started for priority lane calls above `max_workers + max_overflow_workers`
+        self.temporary = 0
+
+    def submit(self, fn, *args, **kwargs):
+        priority = is_priority()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+
+            future = concurrent.futures.Future()
+            if (
+                priority and len(self._priority_queue) >= self._idle and
+                len(self.workers) >= self.max_workers + self.max_overflow_workers
+            ):
+                self._start_temporary_thread(future, fn, args, kwargs)
+                return future
+
+            (self._priority_queue if priority else self._queue).append((future, fn, args, kwargs))
+
+            if len(self._priority_queue) + len(self._queue) > self._idle:
+                if len(self.workers) < self.max_workers:
+                    self._start_worker()
+                elif (
+                    priority and len(self._priority_queue) > self._idle and
+                    len(self.workers) < self.max_workers + self.max_overflow_workers
+                ):
+                    self.overflow += 1
+                    self._start_worker()
+                else:
+                    self.saturated += 1
+
+            self._cond.notify()
+            return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                for queue in (self._priority_queue, self._queue):
+                    while queue:
+                        queue.popleft()[0].cancel()
+
+            self._cond.notify_all()
+            threads = [worker.thread for worker in self.workers]
+
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': len(self.workers),
+                'idle': self._idle,
+                'queued': len(self._queue),
+                'priority_queued': len(self._priority_queue),
+                'spawned': self.spawned,
+                'reaped': self.reaped,
+                'saturated': self.saturated,
+                'overflow': self.overflow,
+                'temporary': self.temporary,
+            }
+
+    def _start_worker(self):
+        # Must be called with `self._lock` held
+        worker = Worker()
+        worker.thread = threading.Thread(
+            target=self._run_worker, args=(worker,), name=f'{self.thread_name_prefix}_{next(self._counter)}',
+            daemon=True,
+        )
+        self.workers.append(worker)
+        self.spawned += 1
+        worker.thread.start()
+
+    def _start_temporary_thread(self, future, fn, args, kwargs):
+        # Must be called with `self._lock` held
+        logger.warning('%s pool has no threads left for priority lane call %r, running it in a temporary thread',
+                       self.thread_name_prefix, fn)
+        self.temporary += 1
+        threading.Thread(
+            target=self._run_temporary, args=(future, fn, args, kwargs),
+            name=f'{self.thread_name_prefix}_temporary_{next(self._counter)}', daemon=True,
+        ).start()
+
+    def _run_temporary(self, future, fn, args, kwargs):
+        set_thread_name(self.thread_name_prefix)
+        self._run(future, fn, args, kwargs)
+
+    def _get(self, worker):
+        # Returns next queued call or `None` if the worker should exit
+        with self._lock:
+            self._idle += 1
+            try:
+                deadline = time.monotonic() + self.idle_timeout
+                while not (self._priority_queue or self._queue):
+                    if self._shutdown:
+                        break
+
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        if len(self.workers) > self.core_workers:
+                            self.reaped += 1
+                            break
+
+                        deadline = time.monotonic() + self.idle_timeout
+                        timeout = self.idle_timeout
+
+                    self._cond.wait(timeout)
+                else:
+                    return (self._priority_queue or self._queue).popleft()
+
+                self.workers.remove(worker)
+                return None
+            finally:
+                self._idle -= 1
+
+    def _run_worker(self, worker):
+        set_thread_name(self.thread_name_prefix)
+
+        while True:
+            item = self._get(worker)
+            if item is None:
+                return
+
+            worker.busy = True
+            try:
+                self._run(*item)
+            finally:
+                worker.busy = False
+                # Do not keep a reference to the call arguments while idle
+                item = None
+
+    def _run(self, future, fn, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+
+        priority_context.set(future)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            priority_context.set(None)
@@ -0,0 +1,26 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Module proxy that imports the module on first attribute access.
+
+    Used for heavy third-party libraries that are only needed by rarely called plugin methods so that they are not
+    imported during middlewared startup.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, item):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, item)
+
+    def __repr__(self):
+        return f'<LazyModule {self.__name!r}>'
+
+
+def lazy_import(name):
+    return LazyModule(name)
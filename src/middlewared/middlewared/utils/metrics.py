@@ -0,0 +1,103 @@
+from bisect import bisect_left
+
+# Histogram buckets upper bounds (in seconds): from 100us to ~105s, each bucket is sqrt(2) times wider than previous
+BUCKETS = tuple(0.0001 * 2 ** (i / 2) for i in range(41))
+
+
+class Histogram:
+    """
+    Fixed-size histogram of durations. Percentiles are estimated as the upper bound of the bucket they fall in so
+    they are at most sqrt(2) times higher than the real value (and never higher than the maximum observed value).
+    """
+
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                break
+
+        if i < len(BUCKETS):
+            return min(BUCKETS[i], self.max)
+
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'avg': self.sum / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+        }
+
+
+class MethodMetrics:
+    __slots__ = ('errors', 'latency')
+
+    def __init__(self):
+        self.errors = 0
+        self.latency = Histogram()
+
+
+class Metrics:
+    """
+    In-process telemetry: per-method call latencies and errors, executors queue wait times and event loop lag samples.
+
+    All the observations are made from the event loop thread so no locking is needed. Counters are cumulative since
+    middlewared start.
+    """
+
+    def __init__(self):
+        self.methods = {}
+        self.executors = {}
+        self.loop_lag = Histogram()
+
+    def observe_call(self, method, duration, error=False):
+        metrics = self.methods.get(method)
+        if metrics is None:
+            metrics = self.methods[method] = MethodMetrics()
+
+        metrics.latency.observe(duration)
+        if error:
+            metrics.errors += 1
+
+    def observe_executor_wait(self, executor, wait):
+        histogram = self.executors.get(executor)
+        if histogram is None:
+            histogram = self.executors[executor] = Histogram()
+
+        histogram.observe(wait)
+
+    def snapshot(self):
+        return {
+            'methods': {
+                method: {'errors': metrics.errors, **metrics.latency.snapshot()}
+                for method, metrics in self.methods.items()
+            },
+            'executors': {
+                executor: histogram.snapshot()
+                for executor, histogram in self.executors.items()
+            },
+            'loop_lag': self.loop_lag.snapshot(),
+        }
@@ -0,0 +1,279 @@
+import concurrent.futures
+from concurrent.futures.process import _ExceptionWithTraceback, BrokenProcessPool
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+from multiprocessing import reduction
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_loop(conn):
+    while True:
+        try:
+            item = conn.recv()
+        except EOFError:
+            return
+
+        if item is None:
+            return
+
+        fn, args, kwargs = item
+        try:
+            result = (True, fn(*args, **kwargs))
+        except BaseException as e:
+            result = (False, _ExceptionWithTraceback(e, e.__traceback__))
+
+        try:
+            conn.send(result)
+        except Exception as e:
+            # i.e. result can't be pickled
+            conn.send((False, _ExceptionWithTraceback(e, e.__traceback__)))
+
+
+def _zygote_main(conn, initializer, worker_initializer):
+    """
+    Runs `initializer` once and then forks a worker for every connection handle received from the pool.
+    """
+    # Workers are our children, let the kernel reap them
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    if initializer is not None:
+        initializer()
+
+    while True:
+        try:
+            fd = reduction.recv_handle(conn)
+        except EOFError:
+            return
+
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                conn.close()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                if worker_initializer is not None:
+                    worker_initializer()
+                _worker_loop(Connection(fd))
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+
+        os.close(fd)
+        conn.send(pid)
+
+
+class ProcessPoolFuture(concurrent.futures.Future):
+    def __init__(self):
+        super().__init__()
+        self.queued_at = time.monotonic()
+        # How long the call waited for a free worker
+        self.wait_time = None
+
+
+class ProcessPool(concurrent.futures.Executor):
+    """
+    Elastic process pool that forks its workers from a single "zygote" process.
+
+    The zygote is spawned once and runs `initializer` (i.e. imports the plugins tree) so that new workers are forked
+    from an already initialized process and only need to run (fast) `worker_initializer`. The pool keeps at least
+    `min_workers` workers. New workers (up to `max_workers`) are started when there are more queued calls than idle
+    workers and workers above `min_workers` exit after being idle for `idle_timeout` seconds.
+
+    A worker that dies fails its current call with `BrokenProcessPool` and is replaced without affecting other workers.
+    """
+
+    def __init__(self, min_workers, max_workers, initializer=None, worker_initializer=None, idle_timeout=60):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.worker_initializer = worker_initializer
+        self.idle_timeout = idle_timeout
+
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._zygote_lock = threading.Lock()
+        self._zygote = None
+        self._queue = queue.Queue()
+        self._workers = {}
+        self._starting = 0
+        self._idle = 0
+        self._shutdown = False
+
+        self.spawned = 0
+        self.replaced = 0
+
+    def start(self):
+        with self._lock:
+            for i in range(self.min_workers - len(self._workers) - self._starting):
+                self._start_worker()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+
+            future = ProcessPoolFuture()
+            self._queue.put((future, fn, args, kwargs))
+            if (
+                self._queue.qsize() > self._idle + self._starting and
+                len(self._workers) + self._starting < self.max_workers
+            ):
+                self._start_worker()
+
+            return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            for i in range(len(self._workers) + self._starting):
+                self._queue.put(None)
+
+        with self._zygote_lock:
+            if self._zygote is not None:
+                self._zygote[1].close()
+                if wait:
+                    self._zygote[0].join()
+                self._zygote = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': len(self._workers),
+                'starting': self._starting,
+                'idle': self._idle,
+                'queued': self._queue.qsize(),
+                'spawned': self.spawned,
+                'replaced': self.replaced,
+            }
+
+    def _start_worker(self):
+        # Must be called with `self._lock` held
+        self._starting += 1
+        threading.Thread(target=self._run_worker, name='process_pool', daemon=True).start()
+
+    def _fork(self):
+        conn, worker_conn = multiprocessing.Pipe()
+        try:
+            with self._zygote_lock:
+                for i in range(2):
+                    if self._zygote is None or not self._zygote[0].is_alive():
+                        self._start_zygote()
+
+                    process, zygote_conn = self._zygote
+                    try:
+                        reduction.send_handle(zygote_conn, worker_conn.fileno(), process.pid)
+                        return zygote_conn.recv(), conn
+                    except (EOFError, OSError):
+                        if i == 1:
+                            raise
+
+                        logger.warning('Process pool zygote has died, restarting it')
+                        self._zygote = None
+        except Exception:
+            conn.close()
+            raise
+        finally:
+            worker_conn.close()
+
+    def _start_zygote(self):
+        # Must be called with `self._zygote_lock` held
+        zygote_conn, conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_zygote_main, args=(conn, self.initializer, self.worker_initializer), daemon=True,
+        )
+        process.start()
+        conn.close()
+        self._zygote = (process, zygote_conn)
+
+    def _run_worker(self):
+        try:
+            pid, conn = self._fork()
+        except Exception:
+            logger.error('Failed to start process pool worker', exc_info=True)
+            with self._lock:
+                self._starting -= 1
+                if not self._workers and not self._starting:
+                    # Nobody is going to run queued calls
+                    while True:
+                        try:
+                            item = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is not None and item[0].set_running_or_notify_cancel():
+                            item[0].set_exception(BrokenProcessPool('Failed to start process pool worker'))
+            return
+
+        with self._lock:
+            self._starting -= 1
+            self._workers[pid] = conn
+            self.spawned += 1
+
+        broken = False
+        try:
+            while True:
+                with self._lock:
+                    self._idle += 1
+                try:
+                    item = self._queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._idle -= 1
+                        if len(self._workers) > self.min_workers:
+                            del self._workers[pid]
+                            break
+                    continue
+
+                with self._lock:
+                    self._idle -= 1
+
+                if item is None:
+                    break
+
+                future, fn, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                future.wait_time = time.monotonic() - future.queued_at
+
+                try:
+                    conn.send((fn, args, kwargs))
+                    ok, result = conn.recv()
+                except (EOFError, OSError):
+                    future.set_exception(BrokenProcessPool(f'Process pool worker {pid} terminated abruptly'))
+                    broken = True
+                    break
+                except Exception as e:
+                    # i.e. arguments can't be pickled
+                    future.set_exception(e)
+                    continue
+
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+        finally:
+            try:
+                conn.send(None)
+            except Exception:
+                pass
+            conn.close()
+
+            with self._lock:
+                self._workers.pop(pid, None)
+                if broken:
+                    self.replaced += 1
+                    if not self._shutdown and (
+                        len(self._workers) + self._starting < self.min_workers or
+                        self._queue.qsize() > self._idle + self._starting
+                    ):
+                        self._start_worker()
@@ -1,8 +1,13 @@
 import asyncio
+import collections
 import cProfile
 import io
+import os
 import pstats
 from pstats import SortKey
+import sys
+import threading
+import time
 
 
 def profile_wrap(func):
@@ -25,3 +30,121 @@ def profile_wrap(func):
             pstats.Stats(pr, stream=s).sort_stats(SortKey.CUMULATIVE).print_stats()
             return s.getvalue() + '\n' + str(rv)
     return wrapper
+
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler: every `interval` seconds it takes the stacks of all the other threads of the
+    current process (`sys._current_frames()`) and counts identical stacks. Unlike `profile_wrap` it does not slow down
+    the code being profiled so it can be attached to a production daemon under real load.
+    """
+
+    def __init__(self, interval=0.01, label=None):
+        self.interval = interval
+        self.label = label
+        self.samples = collections.Counter()
+        self.count = 0
+        self._frames_names = {}
+
+    def run(self, duration=None, stop=None):
+        """
+        Sample for `duration` seconds or until `stop` (`threading.Event`) is set.
+        """
+        own = threading.get_ident()
+        deadline = None if duration is None else time.monotonic() + duration
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.sample(own)
+            timeout = self.interval
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+            stop.wait(timeout)
+
+    def sample(self, own=None):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame.f_code))
+                frame = frame.f_back
+
+            thread = names.get(ident, str(ident))
+            if self.label is not None:
+                thread = f'{self.label} {thread}'
+            stack.append(thread)
+            self.samples[tuple(reversed(stack))] += 1
+
+        self.count += 1
+
+    def output(self, format):
+        if format == 'SPEEDSCOPE':
+            return format_speedscope(self.samples, self.interval)
+
+        return format_collapsed(self.samples)
+
+    def _frame_name(self, code):
+        name = self._frames_names.get(code)
+        if name is None:
+            name = self._frames_names[code] = f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+        return name
+
+
+def format_collapsed(samples):
+    """
+    Format as "collapsed stacks" (`thread;outermost;...;innermost count` lines) as consumed by flamegraph.pl,
+    speedscope and most other flame graph tools.
+    """
+    return ''.join(f'{";".join(stack)} {count}\n' for stack, count in sorted(samples.items()))
+
+
+def format_speedscope(samples, interval, name='middlewared'):
+    """
+    Format as https://www.speedscope.app/ sampled profile (one profile per thread).
+    """
+    frames = {}
+    profiles = {}
+    for stack, count in sorted(samples.items()):
+        thread, stack = stack[0], stack[1:]
+        profile = profiles.setdefault(thread, {
+            'type': 'sampled',
+            'name': thread,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': 0,
+            'samples': [],
+            'weights': [],
+        })
+        profile['samples'].append([frames.setdefault(frame, len(frames)) for frame in stack])
+        profile['weights'].append(count * interval)
+        profile['endValue'] += count * interval
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'middlewared',
+        'shared': {'frames': [{'name': frame} for frame in frames]},
+        'profiles': list(profiles.values()),
+    }
+
+
+def worker_profiled_call(interval, fn, args, kwargs):
+    """
+    Runs `fn` in a process pool worker while sampling the worker. Returns `fn` result and the samples so the parent
+    process can merge them into its own profile.
+    """
+    profiler = SamplingProfiler(interval, f'worker {os.getpid()}')
+    stop = threading.Event()
+    thread = threading.Thread(target=profiler.run, kwargs={'stop': stop}, name='profiler', daemon=True)
+    thread.start()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        stop.set()
+        thread.join()
+
+    return result, profiler.samples
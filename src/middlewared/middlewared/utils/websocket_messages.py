@@ -0,0 +1,67 @@
+from collections import deque
+
+from middlewared.client import ejson as json
+
+
+class WebsocketMessagesRing:
+    """
+    Keeps the last websocket messages for `core.get_websocket_messages`.
+
+    Disabled by default so that calls do not pay for it. When enabled, outgoing messages are stored in their already
+    serialized form and are only decoded when the ring is read. Incoming method calls have their private arguments
+    redacted (using `dump_args(params, method_name=...)`) before they are stored.
+    """
+
+    def __init__(self, dump_args, maxlen=1000, max_message_size=65536):
+        self.dump_args = dump_args
+        self.enabled = False
+        self.max_message_size = max_message_size
+        self.messages = deque(maxlen=maxlen)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self.messages.clear()
+
+    def append(self, type, session_id, serialized):
+        if len(serialized) > self.max_message_size:
+            # Only the size of a large message is kept
+            self.messages.append((type, session_id, len(serialized)))
+        elif type == 'incoming':
+            # Decoded again so that the stored message does not share anything with the one being handled
+            self.messages.append((type, session_id, self._redact(json.loads(serialized))))
+        else:
+            self.messages.append((type, session_id, serialized))
+
+    def entries(self):
+        result = []
+        for type, session_id, stored in list(self.messages):
+            if isinstance(stored, int):
+                message = {'truncated': True, 'size': stored}
+            elif isinstance(stored, str):
+                message = json.loads(stored)
+            else:
+                message = stored
+
+            result.append({
+                'type': type,
+                'session_id': session_id,
+                'message': message,
+            })
+
+        return result
+
+    def _redact(self, message):
+        if isinstance(message, dict):
+            if message.get('msg') == 'method':
+                return self._redact_call(message)
+            elif message.get('msg') == 'batch' and isinstance(message.get('calls'), list):
+                return dict(message, calls=[self._redact_call(call) for call in message['calls']])
+
+        return message
+
+    def _redact_call(self, call):
+        if isinstance(call, dict) and call.get('method') and isinstance(call.get('params'), list):
+            return dict(call, params=self.dump_args(call['params'], method_name=call['method']))
+
+        return call
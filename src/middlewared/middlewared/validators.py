@@ -211,7 +211,7 @@ def validate_schema(schema, data, additional_attrs=False, dict_kwargs=None):
     schema = Dict("attributes", *schema, additional_attrs=additional_attrs, **dict_kwargs)
 
     try:
-        schema.clean(data)
+        data.update(schema.clean(data))
     except Error as e:
         verrors.add(e.attribute, e.errmsg, e.errno)
     except ValidationErrors as e:
@@ -5,6 +5,7 @@ import asyncio
 import inspect
 import os
 import setproctitle
+import threading
 
 from . import logger
 from .common.environ import environ_update
@@ -13,6 +14,54 @@ import middlewared.utils.osc as osc
 from .utils.service.call import MethodNotFoundError, ServiceCallMixin
 
 MIDDLEWARE = None
+INTERNAL_SOCKET = 'ws+unix:///var/run/middlewared-internal.sock'
+
+
+class WorkerClient(object):
+    """
+    Long-lived connection from a process pool worker back to middlewared.
+
+    All method calls, job progress updates and events sent from the worker share the same websocket connection
+    (the protocol multiplexes calls by their id). Connection is (re-)established lazily on the first call after it
+    was closed and existing event subscriptions are restored.
+    """
+
+    def __init__(self, uri=INTERNAL_SOCKET):
+        self.uri = uri
+        self.client = None
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self.connections = 0
+        self.calls = 0
+
+    def _get_client(self):
+        with self._lock:
+            if self.client is None or self.client._closed.is_set():
+                self.client = Client(self.uri, py_exceptions=True)
+                self.connections += 1
+                for name, callback in self._subscriptions.items():
+                    self.client.subscribe(name, callback)
+
+            return self.client
+
+    def call(self, method, *params, **kwargs):
+        client = self._get_client()
+        with self._lock:
+            self.calls += 1
+        return client.call(method, *params, **kwargs)
+
+    def subscribe(self, name, callback):
+        client = self._get_client()
+        with self._lock:
+            self._subscriptions[name] = callback
+        client.subscribe(name, callback)
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'connections': self.connections,
+            'calls': self.calls,
+        }
 
 
 class FakeMiddleware(LoadPluginsMixin, ServiceCallMixin):
@@ -22,23 +71,18 @@ class FakeMiddleware(LoadPluginsMixin, ServiceCallMixin):
 
     def __init__(self, overlay_dirs):
         super().__init__(overlay_dirs)
-        self.client = None
+        self.client = WorkerClient()
         _logger = logger.Logger('worker')
         self.logger = _logger.getLogger()
         _logger.configure_logging('console')
         self.loop = asyncio.get_event_loop()
 
     def _call(self, name, serviceobj, methodobj, params=None, app=None, pipes=None, io_thread=False, job=None):
-        try:
-            with Client('ws+unix:///var/run/middlewared-internal.sock', py_exceptions=True) as c:
-                self.client = c
-                job_options = getattr(methodobj, '_job', None)
-                if job and job_options:
-                    params = list(params) if params else []
-                    params.insert(0, FakeJob(job['id'], self.client))
-                return methodobj(*params)
-        finally:
-            self.client = None
+        job_options = getattr(methodobj, '_job', None)
+        if job and job_options:
+            params = list(params) if params else []
+            params.insert(0, FakeJob(job['id'], self.client))
+        return methodobj(*(params or []))
 
     def _run(self, name, args, job):
         serviceobj, methodobj = self._method_lookup(name)
@@ -84,8 +128,7 @@ class FakeMiddleware(LoadPluginsMixin, ServiceCallMixin):
         return []
 
     def send_event(self, name, event_type, **kwargs):
-        with Client(py_exceptions=True) as c:
-            return c.call('core.event_send', name, event_type, kwargs)
+        return self.client.call('core.event_send', name, event_type, kwargs)
 
 
 class FakeJob(object):
@@ -130,19 +173,34 @@ def reconfigure_logging(mtype, **message):
 
 
 def receive_events():
-    c = Client('ws+unix:///var/run/middlewared-internal.sock', py_exceptions=True)
+    c = MIDDLEWARE.client
     c.subscribe('core.environ', lambda *args, **kwargs: environ_update(kwargs['fields']))
     c.subscribe('core.reconfigure_logging', reconfigure_logging)
 
     environ_update(c.call('core.environ'))
 
 
-def worker_init(overlay_dirs, debug_level, log_handler):
+def client_stats():
+    return MIDDLEWARE.client.stats()
+
+
+def worker_preload(overlay_dirs):
+    """
+    Runs once in the process pool zygote so that workers are forked with plugins already loaded.
+    """
     global MIDDLEWARE
     MIDDLEWARE = FakeMiddleware(overlay_dirs)
     os.environ['MIDDLEWARED_LOADING'] = 'True'
     MIDDLEWARE._load_plugins()
     os.environ['MIDDLEWARED_LOADING'] = 'False'
+    setproctitle.setproctitle('middlewared (zygote)')
+    osc.die_with_parent()
+
+
+def worker_init(debug_level, log_handler):
+    """
+    Runs in every worker forked from the zygote.
+    """
     setproctitle.setproctitle('middlewared (worker)')
     osc.die_with_parent()
     logger.setup_logging('worker', debug_level, log_handler)
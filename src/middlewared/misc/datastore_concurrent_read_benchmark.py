@@ -0,0 +1,70 @@
+"""
+Measures concurrent `datastore.fetchall` throughput against a WAL database as the number of read threads grows.
+`--threads 0` disables WAL reads (all queries are serialized on the writer connection like before).
+"""
+
+import argparse
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import time
+
+import middlewared.plugins.datastore.connection as connection
+from middlewared.plugins.datastore.connection import DatastoreService
+
+
+class Middleware:
+    async def run_in_executor(self, pool, method, *args):
+        return await asyncio.get_event_loop().run_in_executor(pool, method, *args)
+
+    def call_hook_inline(self, *args):
+        pass
+
+
+async def run(service, clients, queries, query):
+    async def client():
+        for i in range(queries):
+            await service.fetchall(query)
+
+    start = time.monotonic()
+    await asyncio.gather(*[client() for i in range(clients)])
+    return time.monotonic() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, action='append', help='Read threads count (can be repeated)')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--query', default='SELECT count(*), sum(value) FROM bench WHERE name LIKE \'%9%\'')
+    args = parser.parse_args()
+
+    # Thread-local read connections are garbage collected from the main thread on exit
+    logging.getLogger('sqlalchemy.pool').setLevel(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.FREENAS_DATABASE = os.path.join(tmp, 'freenas-v1.db')
+
+        service = DatastoreService(Middleware())
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(service.setup())
+        # Writer connection can only be used from its own thread
+        loop.run_until_complete(service.execute(
+            'CREATE TABLE bench (id INTEGER PRIMARY KEY, name TEXT, value INTEGER)'
+        ))
+        loop.run_until_complete(service.execute('INSERT INTO bench (name, value) VALUES ' + ', '.join(
+            f"('row{i}', {i})" for i in range(args.rows)
+        )))
+        assert service.wal
+
+        total = args.clients * args.queries
+        for threads in args.threads or [0, 1, 2, 4, 8]:
+            service.wal = threads > 0
+            if threads:
+                service.read_thread_pool = ThreadPoolExecutor(threads)
+
+            elapsed = loop.run_until_complete(run(service, args.clients, args.queries, args.query))
+            print(f'{threads:>2} read threads: {total / elapsed:9.1f} queries/s ({elapsed * 1000:9.2f} ms total)')
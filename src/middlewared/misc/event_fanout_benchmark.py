@@ -0,0 +1,83 @@
+"""
+Measures events per second `Middleware.send_event` can deliver as the number of connected websocket clients grows.
+Every client is subscribed to a few events that are not being sent and half of them are subscribed to the one that
+is. Pass `--legacy` to also measure the previous implementation (every client checks its own subscriptions and
+serializes its own copy of the event).
+"""
+
+import argparse
+import time
+
+from middlewared.client import ejson as json
+from middlewared.event import event_message, EventSubscriptions
+
+EVENT = 'core.get_jobs'
+OTHER_EVENTS = ['pool.query', 'disk.query', 'alert.list', 'reporting.realtime']
+FIELDS = {
+    'id': 1000,
+    'method': 'pool.dataset.query',
+    'arguments': [[['id', '=', 'tank/dataset']], {'extra': {'flat': False}}],
+    'progress': {'percent': 50, 'description': 'Working', 'extra': None},
+    'state': 'RUNNING',
+}
+
+
+class Client:
+    def __init__(self, session_id, subscribed):
+        self.session_id = session_id
+        self.subscribed = subscribed
+        self.sent = 0
+
+    # Previous `Application.send_event`
+    def send_event(self, name, event_type, **kwargs):
+        if not any(i == name or i == '*' for i in self.subscribed):
+            return
+
+        self._send_serialized(None, json.dumps(event_message(name, event_type, **kwargs)))
+
+    def _send_serialized(self, data, serialized):
+        self.sent += len(serialized)
+
+
+def legacy_send_event(clients, subscriptions, name, event_type, **kwargs):
+    for client in clients:
+        client.send_event(name, event_type, **kwargs)
+
+
+def send_event(clients, subscriptions, name, event_type, **kwargs):
+    wsclients = subscriptions.subscribers(name)
+    if wsclients:
+        event = event_message(name, event_type, **kwargs)
+        serialized = json.dumps(event)
+        for wsclient in wsclients:
+            wsclient._send_serialized(event, serialized)
+
+
+def measure(f, clients, subscriptions, count):
+    start = time.monotonic()
+    for i in range(count):
+        f(clients, subscriptions, EVENT, 'CHANGED', id=FIELDS['id'], fields=FIELDS)
+    return count / (time.monotonic() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, action='append', help='Clients count (can be repeated)')
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--legacy', action='store_true', help='Also measure legacy implementation')
+    args = parser.parse_args()
+
+    for count in args.clients or [1, 10, 50, 200]:
+        clients = []
+        subscriptions = EventSubscriptions()
+        for i in range(count):
+            subscribed = OTHER_EVENTS + ([EVENT] if i % 2 == 0 else [])
+            client = Client(str(i), subscribed)
+            for name in subscribed:
+                subscriptions.add(name, client)
+            clients.append(client)
+
+        result = f'{count:>4} clients: {measure(send_event, clients, subscriptions, args.events):10.1f} events/s'
+        if args.legacy:
+            result += f', legacy {measure(legacy_send_event, clients, subscriptions, args.events):10.1f} events/s'
+        print(result)
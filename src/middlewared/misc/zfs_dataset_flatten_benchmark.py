@@ -0,0 +1,78 @@
+"""
+Measures `zfs.dataset.query` flat mode cost (flattening + filtering + process pool pickling) against synthetic dataset
+hierarchies of increasing size.
+Pass `--legacy` to also time the previous `sum` + `deepcopy` implementation (very slow for large counts).
+"""
+
+import argparse
+from copy import deepcopy
+import pickle
+import time
+
+from middlewared.plugins.zfs_.utils import flatten_datasets
+from middlewared.utils import filter_list
+
+
+def make_dataset(name, children):
+    return {
+        'id': name,
+        'name': name,
+        'pool': name.split('/')[0],
+        'type': 'FILESYSTEM',
+        'properties': {
+            prop: {'value': 'off', 'rawvalue': 'off', 'parsed': False, 'source': 'DEFAULT'}
+            for prop in ('encryption', 'keystatus', 'mountpoint', 'compression', 'readonly', 'quota')
+        },
+        'children': children,
+    }
+
+
+def make_pool(count, fanout=10):
+    """
+    Generates a `count`-datasets hierarchy in which every dataset has up to `fanout` children.
+    """
+    root = make_dataset('tank', [])
+    queue = [root]
+    created = 1
+    while created < count:
+        parent = queue.pop(0)
+        for i in range(min(fanout, count - created)):
+            child = make_dataset(f'{parent["name"]}/ds{i}', [])
+            parent['children'].append(child)
+            queue.append(child)
+            created += 1
+    return [root]
+
+
+def legacy_flatten_datasets(datasets):
+    return sum([[deepcopy(ds)] + legacy_flatten_datasets(ds['children']) for ds in datasets], [])
+
+
+def measure(f, *args):
+    start = time.monotonic()
+    result = f(*args)
+    return time.monotonic() - start, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, action='append', help='Datasets count (can be repeated)')
+    parser.add_argument('--legacy', action='store_true', help='Also measure legacy implementation')
+    args = parser.parse_args()
+
+    filters = [['properties.encryption.value', '=', 'off']]
+    for count in args.count or [1000, 10000, 50000]:
+        datasets = make_pool(count)
+
+        flatten_time, flat = measure(lambda: list(flatten_datasets(datasets)))
+        filter_time, filtered = measure(filter_list, flat, filters)
+        pickle_time, _ = measure(lambda: pickle.loads(pickle.dumps(flat)))
+        assert len(flat) == len(filtered) == count
+
+        print(f'{count:>6} datasets: flatten {flatten_time * 1000:9.2f} ms, filter {filter_time * 1000:9.2f} ms, '
+              f'pickle {pickle_time * 1000:9.2f} ms')
+
+        if args.legacy:
+            legacy_time, legacy_flat = measure(legacy_flatten_datasets, datasets)
+            assert [ds['name'] for ds in legacy_flat] == [ds['name'] for ds in flat]
+            print(f'{count:>6} datasets: legacy flatten {legacy_time * 1000:9.2f} ms')